@@ -0,0 +1,76 @@
+# app/aio.py
+# asyncio 并发工具：连接池 session + 在途请求上限 + 地址级 fan-out
+import asyncio, os, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_INFLIGHT = int(os.environ.get("RPC_MAX_INFLIGHT", "16") or 16)
+
+def make_session(pool: Optional[int] = None) -> requests.Session:
+    # keep-alive 复用 TCP/TLS 连接；pool = 每个 host 的连接上限
+    pool = max(1, pool or DEFAULT_INFLIGHT)
+    s = requests.Session()
+    ad = HTTPAdapter(pool_connections=pool, pool_maxsize=pool)
+    s.mount("http://", ad); s.mount("https://", ad)
+    return s
+
+def make_gate(max_inflight: Optional[int] = None) -> threading.BoundedSemaphore:
+    # 同步/协程两条路径共用的在途闸门
+    return threading.BoundedSemaphore(max(1, max_inflight or DEFAULT_INFLIGHT))
+
+class AsyncCallMixin:
+    """
+    把同步 RPC 客户端的 call 换成协程版：
+      - get_xxx 方法原样继承（内部 return self.call(...)，此时返回协程，可直接 await）
+      - 真正的 HTTP 仍由 self.sync.call 在线程池里发出，与同步门面共享 session 与在途闸门
+      - self.sync 供旧的同步 helper（replay_owner_windowed 等）在 worker 线程里直接使用
+    """
+    def _init_async(self, max_inflight: int):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_inflight), thread_name_prefix="rpc")
+
+    async def _run(self, fn: Callable, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, fn, *args)
+
+    async def call(self, method: str, params: list):
+        return await self._run(self.sync.call, method, params)
+
+    async def batch_call(self, method: str, params_list: list, max_batch: Optional[int] = None):
+        return await self._run(self.sync.batch_call, method, params_list, max_batch)
+
+def fan_out(fn: Callable[[Any], Any], items: List[Any], workers: int = 8,
+            on_done: Optional[Callable[[Any, Any, Optional[BaseException]], None]] = None) -> List[Any]:
+    """
+    地址级并发：事件循环里把 fn(item) 丢进线程池，最多 workers 个同时进行。
+    on_done(item, result, err) 在事件循环线程按完成顺序回调（日志/进度/落库都放这里，无需加锁）。
+    返回与 items 同序的结果（失败或未完成的为 None）；Ctrl-C 时返回已完成的部分。
+    """
+    out: List[Any] = [None] * len(items)
+    n = max(1, int(workers or 1))
+
+    async def _main():
+        loop = asyncio.get_running_loop()
+        sem = asyncio.Semaphore(n)
+        pool = ThreadPoolExecutor(max_workers=n, thread_name_prefix="fanout")
+
+        async def one(i, it):
+            async with sem:
+                try:
+                    res, err = await loop.run_in_executor(pool, fn, it), None
+                except Exception as e:
+                    res, err = None, e
+            out[i] = res
+            if on_done: on_done(it, res, err)
+
+        try:
+            await asyncio.gather(*(one(i, it) for i, it in enumerate(items)))
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        print("[aio] interrupted, returning finished results", flush=True)
+    return out
@@ -1,29 +1,32 @@
-import argparse, csv, os, time, sqlite3
+import argparse, csv, os, time
 from app.rpc import SolRpc
+from app.aio import DEFAULT_INFLIGHT
+from app.txcache import TxCache, fmt_stats
+from app.ratelimit import fmt_limits
+from app.rpcpool import fmt_pools
 from app.entry import import_token, scan_candidates_for_mint
 from app.filters import soft_filter, hard_verify
-from app.db import conn
+from app.db import conn, start_run, find_run, load_run_items, finish_run, explain_hot, load_token_t0, SCHEMA_VERSION
+from app.db import SQL_RESET_MINT, SQL_VIEW_RECENT, SQL_LIST_ADDRS, SQL_LISTS_CSV
+from app.db import save_scored, scored_runs, scored_top
 from app.t0 import estimate_t0
 from app.rounds import rounds_with_usd
+from app.roundsvec import rescore_cached
 from app.score import (
     fetch_white, fetch_watch,
     score_white_for_mint, score_watch_for_mint,
     filter_and_sort as score_filter_and_sort,
-    export_csv as score_export_csv, export_txt_addrs as score_export_txt
+    export_csv as score_export_csv, export_txt_addrs as score_export_txt,
+    CsvStream as ScoreCsvStream, PNL_SOURCE
 )
 from app.select import load_scored as select_load_scored, filter_and_sort as select_filter_and_sort
 from app.select import export_csv as select_export_csv, export_txt as select_export_txt
 
 def cmd_reset_mint(a):
     with conn() as c:
-        try:
-            c.execute("DELETE FROM lists WHERE token_address=?", (a.mint,))
-            c.execute("DELETE FROM candidates WHERE token_address=?", (a.mint,))
-        except sqlite3.OperationalError:
-            try: c.execute("DELETE FROM lists WHERE token_address=?", (a.mint,))
-            except: pass
+        n = c.execute(SQL_RESET_MINT, (a.mint,)).rowcount
         c.commit()
-    print(f"[OK] reset-mint done for {a.mint}")
+    print(f"[OK] reset-mint done for {a.mint} (candidates -{n})")
 
 def cmd_import(a):
     import_token("sol", a.mint, a.amm, a.base, a.quote, source="manual")
@@ -40,20 +43,24 @@ def cmd_soft(a):
     print(f"[SOFT] total: W={w} Wa={wa} B={b}", flush=True)
 
 def cmd_hard(a):
-    rpc = SolRpc()
-    w, wa, b = hard_verify(rpc, batch_limit=a.limit, verbose=a.verbose, sleep_ms=a.sleep_ms)
+    rpc = SolRpc(max_inflight=max(a.workers, DEFAULT_INFLIGHT))
+    w, wa, b = hard_verify(rpc, batch_limit=a.limit, verbose=a.verbose, workers=a.workers, resume=a.resume)
     print(f"[HARD] total: W={w} Wa={wa} B={b}", flush=True)
+    print(fmt_limits(), flush=True)
+    print(fmt_pools(), flush=True)
+
+def cmd_db_check(a):
+    # 打印热查询的执行计划；有全表扫描/排序临时表时退出码为 1
+    bad = 0
+    print(f"[DB] schema version={SCHEMA_VERSION}", flush=True)
+    for name, plan, ok in explain_hot():
+        bad += not ok
+        print(f"[DB] {'OK ' if ok else 'BAD'} {name}: " + " | ".join(plan), flush=True)
+    if bad: raise SystemExit(1)
 
 def cmd_view(a):
     with conn() as c:
-        cur = c.execute(
-            """SELECT datetime(first_seen,'localtime') AS seen, chain,
-                      substr(token_address,1,10)||'…' AS token, addr,
-                      COALESCE(status,'CANDIDATE') AS status, COALESCE(reason,'')
-               FROM view_addresses
-               ORDER BY status DESC, seen DESC
-               LIMIT ?;""", (a.limit,)
-        )
+        cur = c.execute(SQL_VIEW_RECENT, (a.limit,))
         rows = cur.fetchall()
     print("seen\t\tchain\ttoken\t\taddr\t\tstatus\treason", flush=True)
     for r in rows:
@@ -61,14 +68,14 @@ def cmd_view(a):
 
 def cmd_export_lists(a):
     with conn() as c:
-        cur = c.execute("SELECT addr FROM lists WHERE status=? ORDER BY updated_at DESC;", (a.kind,))
+        cur = c.execute(SQL_LIST_ADDRS, (a.kind, -1))
         addrs = [r[0] for r in cur.fetchall()]
         os.makedirs("data/exports", exist_ok=True)
         ts = time.strftime("%Y%m%d_%H%M%S")
         txt = f"data/exports/{a.kind}_{ts}.txt"
         with open(txt, "w") as f:
             for x in addrs: f.write(x + "\n")
-        cur = c.execute("SELECT addr,chain,status,reason,updated_at FROM lists ORDER BY status DESC,updated_at DESC;")
+        cur = c.execute(SQL_LISTS_CSV)
         csvp = f"data/exports/lists_{ts}.csv"
         with open(csvp, "w", newline="") as f:
             w = csv.writer(f); w.writerow(["addr", "chain", "status", "reason", "updated_at"]); w.writerows(cur.fetchall())
@@ -86,65 +93,135 @@ def cmd_rounds(a):
         sup = rpc.get_token_supply(a.mint); dec = int(sup.get("value", {}).get("decimals", 9))
     except: pass
     t0 = None
-    try: t0 = estimate_t0(rpc, a.mint, sample_holders=10)
-    except: pass
+    if a.offline:
+        t0 = (load_token_t0(a.mint) or (None,))[0]  # 只读缓存
+    else:
+        try: t0 = estimate_t0(rpc, a.mint, sample_holders=10)
+        except: pass
     with conn() as c:
         if a.addr: addr_list = [a.addr]
         else:
-            cur = c.execute("SELECT addr FROM lists WHERE status='WHITE' ORDER BY updated_at DESC LIMIT ?;", (a.limit,))
+            cur = c.execute(SQL_LIST_ADDRS, ("WHITE", a.limit))
             addr_list = [r[0] for r in cur.fetchall()]
     os.makedirs("data/exports", exist_ok=True)
     ts = time.strftime("%Y%m%d_%H%M%S")
     out = f"data/exports/rounds_{a.mint[:6]}_{ts}.csv"
     with open(out, "w", newline="") as f:
         w = csv.writer(f)
-        w.writerow(["addr","entry_ts","exit_ts","hold_s","bucket","buy_token","sell_token","pnl_token","pnl_usd"])
+        w.writerow(["addr","entry_ts","exit_ts","hold_s","bucket","buy_token","sell_token","pnl_token","px_entry","px_exit","pnl_usd","pnl_sol","pnl_usdc"])
         for addr in addr_list:
-            rs = rounds_with_usd(rpc, addr, a.mint, t0, a.price_url, a.price_key, decimals=dec)
+            rs = rounds_with_usd(rpc, addr, a.mint, t0, a.price_url, a.price_key, decimals=dec, sync=not a.offline)
             for r in rs:
                 w.writerow([addr, r.get("entry_ts"), r.get("exit_ts"), r.get("hold_s"),
                             r.get("bucket"), r.get("buy_token"), r.get("sell_token"),
-                            r.get("pnl_token"), r.get("pnl_usd")])
+                            r.get("pnl_token"), r.get("px_entry"), r.get("px_exit"), r.get("pnl_usd"),
+                            r.get("pnl_sol"), r.get("pnl_usdc")])
     print(f"[OK] rounds → {out}", flush=True)
+    print(fmt_stats(rpc.tx_cache), flush=True)
+    print(fmt_limits(), flush=True)
+    print(fmt_pools(), flush=True)
+
+def _score_run(a, stage, fetch):
+    """
+    score-white/score-watch 公共部分：新建或续跑 run，返回 (run_id, addrs)。
+    续跑时地址列表取自 run_items（与中断前完全一致），不重新查 lists。
+    """
+    if a.resume:
+        found = find_run(a.resume, stage=stage, mint=a.mint)
+        if not found:
+            raise SystemExit(f"[ERR] no resumable {stage} run: {a.resume}")
+        run_id = found[0]
+        addrs = [x[0] for x in load_run_items(run_id)]
+    else:
+        addrs = fetch(limit=a.limit)
+        run_id = start_run(stage, a.mint, addrs, params={"limit": a.limit, "price_url": a.price_url, "pnl": a.pnl})
+    print(f"[SCORE] run_id={run_id} (resume: --resume {run_id})", flush=True)
+    return run_id, addrs
+
+def cmd_rescore(a):
+    # 不重新同步交易：直接用 owner_deltas 缓存批量重算（向量化引擎），适合改了参数/价格后整批重打分
+    dec = a.decimals
+    if dec is None:
+        dec = 9
+        try:
+            sup = SolRpc().get_token_supply(a.mint); dec = int(sup.get("value", {}).get("decimals", 9))
+        except: pass
+    addrs = {"all": None, "white": fetch_white, "watch": fetch_watch}[a.source]
+    addrs = addrs() if addrs else None
+    t = time.time()
+    rows = rescore_cached(a.mint, addrs, price_url=a.price_url, price_key=a.price_key, decimals=dec,
+                          max_txs=a.max_txs, timeout_s=a.timeout_s, pnl=a.pnl)
+    print(f"[RESCORE] source={a.source} addrs={len(rows)} in {time.time()-t:.2f}s", flush=True)
+    rows = score_filter_and_sort(rows, min_rounds=a.min_rounds, pos_expect=a.pos_expect, sort_by="white")
+    print(f"[RESCORE] after filter: {len(rows)}", flush=True)
+    ts = time.strftime("%Y%m%d_%H%M%S"); os.makedirs("data/exports", exist_ok=True)
+    csvp = f"data/exports/rescore_{a.mint[:6]}_{ts}.csv"
+    score_export_csv(rows, csvp); print(f"[OK] CSV  -> {csvp}", flush=True)
+    if a.topk > 0:
+        txtp = f"data/exports/rescore_top_{a.mint[:6]}_{ts}.txt"
+        score_export_txt(rows, txtp, a.topk); print(f"[OK] TOPK -> {txtp}", flush=True)
 
 def cmd_score_white(a):
-    rpc = SolRpc()
+    rpc = SolRpc(max_inflight=max(a.workers, DEFAULT_INFLIGHT))
     dec = 9
     try:
         sup = rpc.get_token_supply(a.mint); dec = int(sup.get("value", {}).get("decimals", 9))
     except: pass
-    addrs = fetch_white(limit=a.limit)
+    run_id, addrs = _score_run(a, "score-white", fetch_white)
     print(f"[SCORE] white addrs loaded: {len(addrs)}", flush=True)
-    rows = score_white_for_mint(rpc, a.mint, addrs, price_url=a.price_url, price_key=a.price_key, t0=None, decimals=dec, sleep_ms=a.sleep_ms)
-    print(f"[SCORE] scored rows: {len(rows)}", flush=True)
+    ts = time.strftime("%Y%m%d_%H%M%S"); os.makedirs("data/exports", exist_ok=True)
+    raw = ScoreCsvStream(f"data/exports/white_raw_{a.mint[:6]}_{ts}.csv")
+    try:
+        rows = score_white_for_mint(rpc, a.mint, addrs, price_url=a.price_url, price_key=a.price_key, t0=None, decimals=dec,
+                                    workers=a.workers, run_id=run_id, sink=raw, sync=not a.offline, pnl=a.pnl)
+    finally:
+        raw.close()
+    left = finish_run(run_id)
+    print(f"[SCORE] scored rows: {len(rows)} (raw -> {raw.path}; unfinished={left})", flush=True)
     rows = score_filter_and_sort(rows, min_rounds=a.min_rounds, pos_expect=a.pos_expect, sort_by="white")
     print(f"[SCORE] after filter: {len(rows)}", flush=True)
-    ts = time.strftime("%Y%m%d_%H%M%S"); os.makedirs("data/exports", exist_ok=True)
+    save_scored(run_id, a.mint, "white", rows, topk=a.topk, pnl=a.pnl or PNL_SOURCE)
     csvp = f"data/exports/white_scored_{a.mint[:6]}_{ts}.csv"
     score_export_csv(rows, csvp); print(f"[OK] CSV  -> {csvp}", flush=True)
     if a.topk > 0:
         txtp = f"data/exports/white_top_{a.mint[:6]}_{ts}.txt"
         score_export_txt(rows, txtp, a.topk); print(f"[OK] TOPK -> {txtp}", flush=True)
+    print(fmt_stats(rpc.tx_cache), flush=True)
+    print(fmt_limits(), flush=True)
+    print(fmt_pools(), flush=True)
 
 def cmd_score_watch(a):
-    rpc = SolRpc()
+    rpc = SolRpc(max_inflight=max(a.workers, DEFAULT_INFLIGHT))
     dec = 9
     try:
         sup = rpc.get_token_supply(a.mint); dec = int(sup.get("value", {}).get("decimals", 9))
     except: pass
-    addrs = fetch_watch(limit=a.limit)
+    run_id, addrs = _score_run(a, "score-watch", fetch_watch)
     print(f"[SCORE][WATCH] watch addrs loaded: {len(addrs)}", flush=True)
-    rows = score_watch_for_mint(rpc, a.mint, addrs, price_url=a.price_url, price_key=a.price_key,
-                                t0=None, decimals=dec, sleep_ms=a.sleep_ms, require_activity=a.require_activity)
-    print(f"[SCORE][WATCH] scored rows: {len(rows)}", flush=True)
+    ts = time.strftime("%Y%m%d_%H%M%S"); os.makedirs("data/exports", exist_ok=True)
+    raw = ScoreCsvStream(f"data/exports/watch_raw_{a.mint[:6]}_{ts}.csv")
+    try:
+        rows = score_watch_for_mint(rpc, a.mint, addrs, price_url=a.price_url, price_key=a.price_key,
+                                    t0=None, decimals=dec, require_activity=a.require_activity,
+                                    workers=a.workers, run_id=run_id, sink=raw, sync=not a.offline, pnl=a.pnl)
+    finally:
+        raw.close()
+    left = finish_run(run_id)
+    print(f"[SCORE][WATCH] scored rows: {len(rows)} (raw -> {raw.path}; unfinished={left})", flush=True)
     rows = score_filter_and_sort(rows, min_rounds=a.min_rounds, pos_expect=a.pos_expect, sort_by=a.sort_by)
     print(f"[SCORE][WATCH] after filter: {len(rows)}", flush=True)
-    ts = time.strftime("%Y%m%d_%H%M%S"); os.makedirs("data/exports", exist_ok=True)
+    save_scored(run_id, a.mint, "watch", rows, topk=a.topk, pnl=a.pnl or PNL_SOURCE)
     csvp = f"data/exports/watch_scored_{a.mint[:6]}_{ts}.csv"
     score_export_csv(rows, csvp); print(f"[OK] CSV  -> {csvp}", flush=True)
     if a.topk > 0:
         txtp = f"data/exports/watch_top_{a.mint[:6]}_{ts}.txt"
         score_export_txt(rows, txtp, a.topk); print(f"[OK] TOPK -> {txtp}", flush=True)
+    print(fmt_stats(rpc.tx_cache), flush=True)
+    print(fmt_limits(), flush=True)
+    print(fmt_pools(), flush=True)
+
+def cmd_cache_stats(a):
+    print(fmt_stats(TxCache()), flush=True)
 
 def _f(v):
     try:
@@ -155,19 +232,38 @@ def _f(v):
 def cmd_score_select(a):
     srcs = [s.strip() for s in (a.sources or "white,watch").split(",") if s.strip()]
     files = [s.strip() for s in (a.files or "").split(",") if s.strip()]
-    rows = select_load_scored(srcs, files if files else None)
-    print(f"[SELECT] loaded rows: {len(rows)} from sources={srcs} files={files}", flush=True)
-    rows = select_filter_and_sort(rows, min_rounds=a.min_rounds, min_win_rate=a.min_win_rate,
-                                  min_avg_pnl=a.min_avg_pnl, max_drawdown=a.max_drawdown, min_sol=a.min_sol)
-    if a.max_sol is not None:
-        rows = [r for r in rows if _f(r.get("sol_balance", 0.0)) <= a.max_sol]
-    print(f"[SELECT] after filter: {len(rows)}", flush=True)
+    t = time.time()
+    if files:
+        # 显式给定的旧 CSV：读进来在内存里过滤排序
+        rows = select_load_scored(srcs, files)
+        print(f"[SELECT] loaded rows: {len(rows)} from files={files}", flush=True)
+        rows = select_filter_and_sort(rows, min_rounds=a.min_rounds, min_win_rate=a.min_win_rate,
+                                      min_avg_pnl=a.min_avg_pnl, max_drawdown=a.max_drawdown, min_sol=a.min_sol)
+        if a.max_sol is not None:
+            rows = [r for r in rows if _f(r.get("sol_balance", 0.0)) <= a.max_sol]
+    else:
+        # 打分结果库：各 source 最近一次打分，条件下推到 SQL
+        rows = select_load_scored(srcs, mint=a.mint, min_rounds=a.min_rounds, min_win_rate=a.min_win_rate,
+                                  min_avg_pnl=a.min_avg_pnl, max_drawdown=a.max_drawdown,
+                                  min_sol=a.min_sol, max_sol=a.max_sol)
+    print(f"[SELECT] after filter: {len(rows)} sources={srcs} in {time.time()-t:.2f}s", flush=True)
     ts=time.strftime("%Y%m%d_%H%M%S"); os.makedirs("data/exports", exist_ok=True)
     csvp=f"data/exports/highwin_{a.mint[:6]}_{ts}.csv"
     txtp=f"data/exports/highwin_{a.mint[:6]}_{ts}.txt"
     select_export_csv(rows, csvp); select_export_txt(rows, txtp, a.topk)
     print(f"[OK] CSV -> {csvp}\n[OK] TXT -> {txtp}")
 
+def cmd_final(a):
+    # 最近一次 white/watch 打分的 TOPK 地址合并去重（原先是 cat *_top_*.txt | sort | uniq）
+    runs = scored_runs(a.mint, ["white", "watch"])
+    if not runs:
+        raise SystemExit("[ERR] 没有打分结果（先跑 score-white / score-watch）")
+    addrs = sorted({x for run_id, _, topk in runs for x in scored_top(run_id, a.topk or topk)})
+    os.makedirs("data/exports", exist_ok=True)
+    with open(a.out, "w") as f:
+        f.writelines(x + "\n" for x in addrs)
+    print(f"[OK] Final -> {a.out} ({len(addrs)} addrs from {', '.join(r[0] for r in runs)})", flush=True)
+
 def main():
     ap = argparse.ArgumentParser(prog="meme-follow-sol")
     sub = ap.add_subparsers()
@@ -191,7 +287,12 @@ def main():
 
     p = sub.add_parser("hard-verify")
     p.add_argument("--limit", type=int, default=400); p.add_argument("--verbose", action="store_true")
-    p.add_argument("--sleep-ms", type=int, default=0); p.set_defaults(func=cmd_hard)
+    p.add_argument("--sleep-ms", type=int, default=0, help="已废弃：限速由 app/ratelimit 自适应控制，此参数被忽略"); p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--resume", metavar="RUN_ID", help="续跑中断的运行（RUN_ID 或 last）")
+    p.set_defaults(func=cmd_hard)
+
+    p = sub.add_parser("db-check")
+    p.set_defaults(func=cmd_db_check)
 
     p = sub.add_parser("view")
     p.add_argument("--limit", type=int, default=200); p.set_defaults(func=cmd_view)
@@ -204,12 +305,17 @@ def main():
 
     p = sub.add_parser("rounds")
     p.add_argument("--mint", required=True); p.add_argument("--addr"); p.add_argument("--limit", type=int, default=50)
+    p.add_argument("--offline", action="store_true", help="不同步交易，只用本地缓存的回合/持仓变化")
     p.add_argument("--price_url"); p.add_argument("--price_key"); p.set_defaults(func=cmd_rounds)
 
     p = sub.add_parser("score-white")
     p.add_argument("--mint", required=True); p.add_argument("--limit", type=int, default=500)
     p.add_argument("--min-rounds", type=int, default=3); p.add_argument("--pos-expect", action="store_true")
-    p.add_argument("--topk", type=int, default=50); p.add_argument("--sleep-ms", type=int, default=0)
+    p.add_argument("--topk", type=int, default=50); p.add_argument("--sleep-ms", type=int, default=0, help="已废弃：限速由 app/ratelimit 自适应控制，此参数被忽略")
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--resume", metavar="RUN_ID", help="续跑中断的运行（RUN_ID 或 last）")
+    p.add_argument("--offline", action="store_true", help="不同步交易，只用本地缓存的回合/持仓变化")
+    p.add_argument("--pnl", choices=["sol", "usd"], help="盈亏口径：sol=交易里的 SOL 花费/回款（不需要价格源），usd=历史价折算；默认 SCORE_PNL")
     p.add_argument("--price_url"); p.add_argument("--price_key"); p.set_defaults(func=cmd_score_white)
 
     p = sub.add_parser("score-watch")
@@ -217,13 +323,27 @@ def main():
     p.add_argument("--min-rounds", type=int, default=1); p.add_argument("--pos-expect", action="store_true")
     p.add_argument("--require-activity", action="store_true")
     p.add_argument("--sort-by", choices=["white", "sol", "pnl"], default="sol")
-    p.add_argument("--topk", type=int, default=50); p.add_argument("--sleep-ms", type=int, default=0)
+    p.add_argument("--topk", type=int, default=50); p.add_argument("--sleep-ms", type=int, default=0, help="已废弃：限速由 app/ratelimit 自适应控制，此参数被忽略")
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--resume", metavar="RUN_ID", help="续跑中断的运行（RUN_ID 或 last）")
+    p.add_argument("--offline", action="store_true", help="不同步交易，只用本地缓存的回合/持仓变化")
+    p.add_argument("--pnl", choices=["sol", "usd"], help="盈亏口径：sol=交易里的 SOL 花费/回款（不需要价格源），usd=历史价折算；默认 SCORE_PNL")
     p.add_argument("--price_url"); p.add_argument("--price_key"); p.set_defaults(func=cmd_score_watch)
 
+    p = sub.add_parser("rescore")
+    p.add_argument("--mint", required=True); p.add_argument("--source", choices=["all", "white", "watch"], default="all")
+    p.add_argument("--min-rounds", type=int, default=3); p.add_argument("--pos-expect", action="store_true")
+    p.add_argument("--topk", type=int, default=50); p.add_argument("--decimals", type=int)
+    p.add_argument("--max-txs", type=int, default=600); p.add_argument("--timeout-s", type=int, default=24*3600)
+    p.add_argument("--pnl", choices=["sol", "usd"], help="盈亏口径：sol=交易里的 SOL 花费/回款（不需要价格源），usd=历史价折算；默认 SCORE_PNL")
+    p.add_argument("--price_url"); p.add_argument("--price_key"); p.set_defaults(func=cmd_rescore)
+
+    p = sub.add_parser("cache-stats"); p.set_defaults(func=cmd_cache_stats)
+
     p = sub.add_parser("score-select")
     p.add_argument("--mint", required=True)
     p.add_argument("--sources", default="white,watch")
-    p.add_argument("--files")
+    p.add_argument("--files", help="逗号分隔的旧 scored CSV；不给则查打分结果库（scored 表）")
     p.add_argument("--min-rounds", type=int, default=3)
     p.add_argument("--min-win-rate", type=float, default=0.55)
     p.add_argument("--min-avg-pnl", type=float, default=0.0)
@@ -233,6 +353,11 @@ def main():
     p.add_argument("--topk", type=int, default=200)
     p.set_defaults(func=cmd_score_select)
 
+    p = sub.add_parser("final")
+    p.add_argument("--mint", help="只看该 mint（可为前缀）；不给则取全库最近一次打分")
+    p.add_argument("--topk", type=int, default=0, help="每个 source 取前几名；默认沿用打分时的 --topk")
+    p.add_argument("--out", default="data/exports/final_top.txt"); p.set_defaults(func=cmd_final)
+
     a = ap.parse_args()
     if hasattr(a, "func"): a.func(a)
     else: ap.print_help()
@@ -1,8 +1,19 @@
-import os, sqlite3
+import os, json, time, uuid, atexit, sqlite3, threading
 from contextlib import contextmanager
 
 DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "db.sqlite"))
 
+# 写缓冲：set_list / add_candidates / record_item 先入队，攒够 DB_WRITE_BATCH 条或 DB_FLUSH_MS 后
+# 在一个事务里按入队顺序 executemany 落库；任何读（conn()）之前先刷，保证本进程读到自己的写
+def _env_on(name: str, default: str = "1") -> bool:
+    return (os.environ.get(name, default) or default).strip().lower() in ("1", "true", "yes", "on")
+
+WRITE_BEHIND = _env_on("DB_WRITE_BEHIND")
+WRITE_BATCH = int(os.environ.get("DB_WRITE_BATCH", "500") or 500)
+FLUSH_S = float(os.environ.get("DB_FLUSH_MS", "1000") or 1000) / 1000.0
+BUSY_TIMEOUT_S = 30.0
+WRITE_RETRIES = 3  # 写缓冲整批失败时的重试次数，之后逐条执行、丢弃坏行
+
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS pools (
   pool_id       INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -55,6 +66,63 @@ CREATE TABLE IF NOT EXISTS addr_tags (
   PRIMARY KEY (addr, chain, tag)
 );
 
+-- 增量同步：每个 owner×mint 的 ATA 高水位（最新已处理签名/slot）
+CREATE TABLE IF NOT EXISTS ata_sync (
+  owner          TEXT NOT NULL,
+  token_address  TEXT NOT NULL,
+  ata            TEXT NOT NULL,
+  last_sig       TEXT,
+  last_slot      INTEGER,
+  updated_at     DATETIME DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (owner, token_address, ata)
+);
+
+-- 逐笔持仓变化（token 最小单位，含 0 变化的交易：回合超时判定要用）
+CREATE TABLE IF NOT EXISTS owner_deltas (
+  owner          TEXT NOT NULL,
+  token_address  TEXT NOT NULL,
+  sig            TEXT NOT NULL,
+  slot           INTEGER,
+  ts             INTEGER NOT NULL,
+  delta          INTEGER NOT NULL,
+  PRIMARY KEY (owner, token_address, sig)
+);
+CREATE INDEX IF NOT EXISTS idx_owner_deltas_ts ON owner_deltas(owner, token_address, ts);
+
+-- 每个 mint 的 T0（最早签名的 blockTime）：complete=0 表示还没翻到底，oldest_sig 为下次继续往旧翻的游标
+CREATE TABLE IF NOT EXISTS token_t0 (
+  chain          TEXT NOT NULL,
+  token_address  TEXT NOT NULL,
+  t0             INTEGER NOT NULL,
+  oldest_sig     TEXT,
+  oldest_slot    INTEGER,
+  complete       INTEGER NOT NULL DEFAULT 0,
+  updated_at     DATETIME DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (chain, token_address)
+);
+
+-- 运行日志：一次 score/early/hard-verify 运行 + 逐地址状态/结果（断点续跑用）
+CREATE TABLE IF NOT EXISTS runs (
+  run_id         TEXT PRIMARY KEY,
+  stage          TEXT NOT NULL,
+  token_address  TEXT NOT NULL,
+  params         TEXT,
+  status         TEXT NOT NULL DEFAULT 'RUNNING', -- RUNNING / DONE
+  started_at     DATETIME DEFAULT CURRENT_TIMESTAMP,
+  finished_at    DATETIME
+);
+
+CREATE TABLE IF NOT EXISTS run_items (
+  run_id         TEXT NOT NULL,
+  addr           TEXT NOT NULL,
+  seq            INTEGER NOT NULL,
+  status         TEXT NOT NULL DEFAULT 'PENDING', -- PENDING / OK / ERR
+  meta           TEXT,                            -- JSON：续跑所需的输入（如 chain/mint）
+  result         TEXT,                            -- JSON
+  updated_at     DATETIME DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (run_id, addr)
+);
+
 CREATE VIEW IF NOT EXISTS view_addresses AS
 SELECT
   c.addr, c.chain, c.token_address,
@@ -65,23 +133,346 @@ FROM candidate_addrs c
 LEFT JOIN lists l ON l.addr = c.addr AND l.chain = c.chain;
 """
 
-@contextmanager
-def conn():
-    # 确保 data 目录存在
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    init_needed = not os.path.exists(DB_PATH)
-    con = sqlite3.connect(DB_PATH)
-    try:
-        if init_needed:
-            con.executescript(SCHEMA)
+def _statements(script):
+    # 把多语句脚本切成单条（按 sqlite3.complete_statement 判断语句边界），便于放进同一个事务
+    out, buf = [], ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            if buf.strip(): out.append(buf.strip())
+            buf = ""
+    return out
+
+def _add_column(table, col, decl):
+    # 旧库补列（CREATE TABLE IF NOT EXISTS 不会给已有表加列）
+    def run(con):
+        have = {r[1] for r in con.execute(f"PRAGMA table_info({table});")}
+        if col not in have:
+            con.execute(f"ALTER TABLE {table} ADD COLUMN {col} {decl};")
+    return run
+
+def _legs(con):
+    # owner_deltas/owner_rounds 补 SOL/USDC 腿（最小单位，NULL = 旧数据/未知）；批量重算要读 sol_delta，覆盖索引带上它；
+    # 旧回合没有这两列，清掉计算状态让其全部重放
+    for table, col in (("owner_deltas", "sol_delta"), ("owner_deltas", "usdc_delta"), ("owner_rounds", "sol"), ("owner_rounds", "usdc")):
+        _add_column(table, col, "INTEGER")(con)
+    con.execute("DROP INDEX IF EXISTS idx_owner_deltas_mint;")
+    con.execute("CREATE INDEX idx_owner_deltas_mint ON owner_deltas(token_address, owner, ts, slot, sig, delta, sol_delta);")
+    con.execute("DELETE FROM owner_round_state;")
+
+# 版本化迁移：PRAGMA user_version 记录已应用到的版本；只追加，不修改已发布的条目
+# 每项为 (版本, SQL 语句列表 或 callable(con))
+MIGRATIONS = [
+    (1, _statements(SCHEMA)),
+    (2, _add_column("run_items", "meta", "TEXT")),
+    # 热查询索引：fetch_candidates / live_view（按 first_seen 倒序走 candidate_addrs，再按主键探 lists），
+    # fetch_white/fetch_watch/export（lists 按 status 取、按 updated_at 倒序），reset-mint（按 mint 删候选）
+    (3, ["CREATE INDEX IF NOT EXISTS idx_lists_status_updated ON lists(status, updated_at);",
+         "CREATE INDEX IF NOT EXISTS idx_candidate_addrs_first_seen ON candidate_addrs(first_seen);",
+         "CREATE INDEX IF NOT EXISTS idx_candidate_addrs_token ON candidate_addrs(token_address);"]),
+    # load_mint_deltas：按 mint 取全部 owner 的持仓变化（批量重算）
+    (4, ["CREATE INDEX IF NOT EXISTS idx_owner_deltas_mint ON owner_deltas(token_address, owner, ts, slot, sig, delta);"]),
+    # 回合落库：owner_rounds 为已算出的回合（closed=0 的是末尾未平仓回合，至多一条），
+    # owner_round_state 记录算到哪：窗口首笔 + “干净点”（空仓且无进行中回合）的 sig/slot 与其前的笔数
+    (5, _statements("""
+CREATE TABLE IF NOT EXISTS owner_rounds (
+  owner          TEXT NOT NULL,
+  token_address  TEXT NOT NULL,
+  seq            INTEGER NOT NULL,
+  entry_ts       INTEGER NOT NULL,
+  exit_ts        INTEGER NOT NULL,
+  hold_s         INTEGER NOT NULL,
+  buy            INTEGER NOT NULL,
+  sell           INTEGER NOT NULL,
+  net            INTEGER NOT NULL,
+  pnl_tokens     INTEGER NOT NULL,
+  closed         INTEGER NOT NULL,
+  PRIMARY KEY (owner, token_address, seq)
+);
+CREATE TABLE IF NOT EXISTS owner_round_state (
+  owner          TEXT NOT NULL,
+  token_address  TEXT NOT NULL,
+  max_txs        INTEGER NOT NULL,
+  timeout_s      INTEGER NOT NULL,
+  first_sig      TEXT NOT NULL,
+  upto_sig       TEXT,
+  upto_slot      INTEGER,
+  n_upto         INTEGER NOT NULL,
+  last_sig       TEXT NOT NULL,
+  n_txs          INTEGER NOT NULL,
+  updated_at     DATETIME DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (owner, token_address)
+);
+""")),
+    # 同一交易里的 SOL/USDC 腿（回合按成交的真实花费/回款算盈亏，不依赖外部价格）
+    (6, _legs),
+    # 打分结果库：score-white/score-watch 过滤排序后的行按 run 落库，score-select / gmgn_filter / final 直接按条件查这里，
+    # CSV/TXT 只是导出。scored 按 (run_id, pos) 聚簇存放，pos 为 select 的排序名次：查询只扫该 run、顺序读出即已排好；
+    # seq 为打分阶段自己的名次（*_top_*.txt 即 seq < topk）
+    (7, _statements("""
+CREATE TABLE IF NOT EXISTS scored_runs (
+  run_id         TEXT PRIMARY KEY,
+  token_address  TEXT NOT NULL,
+  source         TEXT NOT NULL,            -- white / watch
+  pnl            TEXT,                     -- 盈亏口径 sol / usd
+  topk           INTEGER NOT NULL DEFAULT 0,
+  n_rows         INTEGER NOT NULL DEFAULT 0,
+  created_at     DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_scored_runs_mint ON scored_runs(token_address, source, created_at);
+CREATE INDEX IF NOT EXISTS idx_scored_runs_source ON scored_runs(source, created_at);
+CREATE TABLE IF NOT EXISTS scored (
+  run_id         TEXT NOT NULL,
+  pos            INTEGER NOT NULL,
+  addr           TEXT NOT NULL,
+  seq            INTEGER NOT NULL,
+  sol_balance    REAL,                     -- white 没有余额：NULL
+  rounds         INTEGER NOT NULL,
+  wins           INTEGER NOT NULL,
+  win_rate       REAL NOT NULL,
+  total_pnl      REAL NOT NULL,
+  avg_pnl        REAL NOT NULL,
+  median_hold_s  INTEGER NOT NULL,
+  max_drawdown   REAL NOT NULL,
+  PRIMARY KEY (run_id, pos)
+) WITHOUT ROWID;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_scored_addr ON scored(run_id, addr);
+CREATE INDEX IF NOT EXISTS idx_scored_seq ON scored(run_id, seq);
+""")),
+    # run_items 改按 (run_id, seq) 为主键：同一地址可以在一次运行里出现多次（hard-verify 同一地址挂在多个 mint 下），
+    # 各自的 meta/结论分开记；(run_id, addr) 索引给按地址回写的 record_item
+    (8, _statements("""
+CREATE TABLE run_items_v8 (
+  run_id         TEXT NOT NULL,
+  addr           TEXT NOT NULL,
+  seq            INTEGER NOT NULL,
+  status         TEXT NOT NULL DEFAULT 'PENDING', -- PENDING / OK / ERR
+  meta           TEXT,                            -- JSON：续跑所需的输入（如 chain/mint）
+  result         TEXT,                            -- JSON
+  updated_at     DATETIME DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (run_id, seq)
+);
+INSERT INTO run_items_v8(run_id, addr, seq, status, meta, result, updated_at)
+  SELECT run_id, addr, seq, status, meta, result, updated_at FROM run_items;
+DROP TABLE run_items;
+ALTER TABLE run_items_v8 RENAME TO run_items;
+CREATE INDEX idx_run_items_addr ON run_items(run_id, addr);
+""")),
+    # 回合的 SOL 腿改为“有一笔不是按 SOL 结算就未知”：批量重算要逐笔看 usdc_delta，覆盖索引带上它；已存回合全部重放
+    (9, ["DROP INDEX IF EXISTS idx_owner_deltas_mint;",
+         "CREATE INDEX idx_owner_deltas_mint ON owner_deltas(token_address, owner, ts, slot, sig, delta, sol_delta, usdc_delta);",
+         "DELETE FROM owner_round_state;"]),
+    # 旧行补腿（只查本地交易缓存）每个签名只试一次：legs_tried=1 后不再查（缓存里没有的以后也基本不会有）
+    (10, _add_column("owner_deltas", "legs_tried", "INTEGER")),
+    # ATA 定期重新发现：scanned_at 为上次 getTokenAccountsByOwner 的时间（epoch 秒），过期后再查一次补上新开的 Token Account
+    (11, _add_column("ata_sync", "scanned_at", "INTEGER")),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def migrate(con):
+    """
+    把库升级到 SCHEMA_VERSION：每个版本一个 BEGIN IMMEDIATE 事务（多进程同时打开时只有一个真正执行），
+    返回应用的迁移数。比代码还新的库（user_version 更大）原样使用。
+    """
+    applied = 0
+    for ver, step in MIGRATIONS:
+        if con.execute("PRAGMA user_version;").fetchone()[0] >= ver:
+            continue
+        con.execute("BEGIN IMMEDIATE;")
+        try:
+            if con.execute("PRAGMA user_version;").fetchone()[0] < ver:  # 拿到写锁后再确认一次
+                if callable(step): step(con)
+                else:
+                    for sql in step: con.execute(sql)
+                con.execute(f"PRAGMA user_version={ver};")
+                applied += 1
             con.commit()
+        except Exception:
+            con.rollback()
+            raise
+    return applied
+
+# 进程内共用一条连接（WAL，多线程共用，RLock 串行化访问）；fork 后或 DB_PATH 变了就重开
+_lock = threading.RLock()
+_con = None
+_con_key = None
+
+def _open():
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    con = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_S, check_same_thread=False)
+    # WAL：读写互不阻塞，多进程并发写靠 busy_timeout 排队，不再 "database is locked"
+    con.execute("PRAGMA journal_mode=WAL;")
+    con.execute("PRAGMA synchronous=NORMAL;")
+    con.execute(f"PRAGMA busy_timeout={int(BUSY_TIMEOUT_S * 1000)};")
+    con.execute("PRAGMA temp_store=MEMORY;")
+    # schema 版本只在打开时检查一次
+    migrate(con)
+    return con
+
+def _get():
+    global _con, _con_key
+    key = (os.getpid(), DB_PATH)
+    if _con is None or _con_key != key:
+        if _con is not None and _con_key[0] == os.getpid():
+            try: _con.close()
+            except Exception: pass
+        _con, _con_key = _open(), key
+    return _con
+
+class _WriteQueue:
+    """按入队顺序缓存 (sql, params)；flush 时相邻同一条 sql 合并为 executemany，整批一个事务"""
+    def __init__(self):
+        self.items = []
+        self.first_at = 0.0
+        self._timer = None
+
+    def put(self, sql, rows):
+        with _lock:
+            if not self.items: self.first_at = time.monotonic()
+            self.items.extend((sql, r) for r in rows)
+            n = len(self.items)
+        if not WRITE_BEHIND or n >= WRITE_BATCH:
+            self.flush()
         else:
-            # 保险起见，每次也确保 schema 存在（幂等）
-            con.executescript(SCHEMA)
+            self._arm()
+
+    def _arm(self):
+        # 后台定时刷：攒不满一批时最多延迟 FLUSH_S
+        if self._timer is None or not self._timer.is_alive():
+            self._timer = threading.Timer(FLUSH_S, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """
+        整批一个事务落库；锁类失败（busy_timeout 后仍 "database is locked"）整批最多试 WRITE_RETRIES 次，
+        仍失败或是坏行（约束/参数错误）就逐条执行，把出错的行打日志后丢掉，其余照常提交。
+        不抛异常：坏行不会卡在队首、让之后每次 conn() 的读都跟着失败（定时线程里也不会只剩一条 excepthook 输出）
+        """
+        with _lock:
+            if not self.items: return 0
+            items, self.items = self.items, []
+            con = _get()
+            for attempt in range(WRITE_RETRIES):
+                try:
+                    con.execute("BEGIN IMMEDIATE;")
+                    i = 0
+                    while i < len(items):
+                        j = i
+                        while j < len(items) and items[j][0] == items[i][0]: j += 1
+                        con.executemany(items[i][0], [r for _, r in items[i:j]])
+                        i = j
+                    con.commit()
+                    return len(items)
+                except Exception as e:
+                    if con.in_transaction: con.rollback()
+                    err = e
+                if not isinstance(err, sqlite3.OperationalError):
+                    break  # 约束/参数错误重试也一样：直接逐条
+                if attempt + 1 < WRITE_RETRIES:
+                    time.sleep(0.2 * 2 ** attempt)
+            return self._flush_rows(con, items, err)
+
+    def _flush_rows(self, con, items, err):
+        # 逐条执行：单条语句失败只回滚这一条（SQLite 语句级原子），同事务里其它行照常提交
+        print(f"[db][WARN] write batch of {len(items)} failed ({err}); retrying row by row", flush=True)
+        bad = []
+        try:
+            con.execute("BEGIN IMMEDIATE;")
+            for sql, r in items:
+                try: con.execute(sql, r)
+                except Exception as e: bad.append((sql, r, e))
             con.commit()
-        yield con
-    finally:
-        con.close()
+        except Exception as e:
+            if con.in_transaction: con.rollback()
+            print(f"[db][ERR] dropped {len(items)} queued writes: {e}", flush=True)
+            return 0
+        for sql, r, e in bad:
+            print(f"[db][ERR] dropped write: {e} | {' '.join(sql.split())[:80]} | {r}", flush=True)
+        return len(items) - len(bad)
+
+_wq = _WriteQueue()
+
+def flush_writes():
+    return _wq.flush()
+
+atexit.register(lambda: _wq.flush())
+
+@contextmanager
+def conn():
+    # 共享连接：进入前先刷写缓冲；块内异常则回滚未提交的修改（与旧的“关连接即丢弃”一致）
+    with _lock:
+        _wq.flush()
+        con = _get()
+        try:
+            yield con
+        finally:
+            if con.in_transaction:
+                con.rollback()
+
+# 热查询：调用处（本模块与 cli/score/filters）都直接用这里的常量/拼装函数，HOT_QUERIES 用同一份 SQL 查执行计划，
+# 不再手抄一份（db-check 与 tests/test_db_plans.py 确认它们都走索引、不为 ORDER BY 建临时表）
+SQL_FETCH_CANDIDATES = """
+SELECT addr, chain, token_address FROM view_addresses
+WHERE status IN ('CANDIDATE','WATCH')
+ORDER BY first_seen DESC
+LIMIT ?;"""
+SQL_HARD_VERIFY_BATCH = """
+SELECT DISTINCT c.addr, c.chain, c.token_address
+FROM view_addresses c
+WHERE c.status IN ('WATCH','CANDIDATE')
+ORDER BY c.first_seen DESC
+LIMIT ?;"""
+# 按状态取名单（fetch_white/fetch_watch/export-lists/rounds）；不限条数时 LIMIT -1
+SQL_LIST_ADDRS = "SELECT addr FROM lists WHERE status=? ORDER BY updated_at DESC LIMIT ?;"
+SQL_LISTS_CSV = "SELECT addr,chain,status,reason,updated_at FROM lists ORDER BY status DESC,updated_at DESC;"
+SQL_VIEW_RECENT = """
+SELECT datetime(first_seen,'localtime') AS seen, chain,
+       substr(token_address,1,10)||'…' AS token, addr,
+       COALESCE(status,'CANDIDATE') AS status, COALESCE(reason,'')
+FROM view_addresses
+ORDER BY first_seen DESC
+LIMIT ?;"""
+SQL_RESET_MINT = "DELETE FROM candidate_addrs WHERE token_address=?;"
+SQL_MINT_DELTAS = """
+SELECT owner, ts, delta, sol_delta, usdc_delta FROM owner_deltas WHERE token_address=?
+ORDER BY owner, ts, slot, sig;"""
+SQL_SCORED_TOP = "SELECT addr FROM scored WHERE run_id=? AND seq<? ORDER BY seq;"
+
+def hot_queries():
+    """
+    [(name, sql, args)]：上面的常量，加上 scored_runs / query_scored 拼出来的几种典型形态（同一个拼装函数）
+    """
+    return [
+        ("fetch_candidates", SQL_FETCH_CANDIDATES, (500,)),
+        ("hard_verify_batch", SQL_HARD_VERIFY_BATCH, (2000,)),
+        ("fetch_white", SQL_LIST_ADDRS, ("WHITE", 300)),
+        ("fetch_watch", SQL_LIST_ADDRS, ("WATCH", -1)),
+        ("export_lists_csv", SQL_LISTS_CSV, ()),
+        ("view / live_view", SQL_VIEW_RECENT, (200,)),
+        ("reset_mint", SQL_RESET_MINT, ("x",)),
+        ("load_mint_deltas", SQL_MINT_DELTAS, ("x",)),
+        ("scored_top", SQL_SCORED_TOP, ("x", 100)),
+        ("scored_runs", *_scored_runs_sql("x" * 44, "white", False)),
+        ("scored_runs prefix", *_scored_runs_sql("x" * 6, "white", True)),
+        ("scored_runs any mint", *_scored_runs_sql(None, "watch", False)),
+        ("query_scored", *_query_scored_sql("x", min_rounds=1)),
+        ("query_scored win_rate", *_query_scored_sql("x", min_win_rate=0.5, min_avg_pnl=0.0, limit=100)),
+        ("query_scored sol", *_query_scored_sql("x", min_sol=1.0, max_sol=100.0, null_sol=0.0)),
+        ("query_scored dedupe", *_query_scored_sql("x", min_win_rate=0.5, min_sol=1.0, exclude_runs=("y", "z"))),
+    ]
+
+def explain_hot():
+    """
+    [(name, plan_lines, ok)]：ok=False 表示出现了不走索引的全表 SCAN 或为 ORDER BY 建临时 B 树
+    """
+    out = []
+    with conn() as c:
+        for name, sql, args in hot_queries():
+            plan = [r[3] for r in c.execute("EXPLAIN QUERY PLAN " + sql, args)]
+            bad = [p for p in plan if (p.startswith("SCAN") and "INDEX" not in p) or "TEMP B-TREE FOR ORDER BY" in p]
+            out.append((name, plan, not bad))
+    return out
 
 def upsert_pool(chain, mint, amm=None, base=None, quote=None, source="manual"):
     with conn() as c:
@@ -93,29 +484,330 @@ def upsert_pool(chain, mint, amm=None, base=None, quote=None, source="manual"):
         c.commit()
 
 def add_candidates(chain, mint, addrs, source="mint_scan"):
+    _wq.put("""
+    INSERT OR IGNORE INTO candidate_addrs(addr, token_address, chain, source)
+    VALUES(?,?,?,?)
+    """, [(a, mint, chain, source) for a in addrs])
+
+def set_list(addr, chain, status, reason=""):
+    _wq.put("""
+    INSERT INTO lists(addr, chain, status, reason, updated_at)
+    VALUES(?,?,?,?,CURRENT_TIMESTAMP)
+    ON CONFLICT(addr, chain) DO UPDATE SET status=?, reason=?, updated_at=CURRENT_TIMESTAMP;
+    """, [(addr, chain, status, reason, status, reason)])
+
+def fetch_candidates(limit=500):
     with conn() as c:
-        for a in addrs:
+        cur = c.execute(SQL_FETCH_CANDIDATES, (limit,))
+        return cur.fetchall()
+
+def load_ata_marks(owner, mint):
+    # {ata: (last_sig, last_slot)}
+    with conn() as c:
+        cur = c.execute("SELECT ata, last_sig, last_slot FROM ata_sync WHERE owner=? AND token_address=?;", (owner, mint))
+        return {ata: (sig, slot) for ata, sig, slot in cur.fetchall()}
+
+def load_ata_scanned_at(owner, mint):
+    # 上次为 owner×mint 查 ATA 列表的时间（epoch 秒）；从没查过/没有记录为 None
+    with conn() as c:
+        r = c.execute("SELECT MIN(COALESCE(scanned_at, 0)) FROM ata_sync WHERE owner=? AND token_address=?;",
+                      (owner, mint)).fetchone()
+    return r[0] or None
+
+def save_owner_sync(owner, mint, marks, deltas, scanned_at=None, cut=None):
+    """
+    marks: {ata: (last_sig, last_slot)}（sig 为 None 只登记 ATA，不动已有高水位）；
+    deltas: [(sig, slot, ts, delta, sol_delta, usdc_delta)]（后两项可省略 = 未知）
+    同一事务里追加逐笔变化并推进高水位（重复签名忽略，重跑幂等）；带腿的行是从完整交易算出来的，记为已试过补腿。
+    scanned_at：这次重新查过 ATA 列表的时间，记到该 owner×mint 的所有 ATA 上。
+    cut=(ts, slot)：某个 ATA 的新签名超过一次同步的上限、和已落库部分之间有缺口 → 删掉比它旧的行
+    （本地历史从缺口之后重新开始，不留中间缺一段的逐笔记录），并清掉回合计算状态。
+    """
+    with conn() as c:
+        c.executemany("""
+        INSERT OR IGNORE INTO owner_deltas(owner, token_address, sig, slot, ts, delta, sol_delta, usdc_delta, legs_tried)
+        VALUES(?,?,?,?,?,?,?,?,?)
+        """, [(owner, mint, *(tuple(r) + (None, None))[:6], 1 if len(r) >= 6 else None) for r in deltas])
+        c.executemany("""
+        INSERT INTO ata_sync(owner, token_address, ata, last_sig, last_slot, updated_at)
+        VALUES(?,?,?,?,?,CURRENT_TIMESTAMP)
+        ON CONFLICT(owner, token_address, ata) DO UPDATE SET
+          last_sig=COALESCE(excluded.last_sig, last_sig),
+          last_slot=COALESCE(excluded.last_slot, last_slot),
+          updated_at=CURRENT_TIMESTAMP;
+        """, [(owner, mint, ata, sig, slot) for ata, (sig, slot) in marks.items()])
+        if scanned_at is not None:
+            c.execute("UPDATE ata_sync SET scanned_at=? WHERE owner=? AND token_address=?;", (scanned_at, owner, mint))
+        if cut is not None:
+            ts, slot = cut
             c.execute("""
-            INSERT OR IGNORE INTO candidate_addrs(addr, token_address, chain, source)
-            VALUES(?,?,?,?)
-            """, (a, mint, chain, source))
+            DELETE FROM owner_deltas WHERE owner=? AND token_address=? AND (ts < ? OR (ts = ? AND slot < ?));
+            """, (owner, mint, ts, ts, slot if slot is not None else -1))
+            c.execute("DELETE FROM owner_round_state WHERE owner=? AND token_address=?;", (owner, mint))
         c.commit()
 
-def set_list(addr, chain, status, reason=""):
+def load_owner_deltas(owner, mint, limit=None):
+    # 最近 limit 笔，按 (ts, slot, sig) 旧→新返回 [(ts, delta)]（sig 兜底，同秒同 slot 的顺序也固定）
     with conn() as c:
-        c.execute("""
-        INSERT INTO lists(addr, chain, status, reason, updated_at)
-        VALUES(?,?,?,?,CURRENT_TIMESTAMP)
-        ON CONFLICT(addr, chain) DO UPDATE SET status=?, reason=?, updated_at=CURRENT_TIMESTAMP;
-        """, (addr, chain, status, reason, status, reason))
-        c.commit()
+        cur = c.execute("""
+        SELECT ts, delta FROM (
+          SELECT ts, slot, sig, delta FROM owner_deltas
+          WHERE owner=? AND token_address=?
+          ORDER BY ts DESC, slot DESC, sig DESC
+          LIMIT ?
+        ) ORDER BY ts ASC, slot ASC, sig ASC;
+        """, (owner, mint, limit if limit else -1))
+        return cur.fetchall()
 
-def fetch_candidates(limit=500):
+def load_owner_window(owner, mint, limit=None):
+    # 与 load_owner_deltas 同一窗口，带上 sig/slot 与 SOL/USDC 腿：[(sig, slot, ts, delta, sol_delta, usdc_delta)] 旧→新
     with conn() as c:
         cur = c.execute("""
-        SELECT addr, chain, token_address FROM view_addresses
-        WHERE status IN ('CANDIDATE','WATCH')
-        ORDER BY first_seen DESC
-        LIMIT ?;
-        """, (limit,))
+        SELECT sig, slot, ts, delta, sol_delta, usdc_delta FROM (
+          SELECT sig, slot, ts, delta, sol_delta, usdc_delta FROM owner_deltas
+          WHERE owner=? AND token_address=?
+          ORDER BY ts DESC, slot DESC, sig DESC
+          LIMIT ?
+        ) ORDER BY ts ASC, slot ASC, sig ASC;
+        """, (owner, mint, limit if limit else -1))
+        return cur.fetchall()
+
+def load_missing_legs(owner, mint, limit=None):
+    # 窗口内（最近 limit 笔）还没有 SOL/USDC 腿、且还没试过补腿的签名（旧版本落库的行）
+    with conn() as c:
+        cur = c.execute("""
+        SELECT sig FROM (
+          SELECT sig, sol_delta, usdc_delta, legs_tried FROM owner_deltas
+          WHERE owner=? AND token_address=?
+          ORDER BY ts DESC, slot DESC, sig DESC
+          LIMIT ?
+        ) WHERE (sol_delta IS NULL OR usdc_delta IS NULL) AND legs_tried IS NULL;
+        """, (owner, mint, limit if limit else -1))
+        return [r[0] for r in cur.fetchall()]
+
+def save_owner_legs(owner, mint, legs, tried=()):
+    """
+    legs: [(sig, sol_delta, usdc_delta)]，只补还是 NULL 的腿（已有值不覆盖）；tried: 这次查过的签名，记为已试过。
+    只有确实有腿从 NULL 变成有值时才清掉该 owner×mint 的回合计算状态（下次整段重放），返回这样的行数
+    """
+    with conn() as c:
+        cur = c.executemany("""
+        UPDATE owner_deltas SET sol_delta=COALESCE(sol_delta, ?), usdc_delta=COALESCE(usdc_delta, ?)
+        WHERE owner=? AND token_address=? AND sig=?
+          AND ((sol_delta IS NULL AND ? IS NOT NULL) OR (usdc_delta IS NULL AND ? IS NOT NULL));
+        """, [(sol, usdc, owner, mint, sig, sol, usdc) for sig, sol, usdc in legs])
+        changed = max(cur.rowcount, 0)
+        c.executemany("UPDATE owner_deltas SET legs_tried=1 WHERE owner=? AND token_address=? AND sig=?;",
+                      [(owner, mint, sig) for sig in tried])
+        if changed:
+            c.execute("DELETE FROM owner_round_state WHERE owner=? AND token_address=?;", (owner, mint))
+        c.commit()
+    return changed
+
+ROUND_COLS = ("entry_ts", "exit_ts", "hold_s", "buy", "sell", "net", "pnl_tokens", "sol", "usdc")
+
+STATE_COLS = ("max_txs", "timeout_s", "first_sig", "upto_sig", "upto_slot", "n_upto", "last_sig", "n_txs")
+
+def load_round_state(owner, mint):
+    # 回合计算状态 {max_txs, timeout_s, first_sig, upto_sig, upto_slot, n_upto, last_sig, n_txs}，没有为 None
+    with conn() as c:
+        r = c.execute(f"SELECT {', '.join(STATE_COLS)} FROM owner_round_state WHERE owner=? AND token_address=?;",
+                      (owner, mint)).fetchone()
+    return dict(zip(STATE_COLS, r)) if r else None
+
+def load_owner_rounds(owner, mint, closed_only=False):
+    # [{entry_ts, exit_ts, hold_s, buy, sell, net, pnl_tokens, sol, usdc, closed}]，按 seq 旧→新
+    with conn() as c:
+        cur = c.execute(f"""
+        SELECT {", ".join(ROUND_COLS)}, closed FROM owner_rounds
+        WHERE owner=? AND token_address=? {"AND closed=1" if closed_only else ""} ORDER BY seq;
+        """, (owner, mint))
+        return [dict(zip(ROUND_COLS + ("closed",), r)) for r in cur.fetchall()]
+
+def save_owner_rounds(owner, mint, keep, rounds, state):
+    """
+    保留 seq < keep 的回合，其后替换为 rounds（seq 从 keep 起），并更新计算状态；同一事务内完成。
+    state: 同 load_round_state
+    """
+    with conn() as c:
+        c.execute("DELETE FROM owner_rounds WHERE owner=? AND token_address=? AND seq>=?;", (owner, mint, keep))
+        c.executemany(f"""
+        INSERT INTO owner_rounds(owner, token_address, seq, {", ".join(ROUND_COLS)}, closed)
+        VALUES(?,?,?,{",".join("?" * len(ROUND_COLS))},?)
+        """, [(owner, mint, keep + i, *(r[k] for k in ROUND_COLS), int(r["closed"])) for i, r in enumerate(rounds)])
+        c.execute(f"""
+        INSERT OR REPLACE INTO owner_round_state(owner, token_address, {", ".join(STATE_COLS)}, updated_at)
+        VALUES(?,?,{",".join("?" * len(STATE_COLS))},CURRENT_TIMESTAMP)
+        """, (owner, mint, *(state[k] for k in STATE_COLS)))
+        c.commit()
+
+def load_mint_deltas(mint):
+    # 该 mint 下所有已缓存 owner 的持仓变化，按 (owner, ts, slot, sig) 排好返回 [(owner, ts, delta, sol_delta, usdc_delta)]；
+    # 走覆盖索引顺序读出，不排序不回表（每个 owner 取最近几笔由调用方截断）
+    with conn() as c:
+        cur = c.execute(SQL_MINT_DELTAS, (mint,))
         return cur.fetchall()
+
+def load_token_t0(mint, chain="sol"):
+    # 返回 (t0, oldest_sig, oldest_slot, complete) 或 None
+    with conn() as c:
+        r = c.execute("SELECT t0, oldest_sig, oldest_slot, complete FROM token_t0 WHERE chain=? AND token_address=?;",
+                      (chain, mint)).fetchone()
+    return (r[0], r[1], r[2], bool(r[3])) if r else None
+
+def save_token_t0(mint, t0, oldest_sig=None, oldest_slot=None, complete=False, chain="sol"):
+    with conn() as c:
+        c.execute("""
+        INSERT INTO token_t0(chain, token_address, t0, oldest_sig, oldest_slot, complete, updated_at)
+        VALUES(?,?,?,?,?,?,CURRENT_TIMESTAMP)
+        ON CONFLICT(chain, token_address) DO UPDATE SET
+          t0=excluded.t0, oldest_sig=excluded.oldest_sig, oldest_slot=excluded.oldest_slot,
+          complete=excluded.complete, updated_at=CURRENT_TIMESTAMP;
+        """, (chain, mint, t0, oldest_sig, oldest_slot, int(bool(complete))))
+        c.commit()
+
+def start_run(stage, mint, items, params=None):
+    """
+    新建一次运行并把待处理项按顺序登记为 PENDING，返回 run_id。
+    items: 地址列表，或 (addr, meta) 列表（meta 为续跑时需要的输入，JSON 存储）；
+           完全相同的项（地址 + meta）只登记第一次，同一地址配不同 meta 各记一条
+    """
+    # 秒级时间戳不唯一（mf.sh 并行跑各阶段、hard-verify 的 mint 固定为 "*"）：带一段短随机后缀
+    run_id = f"{stage}-{mint[:6]}-{time.strftime('%Y%m%d_%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    rows, seen = [], set()
+    for i, it in enumerate(items):
+        addr, meta = it if isinstance(it, tuple) else (it, None)
+        m = json.dumps(meta, sort_keys=True) if meta is not None else None
+        if (addr, m) in seen: continue
+        seen.add((addr, m))
+        rows.append((run_id, addr, i, m))
+    with conn() as c:
+        c.execute("INSERT INTO runs(run_id, stage, token_address, params) VALUES(?,?,?,?);",
+                  (run_id, stage, mint, json.dumps(params or {})))
+        c.executemany("INSERT INTO run_items(run_id, addr, seq, meta) VALUES(?,?,?,?);", rows)
+        c.commit()
+    return run_id
+
+def find_run(run_id, stage=None, mint=None):
+    """
+    run_id='last' 时取该 stage×mint 最近一次未完成的运行；返回 (run_id, params) 或 None
+    """
+    with conn() as c:
+        if run_id == "last":
+            cur = c.execute("""
+            SELECT run_id, params FROM runs
+            WHERE stage=? AND token_address=? AND status='RUNNING'
+            ORDER BY started_at DESC, rowid DESC LIMIT 1;""", (stage, mint))
+        else:
+            cur = c.execute("SELECT run_id, params FROM runs WHERE run_id=?;", (run_id,))
+        r = cur.fetchone()
+    return (r[0], json.loads(r[1] or "{}")) if r else None
+
+def load_run_items(run_id):
+    # 按登记顺序返回 [(addr, status, result, meta, seq)]，result/meta 已反序列化；seq 供 record_item 精确回写
+    with conn() as c:
+        cur = c.execute("SELECT addr, status, result, meta, seq FROM run_items WHERE run_id=? ORDER BY seq;", (run_id,))
+        return [(a, st, json.loads(r) if r else None, json.loads(m) if m else None, q) for a, st, r, m, q in cur.fetchall()]
+
+def record_item(run_id, addr, status, result=None, seq=None):
+    # 与同一地址的 set_list 同队列、同事务落库：不会出现“已记 OK 但结论丢了”
+    # 给了 seq 只回写这一项；否则回写该地址的所有项（地址本身就是工作单元的 score/early）
+    res = json.dumps(result) if result is not None else None
+    if seq is not None:
+        _wq.put("""
+        UPDATE run_items SET status=?, result=?, updated_at=CURRENT_TIMESTAMP
+        WHERE run_id=? AND seq=?;""", [(status, res, run_id, seq)])
+    else:
+        _wq.put("""
+        UPDATE run_items SET status=?, result=?, updated_at=CURRENT_TIMESTAMP
+        WHERE run_id=? AND addr=?;""", [(status, res, run_id, addr)])
+
+def finish_run(run_id):
+    with conn() as c:
+        n = c.execute("SELECT COUNT(*) FROM run_items WHERE run_id=? AND status!='OK';", (run_id,)).fetchone()[0]
+        if n == 0:
+            c.execute("UPDATE runs SET status='DONE', finished_at=CURRENT_TIMESTAMP WHERE run_id=?;", (run_id,))
+            c.commit()
+    return n  # 剩余未完成数（0 = 已标记 DONE）
+
+SCORED_COLS = ("addr", "sol_balance", "rounds", "wins", "win_rate", "total_pnl", "avg_pnl", "median_hold_s", "max_drawdown")
+
+def save_scored(run_id, mint, source, rows, topk=0, pnl=None):
+    """
+    某次打分（run）过滤排序后的结果落库：rows 为 score 的结果行（按打分阶段的名次排好，即 seq）；
+    pos 按 win_rate/rounds/avg_pnl/sol_balance 降序、seq 升序排出。同一 run 重存（续跑后再导出）整体替换
+    """
+    order = sorted(range(len(rows)), key=lambda i: (-rows[i]["win_rate"], -rows[i]["rounds"], -rows[i]["avg_pnl"],
+                                                    -(rows[i].get("sol_balance") or 0.0)))
+    with conn() as c:
+        c.execute("DELETE FROM scored WHERE run_id=?;", (run_id,))
+        c.executemany(f"""
+        INSERT OR IGNORE INTO scored(run_id, pos, seq, {", ".join(SCORED_COLS)}) VALUES(?,?,?,{",".join("?" * len(SCORED_COLS))})
+        """, [(run_id, k, i, *(rows[i].get(col) for col in SCORED_COLS)) for k, i in enumerate(order)])
+        c.execute("""
+        INSERT INTO scored_runs(run_id, token_address, source, pnl, topk, n_rows) VALUES(?,?,?,?,?,?)
+        ON CONFLICT(run_id) DO UPDATE SET pnl=excluded.pnl, topk=excluded.topk, n_rows=excluded.n_rows,
+          created_at=CURRENT_TIMESTAMP;
+        """, (run_id, mint, source, pnl, topk, len(rows)))
+        c.commit()
+
+def scored_runs(mint, sources, all_runs=False):
+    """
+    [(run_id, source, topk)]：每个 source 最近一次（all_runs=True 为全部，新→旧）的打分结果，按 sources 顺序排列；
+    mint 可以是前缀，为空时不限 mint
+    """
+    out = []
+    with conn() as c:
+        for src in sources:
+            out.extend(c.execute(*_scored_runs_sql(mint, src, all_runs)).fetchall())
+    return out
+
+def _scored_runs_sql(mint, source, all_runs):
+    # (sql, args)：scored_runs 与 hot_queries 共用
+    return (f"""
+    SELECT run_id, source, topk FROM scored_runs WHERE {"token_address GLOB ? AND " if mint else ""}source=?
+    ORDER BY created_at DESC, rowid DESC {"" if all_runs else "LIMIT 1"};
+    """, ((mint + "*",) if mint else ()) + (source,))
+
+def query_scored(run_id, min_rounds=None, min_win_rate=None, min_avg_pnl=None, max_drawdown=None,
+                 min_sol=None, max_sol=None, null_sol=None, exclude_runs=(), limit=None):
+    """
+    某 run 的打分行（dict，列同 SCORED_COLS），条件在 SQL 里过滤，按 pos（win_rate/rounds/avg_pnl/sol_balance 降序、名次升序）返回。
+    null_sol：没有余额（NULL）的行在余额条件里按该值算；为 None 时余额条件对它们不生效。
+    exclude_runs：这些 run 里出现过的地址不返回（多个 run 合并时“新的覆盖旧的”）。
+    """
+    with conn() as c:
+        cur = c.execute(*_query_scored_sql(run_id, min_rounds, min_win_rate, min_avg_pnl, max_drawdown,
+                                           min_sol, max_sol, null_sol, exclude_runs, limit))
+        return [dict(zip(SCORED_COLS, r)) for r in cur.fetchall()]
+
+def _query_scored_sql(run_id, min_rounds=None, min_win_rate=None, min_avg_pnl=None, max_drawdown=None,
+                      min_sol=None, max_sol=None, null_sol=None, exclude_runs=(), limit=None):
+    # (sql, args)：query_scored 与 hot_queries 共用
+    where, args = ["run_id=?"], [run_id]
+    if min_win_rate is not None:
+        # pos 顺序下 win_rate 不增：第一行低于门槛处之后不必再扫
+        where.append("pos < COALESCE((SELECT pos FROM scored WHERE run_id=? AND win_rate<? ORDER BY pos LIMIT 1), 1 << 62)")
+        args.extend((run_id, min_win_rate))
+    for sql, v in (("win_rate>=?", min_win_rate), ("rounds>=?", min_rounds), ("avg_pnl>=?", min_avg_pnl),
+                   ("max_drawdown>=?", max_drawdown)):
+        if v is not None:
+            where.append(sql); args.append(v)
+    for op, v in ((">=", min_sol), ("<=", max_sol)):
+        if v is None:
+            continue
+        if null_sol is None:
+            where.append(f"(sol_balance IS NULL OR sol_balance{op}?)"); args.append(v)
+        else:
+            where.append(f"COALESCE(sol_balance, ?){op}?"); args.extend((null_sol, v))
+    if exclude_runs:
+        where.append(f"NOT EXISTS (SELECT 1 FROM scored n WHERE n.run_id IN ({','.join('?' * len(exclude_runs))}) AND n.addr=scored.addr)")
+        args.extend(exclude_runs)
+    return (f"""
+    SELECT {", ".join(SCORED_COLS)} FROM scored WHERE {" AND ".join(where)} ORDER BY pos LIMIT ?;
+    """, tuple(args) + (limit if limit else -1,))
+
+def scored_top(run_id, topk):
+    # 该 run 名次前 topk 的地址（即当时 *_top_*.txt 的内容）
+    with conn() as c:
+        return [r[0] for r in c.execute(SQL_SCORED_TOP, (run_id, topk))]
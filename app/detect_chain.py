@@ -1,4 +1,5 @@
 import os, re, requests, math, binascii
+from .evm_index import shared_index, REORG_BLOCKS
 
 # ---------- 读取环境：多键名 & 多端点 ----------
 def get_rpc_list(chain_key: str):
@@ -91,12 +92,25 @@ def probe_erc20_strict(rpc_url: str, token: str, require_code=True):
     }
     return (erc20_ok, ts, dec, sym, details)
 
-def count_transfers(rpc_url: str, addr: str, tip: int, windows=(200_000, 100_000, 50_000, 10_000)) -> tuple[int, int]:
+def count_transfers(rpc_url: str, addr: str, tip: int, windows=(200_000, 100_000, 50_000, 10_000),
+                    chain: str = None) -> tuple[int, int]:
+    """
+    窗口内 Transfer 条数。给了 chain 时先查本地索引（evm_index）：已覆盖就只现拉最近 REORG_BLOCKS 个块；
+    远端查到的结果也顺手写进索引，后面的 holders_recent/early_buyers 直接复用。
+    """
     if tip <= 0: 
         return (-1, 0)
     topic = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+    idx = shared_index() if chain else None
+    safe = tip - REORG_BLOCKS
     for w in windows:
         from_blk = max(0, tip - w)
+        if idx is not None and from_blk <= safe and idx.covers(chain, addr, from_blk, safe):
+            # 索引只到 safe：最近 REORG_BLOCKS 个块现拉计数（拉不到就走下面的整窗远端查询）
+            tail = rpc_call(rpc_url, "eth_getLogs", [{"fromBlock": hex(safe + 1), "toBlock": "latest",
+                                                      "address": addr, "topics": [topic]}], timeout=10)
+            if isinstance(tail, list):
+                return (idx.count(chain, addr, from_blk, safe) + len(tail), w)
         p = [{
             "fromBlock": hex(from_blk),
             "toBlock":   "latest",
@@ -105,6 +119,8 @@ def count_transfers(rpc_url: str, addr: str, tip: int, windows=(200_000, 100_000
         }]
         res = rpc_call(rpc_url, "eth_getLogs", p, timeout=10)
         if isinstance(res, list):
+            if idx is not None and from_blk <= safe:
+                idx.ingest(chain, addr, from_blk, safe, res)
             return (len(res), w)
     return (-1, 0)
 
@@ -115,7 +131,7 @@ def try_chain(chain_name: str, token: str):
     for u in urls or [""]:
         tip = get_tip(u) if u else 0
         erc20_ok, ts, dec, sym, d = probe_erc20_strict(u, token, require_code=True) if tip>0 else (False,0,-1,"",{"code_ok":False,"dec_hex_len":0,"ts_hex_len":0})
-        nlogs, used_w = count_transfers(u, token, tip)
+        nlogs, used_w = count_transfers(u, token, tip, chain=chain_name)
         score = 0
         if tip <= 0: score -= 100
         if erc20_ok: score += 30
@@ -1,7 +1,9 @@
 from .db import upsert_pool, add_candidates
 from .rpc import SolRpc
-from .solana_spl import recent_token_owners
+from .holders import top_holders
 from .txscan import find_early_buyers
+from .t0 import estimate_t0
+from .mintscan import early_buyers_by_mint, EarlyScanError
 
 def import_token(chain: str, mint: str, amm="raydium", base="USDC", quote="SOL", source="manual"):
     """
@@ -12,15 +14,27 @@ def import_token(chain: str, mint: str, amm="raydium", base="USDC", quote="SOL",
 def scan_candidates_for_mint(chain: str, mint: str, rpc: SolRpc, topn=200, mode="early"):
     """
     入口层扫描候选地址：
-      - mode='holders'：基于 Token Accounts 的当前持有人（amount>0）
-      - mode='early'  ：基于 ATA 交易回放选“早期净买入者”
+      - mode='holders'：当前持仓最大的 topn 个 owner（持有者快照，TTL 内复用）
+      - mode='early'  ：翻 mint/金库在 T0 窗口内的签名流选“早期净买入者”；T0 未知或窗口扫描不完整时退回 ATA 逐个回放
     """
     if mode == "holders":
-        owners = recent_token_owners(rpc, mint, topn=topn)
+        owners = top_holders(rpc, mint, topn=topn)
         add_candidates(chain, mint, owners, source="mint_scan")
         return owners
     elif mode == "early":
-        base = recent_token_owners(rpc, mint, topn=topn*3)  # 扩一圈基础样本
+        try: t0 = estimate_t0(rpc, mint)
+        except Exception: t0 = None
+        if t0 is not None:
+            try:
+                hits = early_buyers_by_mint(rpc, mint, t0)
+            except EarlyScanError as e:
+                print(f"[early] window scan incomplete, fallback to per-owner replay: {e}", flush=True)
+                hits = None
+            if hits is not None:
+                early = [o for (o,_,_) in hits[:min(100, topn)]]
+                add_candidates(chain, mint, early, source="early_buyers")
+                return early
+        base = top_holders(rpc, mint, topn=topn*3)  # 扩一圈基础样本
         early = find_early_buyers(rpc, mint, base, topn=min(100, topn))
         add_candidates(chain, mint, early, source="early_buyers")
         return early
@@ -0,0 +1,213 @@
+# app/evm_index.py
+# 本地 ERC-20 Transfer 日志索引（按 chain × token）：
+#   - 存储：data/evmlogs.sqlite（独立文件，不与 db.sqlite 抢锁），解码后的 (block, log_index, tx, from, to, amount)
+#   - 覆盖范围：每个 token 记录一段连续的已索引区间 [lo, hi]；只向两端扩展，保证区间内没有空洞
+#   - 增量：首次回填一次，之后只从 hi+1 追到 tip - REORG_BLOCKS；最近几个块不落库，查询时现拉
+#   - holders_recent / estimate_t0_by_first_transfer / early_buyers / detect_chain.count_transfers 都从这里查
+import os, time, sqlite3, threading
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+INDEX_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "evmlogs.sqlite"))
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+REORG_BLOCKS = int(os.environ.get("EVM_INDEX_REORG", "20") or 20)  # 离 tip 这么近的块不落库（可能回滚）
+SLICE = 50_000                                                     # 每抓一片就落库，中断后从断点续
+
+Row = Tuple[int, int, str, str, str, int]  # (block, log_index, tx, from, to, amount)
+
+def _h(v) -> int:
+    try: return int(v, 16) if isinstance(v, str) else int(v or 0)
+    except ValueError: return 0
+
+def decode_transfer(it: dict) -> Optional[Row]:
+    topics = it.get("topics") or []
+    if len(topics) < 3 or not all(isinstance(t, str) and len(t) == 66 for t in topics[1:3]):
+        return None
+    data = it.get("data") or "0x"
+    return (_h(it.get("blockNumber")), _h(it.get("logIndex")), it.get("transactionHash") or "",
+            "0x" + topics[1][-40:].lower(), "0x" + topics[2][-40:].lower(), _h(data[:66]) if len(data) > 2 else 0)
+
+class TransferIndex:
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._con = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        self._con.executescript("""
+        CREATE TABLE IF NOT EXISTS transfers (
+          chain      TEXT NOT NULL,
+          token      TEXT NOT NULL,
+          block      INTEGER NOT NULL,
+          log_index  INTEGER NOT NULL,
+          tx         TEXT,
+          from_addr  TEXT NOT NULL,
+          to_addr    TEXT NOT NULL,
+          amount     TEXT NOT NULL,          -- uint256 十进制字符串（超出 SQLite INTEGER 范围）
+          PRIMARY KEY (chain, token, block, log_index)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_transfers_to ON transfers(chain, token, to_addr, block);
+        CREATE TABLE IF NOT EXISTS token_t0 (
+          chain        TEXT NOT NULL,
+          token        TEXT NOT NULL,
+          deploy_block INTEGER,              -- 合约部署块（二分 eth_getCode 得到；拿不到为 NULL）
+          t0_block     INTEGER NOT NULL,     -- 第一条 Transfer 所在块
+          updated_at   INTEGER NOT NULL,
+          PRIMARY KEY (chain, token)
+        );
+        CREATE TABLE IF NOT EXISTS index_state (
+          chain      TEXT NOT NULL,
+          token      TEXT NOT NULL,
+          lo         INTEGER NOT NULL,       -- 已索引的连续区间 [lo, hi]
+          hi         INTEGER NOT NULL,
+          updated_at INTEGER NOT NULL,
+          PRIMARY KEY (chain, token)
+        );""")
+        self.fetched_blocks = 0
+
+    # ---- 覆盖范围 ----
+    def state(self, chain: str, token: str) -> Optional[Tuple[int, int]]:
+        with self._lock:
+            r = self._con.execute("SELECT lo, hi FROM index_state WHERE chain=? AND token=?",
+                                  (chain, token.lower())).fetchone()
+        return (r[0], r[1]) if r else None
+
+    def covers(self, chain: str, token: str, lo: int, hi: int) -> bool:
+        st = self.state(chain, token)
+        return st is not None and st[0] <= lo and hi <= st[1]
+
+    def ingest(self, chain: str, token: str, lo: int, hi: int, logs: Iterable[dict]) -> bool:
+        """
+        写入 [lo, hi] 的完整日志（调用方保证这段区间抓全了）。
+        只有与已有区间相接/重叠（或还没有区间）时才扩展覆盖范围；否则不落库，返回 False。
+        """
+        token = token.lower()
+        with self._lock:
+            st = self.state(chain, token)
+            if st is not None and (hi < st[0] - 1 or lo > st[1] + 1):
+                return False
+            rows = []
+            for it in logs:
+                r = decode_transfer(it)
+                if r and lo <= r[0] <= hi:
+                    rows.append((chain, token, r[0], r[1], r[2], r[3], r[4], str(r[5])))
+            nlo, nhi = (lo, hi) if st is None else (min(lo, st[0]), max(hi, st[1]))
+            self._con.execute("BEGIN")
+            self._con.executemany("INSERT OR IGNORE INTO transfers VALUES(?,?,?,?,?,?,?,?)", rows)
+            self._con.execute("""INSERT INTO index_state(chain, token, lo, hi, updated_at) VALUES(?,?,?,?,?)
+                                 ON CONFLICT(chain, token) DO UPDATE SET lo=excluded.lo, hi=excluded.hi,
+                                 updated_at=excluded.updated_at""", (chain, token, nlo, nhi, int(time.time())))
+            self._con.execute("COMMIT")
+            return True
+
+    # ---- 回填 / 追块 ----
+    def _fetch(self, rpc, token: str, a: int, b: int, log=None):
+        logs = rpc.get_logs_chunked(a, b, token, [TRANSFER_TOPIC])
+        self.fetched_blocks += b - a + 1
+        self.ingest(rpc.chain, token, a, b, logs)
+        if log: log(f"[index] {rpc.chain}:{token[:8]}… [{a},{b}] +{len(logs)} logs")
+
+    def sync(self, rpc, token: str, lo: int, tip: Optional[int] = None, log=None) -> Tuple[int, int]:
+        """
+        保证 [lo, tip - REORG_BLOCKS] 已索引：向前回填缺的头部，向后追到安全高度。返回新的覆盖区间。
+        """
+        tip = rpc.block_number() if tip is None else tip
+        safe = max(0, tip - REORG_BLOCKS)
+        lo = max(0, min(lo, safe))
+        st = self.state(rpc.chain, token)
+        if st is None:
+            for a in range(lo, safe + 1, SLICE):
+                self._fetch(rpc, token, a, min(a + SLICE - 1, safe), log)
+        else:
+            # 头部往前补：从 st.lo-1 倒着一片片补，每片都与已有区间相接
+            b = st[0] - 1
+            while b >= lo:
+                a = max(lo, b - SLICE + 1)
+                self._fetch(rpc, token, a, b, log); b = a - 1
+            for a in range(st[1] + 1, safe + 1, SLICE):
+                self._fetch(rpc, token, a, min(a + SLICE - 1, safe), log)
+        return self.state(rpc.chain, token) or (lo, lo - 1)
+
+    # ---- T0 缓存 ----
+    def get_t0(self, chain: str, token: str) -> Optional[Tuple[Optional[int], int]]:
+        with self._lock:
+            r = self._con.execute("SELECT deploy_block, t0_block FROM token_t0 WHERE chain=? AND token=?",
+                                  (chain, token.lower())).fetchone()
+        return (r[0], r[1]) if r else None
+
+    def set_t0(self, chain: str, token: str, deploy_block: Optional[int], t0_block: int):
+        with self._lock:
+            self._con.execute("""INSERT INTO token_t0(chain, token, deploy_block, t0_block, updated_at) VALUES(?,?,?,?,?)
+                                 ON CONFLICT(chain, token) DO UPDATE SET deploy_block=excluded.deploy_block,
+                                 t0_block=excluded.t0_block, updated_at=excluded.updated_at""",
+                              (chain, token.lower(), deploy_block, t0_block, int(time.time())))
+
+    # ---- 查询 ----
+    def rows(self, chain: str, token: str, lo: int, hi: int) -> List[Row]:
+        with self._lock:
+            cur = self._con.execute("""
+            SELECT block, log_index, tx, from_addr, to_addr, amount FROM transfers
+            WHERE chain=? AND token=? AND block BETWEEN ? AND ? ORDER BY block, log_index""",
+                                    (chain, token.lower(), lo, hi))
+            return [(b, i, tx, f, t, int(a)) for b, i, tx, f, t, a in cur.fetchall()]
+
+    def first_block(self, chain: str, token: str) -> Optional[int]:
+        with self._lock:
+            r = self._con.execute("SELECT MIN(block) FROM transfers WHERE chain=? AND token=?",
+                                  (chain, token.lower())).fetchone()
+        return r[0] if r and r[0] is not None else None
+
+    def count(self, chain: str, token: str, lo: int, hi: int) -> int:
+        with self._lock:
+            return self._con.execute("SELECT COUNT(*) FROM transfers WHERE chain=? AND token=? AND block BETWEEN ? AND ?",
+                                     (chain, token.lower(), lo, hi)).fetchone()[0]
+
+    def query(self, rpc, token: str, lo: int, hi: int, log=None) -> List[Row]:
+        """
+        [lo, hi] 的 Transfer（按块序）：已落库部分本地查；离 tip 太近未落库的尾巴现拉，不入库。
+        若 [lo, hi] 整段早于已索引区间（如老币的 T0 窗口），直接现拉这一小段，不为它回填中间的大空档。
+        """
+        st0 = self.state(rpc.chain, token)
+        if st0 is not None and hi < st0[0] - 1:
+            logs = rpc.get_logs_chunked(lo, hi, token, [TRANSFER_TOPIC])
+            return [r for r in (decode_transfer(x) for x in logs) if r]
+        st = self.sync(rpc, token, lo, log=log)
+        out = self.rows(rpc.chain, token, lo, min(hi, st[1]))
+        if hi > st[1]:
+            tail = rpc.get_logs_chunked(max(lo, st[1] + 1), hi, token, [TRANSFER_TOPIC])
+            out.extend(r for r in (decode_transfer(x) for x in tail) if r)
+        return out
+
+    def iter_rows(self, rpc, token: str, lo: int, hi: int, step: int = SLICE, tip: Optional[int] = None) -> Iterator[Row]:
+        """
+        [lo, hi] 的 Transfer 按块序逐片（step 块）产出，调用方凑够了就可以停：不像 query 那样先把整段回填完。
+        已索引的部分本地查；没索引的部分现拉，其中早于 tip - REORG_BLOCKS 的顺手落库（与已有区间相接时才扩展覆盖）。
+        """
+        tip = rpc.block_number() if tip is None else tip
+        safe = max(0, tip - REORG_BLOCKS)
+        a = lo
+        while a <= hi:
+            b = min(a + max(1, step) - 1, hi)
+            st = self.state(rpc.chain, token)
+            if st is not None and st[0] <= a <= st[1]:
+                yield from self.rows(rpc.chain, token, a, min(b, st[1]))
+                c = st[1] + 1
+            else:
+                c = a
+            if c <= b:
+                logs = rpc.get_logs_chunked(c, b, token, [TRANSFER_TOPIC])
+                self.fetched_blocks += b - c + 1
+                if c <= safe:
+                    self.ingest(rpc.chain, token, c, min(b, safe), logs)
+                yield from (r for r in (decode_transfer(x) for x in logs) if r)
+            a = b + 1
+
+_shared: Optional[TransferIndex] = None
+_shared_lock = threading.Lock()
+
+def shared_index() -> TransferIndex:
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = TransferIndex()
+        return _shared
@@ -0,0 +1,175 @@
+# app/evm_logs.py
+# eth_getLogs 并发区间抓取：
+#   - [from_block, to_block] 按 span 切片，线程池并发抓取，结果按 (blockNumber, logIndex) 合并
+#   - provider 拒绝区间（HTTP 400/413、“区间过大”错误）→ 该片对半拆开重抓，并把上限记到 data/logspan.json
+#   - “结果过多”（只取决于这个 token 在这段里有多忙）→ 只把这一片对半拆，不改 provider 的上限
+#   - 超时/5xx/限流/401/403 等其它错误 → 同一片退避重试，不拆；重试用尽抛 LogRangeError（不再静默丢区间）
+#   - 学到的 span 按端点池（链 + host 列表）持久化，下次运行直接从已知可用的跨度开始；
+#     被拒记录 EVM_LOG_SPAN_REPROBE_S 秒后过期，重新往上试探
+import os, json, time, random, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+import requests
+from .jsonrpc import RpcError
+
+SPAN_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "logspan.json"))
+SPAN_INIT = int(os.environ.get("EVM_LOG_SPAN", "4000") or 4000)
+SPAN_CAP  = int(os.environ.get("EVM_LOG_SPAN_MAX", "100000") or 100000)
+WORKERS   = int(os.environ.get("EVM_LOG_WORKERS", "4") or 4)
+RETRIES   = 4
+REPROBE_S = float(os.environ.get("EVM_LOG_SPAN_REPROBE_S", "86400") or 0)   # 被拒记录的有效期；0 = 永不过期
+
+class LogRangeError(RuntimeError):
+    """某些区间重试用尽仍失败（ranges 为 [(lo, hi)]）"""
+    def __init__(self, ranges: List[Tuple[int, int]], err: BaseException):
+        self.ranges = ranges
+        super().__init__(f"getLogs failed for {len(ranges)} range(s), first={ranges[:1]}: {err}")
+
+class SpanStore:
+    """
+    每个 provider 的区间上限：ok = 已确认可用的最大跨度，bad = 被拒绝过的最小跨度（bad_at 为被拒时间）。
+    单进程内线程安全；落盘为一个小 JSON（读-改-写，跨进程最后写入者生效即可）。
+    """
+    def __init__(self, path: str = SPAN_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f: self.data: Dict[str, Dict[str, Optional[int]]] = json.load(f)
+        except Exception:
+            self.data = {}
+
+    def span(self, key: str) -> int:
+        with self._lock:
+            d = self.data.get(key)
+            if not d: return SPAN_INIT
+            ok, bad = d.get("ok") or SPAN_INIT, d.get("bad")
+            # 从未被拒绝过（或被拒已过期）就每次运行放大一点试探；被拒绝过则停在 ok
+            if bad is not None and REPROBE_S > 0 and time.time() - (d.get("bad_at") or 0) >= REPROBE_S:
+                bad = None
+            return min(SPAN_CAP, ok * 2) if bad is None else ok
+
+    def accepted(self, key: str, span: int):
+        with self._lock:
+            d = self.data.setdefault(key, {"ok": None, "bad": None})
+            if d["bad"] is not None and span >= d["bad"]:
+                d["bad"] = None; d.pop("bad_at", None)   # 过期后重新试探成功：上限已经放开
+            if d["ok"] is None or span > d["ok"]:
+                d["ok"] = span
+
+    def rejected(self, key: str, span: int):
+        with self._lock:
+            d = self.data.setdefault(key, {"ok": None, "bad": None})
+            d["bad"] = span if d["bad"] is None else min(d["bad"], span)
+            d["bad_at"] = int(time.time())
+            if d["ok"] is not None and d["ok"] >= span:
+                d["ok"] = max(1, span // 2)
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f: json.dump(self.data, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+
+_store: Optional[SpanStore] = None
+_store_lock = threading.Lock()
+
+def span_store() -> SpanStore:
+    global _store
+    with _store_lock:
+        if _store is None: _store = SpanStore()
+        return _store
+
+def provider_key(rpc) -> str:
+    # 端点池一起算：池内任一端点拒绝即视为该池的上限（日志/落盘只记 host，不记 key）
+    return f"{rpc.chain}:" + ",".join(sorted({urlsplit(u).netloc or u for u in rpc.urls}))
+
+# 只认消息里的提示：同一错误码（-32602/-32005）也可能是参数错误，对半拆只会白白放大请求数
+_RESULTS_HINT = ("more than", "too many", "results", "response size")
+_RANGE_HINT = ("range", "too large", "exceed")
+# 401/403（key 过期/无权限）等其它 4xx 与区间无关，拆了只会把请求数放大上万倍
+RANGE_HTTP_CODES = (400, 413)
+
+def _split_kind(e: BaseException) -> Optional[str]:
+    """
+    该错误要不要对半拆：
+      "range"   - provider 拒绝这么大的区间（HTTP 400/413，或 JSON-RPC 错误带“区间过大”字样）→ 拆，并记入 provider 上限
+      "results" - 结果数/响应体过大（取决于 token 在该区间的活跃度）→ 只拆这一片
+      None      - 其它（限流、鉴权、超时……）→ 不拆，走重试
+    """
+    if isinstance(e, requests.HTTPError):
+        code = e.response.status_code if e.response is not None else 0
+        return "range" if code in RANGE_HTTP_CODES else None
+    if isinstance(e, RpcError):
+        if e.rate_limited: return None
+        msg = (e.message or "").lower()
+        if any(h in msg for h in _RESULTS_HINT): return "results"
+        if any(h in msg for h in _RANGE_HINT): return "range"
+    return None
+
+def _log_key(x: dict) -> Tuple[int, int]:
+    def h(v):
+        try: return int(v, 16) if isinstance(v, str) else int(v or 0)
+        except ValueError: return 0
+    return h(x.get("blockNumber")), h(x.get("logIndex"))
+
+def fetch_logs(rpc, from_block: int, to_block: int, address: str, topics: list,
+               workers: Optional[int] = None, span: Optional[int] = None, min_span: int = 1,
+               retries: int = RETRIES, store: Optional[SpanStore] = None) -> List[dict]:
+    """
+    并发抓取 [from_block, to_block] 的日志，按 (blockNumber, logIndex) 升序返回。
+    span 不给则用该 provider 学到的跨度；workers 为同时在途的区间数（默认 EVM_LOG_WORKERS=4）。
+    """
+    if to_block < from_block: return []
+    store = store or span_store()
+    key = provider_key(rpc)
+    span = max(min_span, span or store.span(key))
+    todo = [(lo, min(lo + span - 1, to_block), 0) for lo in range(from_block, to_block + 1, span)]
+    out: Dict[Tuple[int, int], List[dict]] = {}
+    failed: List[Tuple[int, int]] = []
+    last_err: Optional[BaseException] = None
+    changed = False
+
+    def _one(lo, hi):
+        logs = rpc.get_logs(lo, hi, address, topics)
+        return logs if isinstance(logs, list) else []
+
+    n = max(1, workers or WORKERS)
+    with ThreadPoolExecutor(max_workers=n, thread_name_prefix="getlogs") as ex:
+        running = {}
+        while todo or running:
+            while todo and len(running) < n:
+                lo, hi, tries = todo.pop(0)
+                running[ex.submit(_one, lo, hi)] = (lo, hi, tries)
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for f in done:
+                lo, hi, tries = running.pop(f)
+                width = hi - lo + 1
+                e = f.exception()
+                if e is None:
+                    out[(lo, hi)] = f.result()
+                    store.accepted(key, width); changed = True
+                    continue
+                kind = _split_kind(e)
+                if kind and width > min_span:
+                    # 区间过大：记下上限（结果过多只拆这一片），对半拆开放回队首（保持大致的块序）
+                    if kind == "range":
+                        store.rejected(key, width); changed = True
+                    mid = lo + width // 2
+                    todo[:0] = [(lo, mid - 1, 0), (mid, hi, 0)]
+                elif tries < retries:
+                    time.sleep(random.uniform(0, 0.3 * (2 ** tries)))
+                    todo.append((lo, hi, tries + 1))
+                else:
+                    failed.append((lo, hi)); last_err = e
+    if changed:
+        try: store.save()
+        except Exception: pass
+    if failed:
+        raise LogRangeError(sorted(failed), last_err)
+    res: List[dict] = []
+    for k in sorted(out):
+        res.extend(out[k])
+    res.sort(key=_log_key)
+    return res
@@ -1,43 +1,51 @@
-import os, time, math, requests
+from typing import List, Optional
+from .aio import AsyncCallMixin, DEFAULT_INFLIGHT, make_session, make_gate
+from .jsonrpc import RpcError, batch_call, ok_or_none
+from .rpcpool import shared_pool, urls_from_env
+from .evm_logs import fetch_logs
 
-def _pick_rpc(chain: str):
-    # 支持多环境名 + 多端点，逗号/分号分隔
+# 延迟敏感的单条读：允许对冲（eth_getLogs 等重请求不对冲）
+HEDGE_METHODS = {"eth_blockNumber", "eth_getBalance", "eth_getCode", "eth_call", "eth_getBlockByNumber"}
+
+def _rpc_urls(chain: str) -> List[str]:
+    # 支持多环境名 + 多端点，逗号/分号分隔；全部交给端点池
     KEYS = {
         "bsc":  ["BSC_RPC_URLS","BSC_RPC_URL","BSC_RPC","BSC_HTTP_URL","BSCRPCURL"],
         "base": ["BASE_RPC_URLS","BASE_RPC_URL","BASE_RPC","BASE_HTTP_URL","BASERPCURL"],
     }[chain]
-    urls=[]
-    for k in KEYS:
-        v=os.environ.get(k,"").strip()
-        if not v: continue
-        for u in v.replace(";",",").split(","):
-            u=u.strip()
-            if u: urls.append(u)
-    # 去重
-    seen=set(); out=[]
-    for u in urls:
-        if u not in seen:
-            seen.add(u); out.append(u)
+    out = urls_from_env(KEYS)
     if not out: raise ValueError(f"no RPC url for {chain}")
-    return out[0]  # 先用第一个
+    return out
 
 class EvmRpc:
-    def __init__(self, chain: str):
+    def __init__(self, chain: str, max_inflight=None, session=None, gate=None):
         chain = chain.lower()
         if chain not in ("bsc","base"):
             raise ValueError(f"unsupported evm chain: {chain}")
         self.chain = chain
-        self.url   = _pick_rpc(chain)
+        self.urls  = _rpc_urls(chain)
+        self.url   = self.urls[0]
         self.timeout = 15
+        self.max_inflight = max(1, max_inflight or DEFAULT_INFLIGHT) * len(self.urls)  # 每个端点计
+        self.gate = gate or make_gate(self.max_inflight)
+        self.session = session or make_session(self.max_inflight)
+        self.pool = shared_pool(self.urls)
+
+    def _post(self, payload, hedge: bool = False):
+        # 端点池选路；429/503 由限速器退避重试，连接错误/5xx 换端点；4xx 照旧直接抛
+        with self.gate:
+            return self.pool.post(lambda u: self.session.post(u, json=payload, timeout=self.timeout), hedge=hedge)
 
     def call(self, method: str, params: list):
-        r = requests.post(self.url, json={"jsonrpc":"2.0","id":1,"method":method,"params":params}, timeout=self.timeout)
-        r.raise_for_status()  # 若 400/500 会直接抛
-        j = r.json()
+        j = self._post({"jsonrpc":"2.0","id":1,"method":method,"params":params}, hedge=method in HEDGE_METHODS)
         if "error" in j:
-            raise RuntimeError(f"rpc error: {j['error']}")
+            raise RpcError(j["error"])
         return j.get("result")
 
+    def batch_call(self, method: str, params_list: List[list], max_batch: Optional[int] = None) -> list:
+        # 数组批量：分片发送；单项失败以 RpcError 原位返回，不影响同批其它项
+        return batch_call(self._post, method, params_list, max_batch, single=self.call, key=tuple(self.urls))
+
     # 基础方法
     def block_number(self) -> int:
         x = self.call("eth_blockNumber", [])
@@ -49,6 +57,18 @@ class EvmRpc:
         # 返回本地币（BNB/ETH）单位
         return wei / 1e18
 
+    def get_balances(self, addrs: List[str]) -> List[Optional[float]]:
+        # 批量 eth_getBalance，失败项为 None
+        res = ok_or_none(self.batch_call("eth_getBalance", [[a, "latest"] for a in addrs]))
+        return [None if w is None else (int(w,16) if isinstance(w,str) else int(w)) / 1e18 for w in res]
+
+    # 历史状态读取（需要 archive 节点；非 archive 节点对旧块会返回 RpcError）
+    def get_code(self, addr: str, block="latest") -> str:
+        return self.call("eth_getCode", [addr, block if isinstance(block, str) else hex(block)]) or "0x"
+
+    def eth_call(self, to: str, data: str, block="latest"):
+        return self.call("eth_call", [{"to": to, "data": data}, block if isinstance(block, str) else hex(block)])
+
     # 原始一次性 getLogs（可能被 provider 拒绝）
     def get_logs(self, from_block: int, to_block: int, address: str, topics: list, timeout=None):
         p=[{
@@ -59,36 +79,32 @@ class EvmRpc:
         }]
         return self.call("eth_getLogs", p)
 
-    # 安全分片版：自动按区间切块，出错降块宽重试
+    # 并发分片版（app/evm_logs.py）：按学到的跨度切片并发抓取，拒绝则对半拆，失败区间重试而不是丢弃
     def get_logs_chunked(self, from_block: int, to_block: int, address: str, topics: list,
-                         max_span: int = 4000, min_span: int = 256, backoff: float=0.3):
-        if to_block < from_block:
-            return []
-        res=[]
-        start = from_block
-        span = max_span
-        while start <= to_block:
-            end = min(start + span - 1, to_block)
-            try:
-                logs = self.get_logs(start, end, address, topics)
-                if isinstance(logs, list):
-                    res.extend(logs)
-                else:
-                    # 不应出现，但做兜底
-                    time.sleep(backoff)
-                # 成功了，尝试扩张一点（自适应）
-                start = end + 1
-                if span < max_span:
-                    span = min(max_span, span*2)
-            except requests.HTTPError as e:
-                # provider 400/timeout：缩小块宽重试
-                if span <= min_span:
-                    # 块宽已缩到底，跳过这个区间防死锁
-                    start = end + 1
-                else:
-                    span = max(min_span, span // 2)
-                time.sleep(backoff)
-            except Exception:
-                time.sleep(backoff)
-                start = end + 1
-        return res
+                         max_span: Optional[int] = None, min_span: int = 1, workers: Optional[int] = None):
+        return fetch_logs(self, from_block, to_block, address, topics, workers=workers, span=max_span, min_span=min_span)
+
+class AsyncEvmRpc(AsyncCallMixin, EvmRpc):
+    """
+    asyncio 版 EvmRpc：get_logs 等方法返回协程；max_inflight 为同时在途的请求上限。
+    需要后处理的 block_number/get_balance 与多步的 get_logs_chunked 在这里单独覆写。
+    """
+    def __init__(self, chain: str, max_inflight=None):
+        super().__init__(chain, max_inflight=max_inflight)
+        self.sync = EvmRpc(self.chain, session=self.session, gate=self.gate)
+        self._init_async(self.max_inflight)
+
+    async def block_number(self) -> int:
+        x = await self.call("eth_blockNumber", [])
+        return int(x,16) if isinstance(x,str) else int(x)
+
+    async def get_balance(self, addr: str) -> float:
+        w = await self.call("eth_getBalance", [addr, "latest"])
+        wei = int(w,16) if isinstance(w,str) else int(w)
+        return wei / 1e18
+
+    async def get_balances(self, addrs: List[str]) -> List[Optional[float]]:
+        return await self._run(self.sync.get_balances, addrs)
+
+    async def get_logs_chunked(self, from_block: int, to_block: int, address: str, topics: list, **kw):
+        return await self._run(lambda: self.sync.get_logs_chunked(from_block, to_block, address, topics, **kw))
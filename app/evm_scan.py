@@ -1,7 +1,8 @@
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import os, re
 
 from .evm_rpc import EvmRpc
+from .evm_index import shared_index
 
 # ERC20 Transfer(address indexed from, address indexed to, uint256)
 TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
@@ -16,54 +17,112 @@ def _topic_addr(addr: str) -> str:
     return "0x" + ("0"*24) + addr.lower()[2:]
 
 def holders_recent(chain: str, rpc: EvmRpc, token: str, lookback_blocks=120_000, step=4000, topn=800) -> List[str]:
+    """
+    最近 lookback_blocks 内出现过的 from/to 地址（按块序，去重，最多 topn 个）。
+    日志走本地索引（evm_index.iter_rows）：从 lookback 起点按 step 块一片片往后，凑够 topn 就停，
+    冷启动不会先把整段 lookback 回填完；抓过的片顺手落库，之后直接本地查。
+    """
     tip = rpc.block_number()
     lo  = max(0, tip - lookback_blocks)
-    addrs=set()
-    start = lo
-    while start <= tip and len(addrs) < topn:
-        end = min(start + step - 1, tip)
-        logs = rpc.get_logs_chunked(start, end, token, [TRANSFER_TOPIC])
-        for it in logs:
-            topics = it.get("topics") or []
-            if len(topics) < 3: continue
-            # topics[1]=from, topics[2]=to
-            for t in topics[1:3]:
-                if isinstance(t,str) and len(t)==66 and t.startswith("0x"):
-                    a = "0x"+t[-40:]
-                    addrs.add(a)
-                    if len(addrs) >= topn: break
-        start = end + 1
+    addrs = {}
+    for _, _, _, frm, to, _ in shared_index().iter_rows(rpc, token, lo, tip, step=step, tip=tip):
+        for a in (frm, to):
+            addrs.setdefault(a, None)
+        if len(addrs) >= topn: break
     return list(addrs)[:topn]
 
+def _bisect_first(lo: int, hi: int, pred) -> int:
+    # pred 单调（lo 处 False，hi 处 True）：返回第一个 pred 为 True 的块，约 log2(hi-lo) 次调用
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if pred(mid): hi = mid
+        else: lo = mid
+    return hi
+
+def find_deploy_block(rpc: EvmRpc, token: str, tip: int) -> Optional[int]:
+    """
+    二分 eth_getCode 找合约部署块（需要 archive 节点）；节点不支持历史状态或地址不是合约时返回 None。
+    """
+    has_code = lambda b: len(rpc.get_code(token, b)) > 2
+    try:
+        if not has_code(tip): return None
+        return 0 if has_code(0) else _bisect_first(0, tip, has_code)
+    except Exception:
+        return None
+
+def _total_supply(rpc: EvmRpc, token: str, block: int) -> int:
+    x = rpc.eth_call(token, "0x18160ddd", block)  # totalSupply()
+    return int(x, 16) if isinstance(x, str) and len(x) > 2 else 0
+
+def _first_transfer_from(rpc: EvmRpc, token: str, start: int, tip: int, span: int = 4000) -> Optional[int]:
+    # 从 start 往后找第一条 Transfer：窗口逐次翻倍，部署后很快首发的代币 1~2 次 getLogs 即可
+    a, w = start, max(1, span)
+    while a <= tip:
+        b = min(tip, a + w - 1)
+        logs = rpc.get_logs_chunked(a, b, token, [TRANSFER_TOPIC])
+        if logs:
+            return int(logs[0]["blockNumber"], 16)
+        a, w = b + 1, w * 2
+    return None
+
+def _t0_by_search(rpc: EvmRpc, token: str, tip: int) -> Optional[Tuple[Optional[int], int]]:
+    """
+    对数级 T0：二分 eth_getCode 得部署块 → totalSupply 在部署块已 >0（构造函数铸币）则首条 Transfer 就在附近，
+    否则再二分 totalSupply 找首次铸币块 → 最后用一次小范围 getLogs 确认。返回 (deploy_block, t0_block)。
+    """
+    deploy = find_deploy_block(rpc, token, tip)
+    if deploy is None:
+        return None
+    start = deploy
+    try:
+        if _total_supply(rpc, token, deploy) == 0 and _total_supply(rpc, token, tip) > 0:
+            start = _bisect_first(deploy, tip, lambda b: _total_supply(rpc, token, b) > 0)
+    except Exception:
+        start = deploy  # 非标准 totalSupply：从部署块往后找
+    t0 = _first_transfer_from(rpc, token, start, tip, span=16)
+    if t0 is None and start > deploy:
+        t0 = _first_transfer_from(rpc, token, deploy, start - 1)
+    return (deploy, t0) if t0 is not None else None
+
 def estimate_t0_by_first_transfer(rpc: EvmRpc, token: str, lookback=200_000, chunk=4000) -> Tuple[int,int]:
     """
-    从最早的一条 Transfer 日志估计 T0 区块。
-    使用递增小块扫描（分片），避免大跨度查询触发 400。
-    返回 (bn0, bn0)；若找不到，返回 (tip, tip)。
+    第一条 Transfer 日志所在区块（T0）。按 chain × token 缓存在本地索引里，只算一次。
+      1) 二分部署块 + totalSupply + 小范围 getLogs（几十次轻量调用，与代币年龄无关）
+      2) 节点不支持历史状态时退回：回填 [tip - lookback, …] 到本地索引后取最小块号
+    返回 (bn0, bn0)；若找不到，返回 (tip, tip)（不缓存）。chunk 仅为兼容旧调用保留。
     """
+    idx = shared_index()
+    hit = idx.get_t0(rpc.chain, token)
+    if hit is not None:
+        return (hit[1], hit[1])
     tip = rpc.block_number()
+    found = _t0_by_search(rpc, token, tip)
+    if found is not None:
+        idx.set_t0(rpc.chain, token, found[0], found[1])
+        return (found[1], found[1])
+
     lo  = max(0, tip - lookback)
-    first_bn = None
-    start = lo
-    while start <= tip:
-        end = min(start + chunk - 1, tip)
-        logs = rpc.get_logs_chunked(start, end, token, [TRANSFER_TOPIC])
-        if logs:
-            # 找到当前块段最早的一条
-            bn = min(int(x["blockNumber"],16) for x in logs if isinstance(x.get("blockNumber"), str))
-            first_bn = bn
-            break
-        start = end + 1
+    st = idx.sync(rpc, token, lo, tip=tip)
+    first_bn = idx.first_block(rpc.chain, token)
+    if first_bn is None:
+        # 安全高度之后的尾巴不落库，现拉一次
+        tail = idx.query(rpc, token, st[1] + 1, tip)
+        first_bn = tail[0][0] if tail else None
     if first_bn is None:
         return (tip, tip)
+    if st[0] == 0:
+        # 索引从创世块起完整覆盖时才是确定的 T0；否则更早的日志可能在回看窗口之外，不缓存
+        idx.set_t0(rpc.chain, token, None, first_bn)
     return (first_bn, first_bn)
 
-def early_buyers(chain: str, rpc: EvmRpc, token: str, owners: List[str], window_h: float=1.0) -> List[str]:
+def early_buyers(chain: str, rpc: EvmRpc, token: str, owners: List[str], window_h: float=1.0,
+                 t0_block: Optional[int] = None) -> List[str]:
     """
     用 T0 附近窗口统计“在窗口内首次接收该 token”的地址作为早买家。
-    不逐个 owner 回放交易，而是按 receiver 过滤 topics[2]，极大降低 RPC 压力。
+    不逐个 owner 回放交易，而是查本地 Transfer 索引里的接收方，几乎不再发 getLogs。
+    t0_block 已知时直接用，不再重新估计。
     """
-    bn0, _ = estimate_t0_by_first_transfer(rpc, token)
+    bn0 = t0_block if t0_block is not None else estimate_t0_by_first_transfer(rpc, token)[0]
     # 窗口换算成区块数
     sec = window_h * 3600.0
     avg = AVG_BLOCK_TIME.get(chain, 3.0)
@@ -72,19 +131,10 @@ def early_buyers(chain: str, rpc: EvmRpc, token: str, owners: List[str], window_
     tip = rpc.block_number()
     hi  = min(tip, bn0 + window_blocks)
 
-    # 先扫窗口内所有 Transfer 日志
-    logs = rpc.get_logs_chunked(bn0, hi, token, [TRANSFER_TOPIC])
-
-    # 只统计窗口期首次接收的人
+    # 窗口内所有 Transfer（本地索引 + 未落库的尾巴），只统计窗口期首次接收的人
     first_seen = {}
-    for it in logs:
-        topics = it.get("topics") or []
-        if len(topics) < 3: continue
-        to_topic = topics[2]
-        if not (isinstance(to_topic,str) and len(to_topic)==66): continue
-        addr = "0x"+to_topic[-40:]
-        bn   = int(it["blockNumber"],16)
-        if addr not in first_seen or bn < first_seen[addr]:
+    for bn, _, _, _, addr, _ in shared_index().query(rpc, token, bn0, hi):
+        if addr not in first_seen:
             first_seen[addr] = bn
 
     # 与候选 owners 求交集（如果 owners 为空，则把窗口首次接收者全返回）
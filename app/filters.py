@@ -1,10 +1,11 @@
 # app/filters.py
-import time
 from datetime import datetime
 from typing import Tuple
-from .db import fetch_candidates, set_list, conn
+from .db import fetch_candidates, set_list, conn, start_run, find_run, load_run_items, record_item, finish_run
+from .db import SQL_HARD_VERIFY_BATCH
 from .rpc import SolRpc, TOKEN_PROGRAM_ID
-from .insider import is_insider_like
+from .insider import InsiderSets, insider_reason
+from .aio import fan_out
 
 SYSTEM_PROGRAM = "11111111111111111111111111111111"
 KNOWN_PROGRAM_IDS = set([TOKEN_PROGRAM_ID])  # 可持续补充
@@ -45,65 +46,102 @@ def soft_filter(rpc: SolRpc, batch_limit: int = 300, verbose: bool = False) -> T
     _log(f"[SOFT] done: W={white} Wa={watch} B={black}")
     return white, watch, black
 
-def hard_verify(rpc: SolRpc, batch_limit: int = 200, verbose: bool = False, sleep_ms: int = 0) -> Tuple[int,int,int]:
+ACCOUNTS_PER_CALL = 100  # getMultipleAccounts 单次上限
+
+def _classify(v, addr: str, mint: str, rpc: SolRpc, insiders: InsiderSets) -> Tuple[str, str]:
     """
-    硬过滤（轻量版）：对 WATCH/CANDIDATE 逐个 getAccountInfo：
+    单地址硬核判定（v 为 getMultipleAccounts 里该地址的 value），返回 (status, reason)：
       - executable=False 且 owner=SystemProgram → 近似 EOA
-          - 再做 Insider 守门：命中 → BLACK；否则 → WHITE
+          - 再做 Insider 守门（该 mint 的内部人集合，每个 mint 只查一次）：命中 → BLACK；否则 → WHITE
       - 其它 owner 或可执行 → BLACK
+    """
+    if not v:
+        return "WATCH", "no_account_info"
+    executable = v.get("executable", False)
+    owner = v.get("owner", "")
+    if (executable is False) and (owner == SYSTEM_PROGRAM):
+        why = insider_reason(addr, mint, rpc, insiders)
+        if why:
+            return "BLACK", f"insider_like_{why}"
+        return "WHITE", "eoalike_not_insider"
+    return "BLACK", f"non_system_owner:{owner}"
+
+def hard_verify(rpc: SolRpc, batch_limit: int = 200, verbose: bool = False,
+                workers: int = 1, resume: str = None) -> Tuple[int,int,int]:
+    """
+    硬过滤（轻量版）：对 WATCH/CANDIDATE 每 100 个一次 getMultipleAccounts（不取账户数据），判定规则见 _classify；
+    insider 集合按 mint 缓存，整次运行每个 mint 只查一次。
+    并发：workers>1 时按 100 个一组 fan-out（RPC 在 worker 线程，set_list/日志在主循环串行执行）。
+    断点：每次运行登记到 runs/run_items（stage=hard-verify），逐地址记录状态与结论；
+          resume=<run_id|last> 时沿用当时的地址清单，只处理未完成/出错的地址。
     日志：verbose=True 逐条打印分类结果；否则每 20 条汇报一次。
-    速率：sleep_ms>0 则每条间隔，避免打爆 RPC。
+    速率：由 RPC 层的自适应限速器控制（app/ratelimit.py），429 会自动降速重试而不是判成 rpc_error_retry。
     """
-    with conn() as c:
-        cur = c.execute("""
-        SELECT DISTINCT c.addr, c.chain, c.token_address
-        FROM view_addresses c
-        WHERE c.status IN ('WATCH','CANDIDATE')
-        ORDER BY c.first_seen DESC
-        LIMIT ?;""", (batch_limit,))
-        rows = cur.fetchall()
+    if resume:
+        found = find_run(resume, stage="hard-verify", mint="*")
+        if not found:
+            _log(f"[HARD][ERR] no resumable run: {resume}")
+            return 0, 0, 0
+        run_id = found[0]
+        items = load_run_items(run_id)
+        rows = [(a, meta["chain"], meta["mint"], seq) for a, st, _, meta, seq in items if st != "OK"]
+        _log(f"[HARD] resume run={run_id} done={len(items)-len(rows)} todo={len(rows)}")
+    else:
+        with conn() as c:
+            cur = c.execute(SQL_HARD_VERIFY_BATCH, (batch_limit,))
+            # seq = 登记序号：同一地址挂在多个 mint 下时各自一项，按 seq 回写结论
+            rows = [(a, ch, m, i) for i, (a, ch, m) in enumerate(cur.fetchall())]
+        run_id = start_run("hard-verify", "*", [(a, {"chain": ch, "mint": m}) for a, ch, m, _ in rows],
+                           params={"limit": batch_limit})
 
     total = len(rows)
-    _log(f"[HARD] start: rows={total} limit={batch_limit} sleep_ms={sleep_ms}")
+    _log(f"[HARD] start: run={run_id} rows={total} limit={batch_limit} workers={workers}")
 
-    white=watch=black=0
-    for i, (addr, chain, mint) in enumerate(rows, 1):
-        try:
-            info = rpc.get_account_info(addr)
-            v = info.get("value")
-            if not v:
-                set_list(addr, chain, "WATCH", "no_account_info")
-                watch += 1
-                if verbose: _log(f"[HARD][WATCH] {addr} reason=no_account_info")
+    cnt = {"WHITE": 0, "WATCH": 0, "BLACK": 0}
+    done = [0]
+
+    insiders = InsiderSets(rpc)
+    chunks = [rows[i:i + ACCOUNTS_PER_CALL] for i in range(0, len(rows), ACCOUNTS_PER_CALL)]
+
+    def _one(chunk):
+        # 返回与 chunk 同序的 (status, reason) 或该地址的异常（insider 查询失败只影响对应 mint 的地址）
+        vals = rpc.get_accounts_meta([addr for addr, _, _, _ in chunk])
+        out = []
+        for (addr, chain, mint, _), v in zip(chunk, vals):
+            try:
+                out.append(_classify(v, addr, mint, rpc, insiders))
+            except Exception as e:
+                out.append(e)
+        return out
+
+    def _done_one(row, res, err):
+        addr, chain, mint, seq = row
+        if err is not None:
+            status, reason = "WATCH", "rpc_error_retry"
+        else:
+            status, reason = res
+        set_list(addr, chain, status, reason)
+        record_item(run_id, addr, "ERR" if err is not None else "OK", {"status": status, "reason": reason}, seq=seq)
+        cnt[status] += 1
+        done[0] += 1
+        if verbose:
+            extra = f" err={err}" if err is not None else (f" mint={mint[:8]}…" if reason.startswith("insider") else "")
+            _log(f"[HARD][{status}] {addr} reason={reason}{extra}")
+        elif done[0] % 20 == 0 or done[0] == total:
+            _log(f"[HARD] progress {done[0]}/{total} W={cnt['WHITE']} Wa={cnt['WATCH']} B={cnt['BLACK']}")
+
+    def _done(chunk, res, err):
+        for i, row in enumerate(chunk):
+            r = res[i] if err is None else None
+            if isinstance(r, Exception):
+                _done_one(row, None, r)
             else:
-                executable = v.get("executable", False)
-                owner = v.get("owner", "")
-                if (executable is False) and (owner == SYSTEM_PROGRAM):
-                    # Insider 守门
-                    if is_insider_like(addr, mint, rpc):
-                        set_list(addr, chain, "BLACK", "insider_like_largest")
-                        black += 1
-                        if verbose: _log(f"[HARD][BLACK] {addr} reason=insider_like_largest mint={mint[:8]}…")
-                    else:
-                        set_list(addr, chain, "WHITE", "eoalike_not_insider")
-                        white += 1
-                        if verbose: _log(f"[HARD][WHITE] {addr} reason=eoalike_not_insider")
-                else:
-                    set_list(addr, chain, "BLACK", f"non_system_owner:{owner}")
-                    black += 1
-                    if verbose: _log(f"[HARD][BLACK] {addr} reason=non_system_owner owner={owner}")
-        except KeyboardInterrupt:
-            _log("[HARD] interrupted by user")
-            break
-        except Exception as e:
-            set_list(addr, chain, "WATCH", "rpc_error_retry")
-            watch += 1
-            if verbose: _log(f"[HARD][WATCH] {addr} reason=rpc_error_retry err={e}")
-        finally:
-            if not verbose and (i % 20 == 0 or i == total):
-                _log(f"[HARD] progress {i}/{total} W={white} Wa={watch} B={black}")
-            if sleep_ms > 0:
-                time.sleep(sleep_ms/1000.0)
-
-    _log(f"[HARD] done: W={white} Wa={watch} B={black}")
+                _done_one(row, r, err)
+
+    fan_out(_one, chunks, workers=workers, on_done=_done)
+
+    white, watch, black = cnt["WHITE"], cnt["WATCH"], cnt["BLACK"]
+    left = finish_run(run_id)
+    _log(f"[HARD] done: W={white} Wa={watch} B={black} unfinished={left} run={run_id} "
+         f"account_calls={len(chunks)} insider_mints={len(insiders)}")
     return white, watch, black
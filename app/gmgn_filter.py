@@ -1,7 +1,8 @@
 import argparse, os, csv, time, re
-from pathlib import Path
 from typing import Dict, List
 
+from app.select import load_scored
+
 try:
     from app.rpc import SolRpc
 except Exception:
@@ -32,37 +33,17 @@ def _i(v, default=0):
     except (ValueError, TypeError):
         return default
 
-def list_scored_files(mint6: str, sources: List[str]) -> List[Path]:
-    base = Path("data/exports")
-    pats = []
-    if "white" in sources: pats.append(f"white_scored_{mint6}_*.csv")
-    if "watch" in sources: pats.append(f"watch_scored_{mint6}_*.csv")
-    files: List[Path] = []
-    for pat in pats:
-        files.extend(sorted(base.glob(pat)))
-    return files
-
-def load_scored_rows(mint6: str, sources: List[str]) -> List[Dict]:
-    files = list_scored_files(mint6, sources)
-    if not files:
-        log(f"[WARN] 没找到 scored CSV：data/exports/({'|'.join(sources)})_scored_{mint6}_*.csv")
+def load_scored_rows(mint: str, sources: List[str], all_runs: bool = False, **filters) -> List[Dict]:
+    """
+    从打分结果库（scored 表）取该 mint 的打分行，filters 在 SQL 里过滤（见 app.select.load_scored）。
+    默认每个 source 只取最近一次打分；all_runs=True 合并全部历史。同一地址只留一行（watch 优先、新的优先）。
+    """
+    rows = load_scored(sources, mint=mint, all_runs=all_runs, dedupe=True, **filters)
+    if not rows:
+        log(f"[WARN] 打分结果库里没有 mint={mint} sources={'|'.join(sources)} 的结果（先跑 score-white / score-watch）")
         return []
-    rows_map: Dict[str, Dict] = {}
-    for fp in files:
-        try:
-            with open(fp, "r", newline="") as f:
-                r = csv.DictReader(f)
-                cnt = 0
-                for row in r:
-                    cnt += 1
-                    addr = (row.get("addr") or row.get("address") or row.get("owner") or "").strip()
-                    if not addr: continue
-                    rows_map[addr] = row
-            log(f"加载 {fp.name}: {cnt} 行")
-        except Exception as e:
-            log(f"[ERR] 读取 {fp.name} 失败：{e}")
-    log(f"合并后唯一地址: {len(rows_map)}")
-    return list(rows_map.values())
+    log(f"加载（已按条件过滤、按地址去重）: {len(rows)} 行")
+    return rows
 
 def normalize_row(raw: Dict) -> Dict:
     # 地址
@@ -82,26 +63,26 @@ def normalize_row(raw: Dict) -> Dict:
     x.update({"addr": addr, "win_rate": win, "rounds": rounds, "sol_balance": sol})
     return x
 
-def refresh_balances(rows: List[Dict], sleep_ms: int=0):
+def refresh_balances(rows: List[Dict]):
     if SolRpc is None:
-        log("[WARN] 找不到 app.rpc.SolRpc，无法刷新余额（沿用 CSV 的 sol_balance）")
+        log("[WARN] 找不到 app.rpc.SolRpc，无法刷新余额（沿用打分时的 sol_balance）")
         return
     rpc = SolRpc()
     n = len(rows)
     ok = err = 0
-    for i, x in enumerate(rows, 1):
-        a = x["addr"]
+    step = 100  # 一个 JSON-RPC 数组批量 = 100 个 getBalance
+    for lo in range(0, n, step):
+        chunk = rows[lo:lo+step]
         try:
-            r = rpc.get_balance(a)  # lamports
-            v = r.get("value")
-            if isinstance(v, dict): v = v.get("value", 0)
-            x["sol_balance"] = (v or 0) / 1_000_000_000
-            ok += 1
+            vals = rpc.get_balances([x["addr"] for x in chunk])  # lamports，失败项为 None
         except Exception:
-            err += 1
-        if (i % max(1,n//10 or 1)) == 0 or i == n:
-            print(f"[{_ts()}] [balance] {i}/{n} ok={ok} err={err}", flush=True)
-        if sleep_ms>0: time.sleep(sleep_ms/1000.0)
+            vals = [None] * len(chunk)
+        for x, v in zip(chunk, vals):
+            if v is None:
+                err += 1; continue
+            x["sol_balance"] = v / 1_000_000_000
+            ok += 1
+        print(f"[{_ts()}] [balance] {lo+len(chunk)}/{n} ok={ok} err={err}", flush=True)
 
 def main():
     ap = argparse.ArgumentParser(description="GMGN筛选：胜率 & SOL余额（带日志/进度）")
@@ -112,7 +93,8 @@ def main():
     ap.add_argument("--max-sol", type=float, default=50.0)
     ap.add_argument("--min-rounds", type=int, default=0)
     ap.add_argument("--refresh-balance", action="store_true")
-    ap.add_argument("--balance-sleep-ms", type=int, default=0)
+    ap.add_argument("--all-runs", action="store_true", help="合并该 mint 的全部历史打分（默认每个 source 只取最近一次）")
+    ap.add_argument("--balance-sleep-ms", type=int, default=0, help="已废弃：限速由 app/ratelimit 自适应控制，此参数被忽略")
     ap.add_argument("--topk", type=int, default=0)
     ap.add_argument("--show-head", type=int, default=10)
     ap.add_argument("--dry", action="store_true", help="只打印各阶段计数，不导出文件")
@@ -122,7 +104,11 @@ def main():
     sources = [s.strip() for s in args.sources.split(",") if s.strip()]
     log(f"开始：mint6={mint6} sources={sources} 规则: win>={args.min_win}, sol∈[{args.min_sol},{args.max_sol}], rounds>={args.min_rounds}")
 
-    raw_rows = load_scored_rows(mint6, sources)
+    # 胜率/回合条件下推到库里；余额要刷新时不能按库里的旧余额先过滤
+    pushed = {"min_win_rate": args.min_win, "min_rounds": args.min_rounds or None}
+    if not args.refresh_balance:
+        pushed.update(min_sol=args.min_sol, max_sol=args.max_sol, null_sol=0.0)
+    raw_rows = load_scored_rows(args.mint, sources, all_runs=args.all_runs, **pushed)
     if not raw_rows:
         log("无数据，退出。"); return
 
@@ -137,7 +123,7 @@ def main():
 
     if args.refresh_balance:
         log("刷新余额中…")
-        refresh_balances(rows, sleep_ms=args.balance_sleep_ms)
+        refresh_balances(rows)
         zero_sol = sum(1 for x in rows if _f(x["sol_balance"],0.0) == 0.0)
         log(f"余额刷新后 zero_sol={zero_sol}")
 
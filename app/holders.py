@@ -0,0 +1,211 @@
+# app/holders.py
+# 持有者快照：一次 getProgramAccounts 全量扫描 → 按 owner 聚合的列式快照（owner 32 字节 + amount u64）
+#   - 存储：data/holders.sqlite（独立文件），每个 mint 的每次快照一行：owners/amounts 两个 BLOB，按 owner 字节序排好
+#   - 复用：HOLDER_SNAPSHOT_TTL 秒内的快照直接用，holders / early / scan-mint 之间不再重复扫
+#   - Top-N：heapq.nlargest 按 amount 取前 N（不整体排序）
+#   - Diff：两个快照按 owner 有序归并，一遍得出新进 / 退出 / 数量变化
+#   - 聚合：直接在 TokenAccounts 的扁平数组上按 owner 字节排序下标、合并相邻同 owner，不建 owner→amount 字典
+#     （numpy 可选：有则 lexsort + reduceat，没有则纯 Python 排序下标）
+import os, sys, time, heapq, sqlite3, threading
+from array import array
+from typing import Iterable, List, Optional, Tuple
+from .rpc import SolRpc
+from .solana_spl import list_token_accounts_by_mint, TokenAccounts, _to_pubkey
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖
+    np = None
+
+SNAP_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "holders.sqlite"))
+TTL_S = float(os.environ.get("HOLDER_SNAPSHOT_TTL", "600") or 600)
+KEEP = int(os.environ.get("HOLDER_SNAPSHOT_KEEP", "20") or 20)   # 每个 mint 最多保留的快照数
+
+def _amounts(blob: bytes) -> array:
+    a = array("Q")
+    a.frombytes(blob)
+    if sys.byteorder == "big":  # 落盘固定小端
+        a.byteswap()
+    return a
+
+def _blob(a: array) -> bytes:
+    if sys.byteorder == "big":
+        a = array("Q", a); a.byteswap()
+    return a.tobytes()
+
+def _aggregate(acc: TokenAccounts) -> Tuple[bytes, array]:
+    """
+    TokenAccounts → (owners, amounts)：去掉 amount 为 0 的账户，按 owner 字节序排序后合并同一 owner 的多个账户。
+    只排下标、不建 owner→amount 字典，内存与账户数线性且只有几份扁平数组。
+    """
+    n = len(acc)
+    amt = np.frombuffer(acc.amounts, dtype=np.uint64, count=n) if np is not None and n else None
+    # 总量逼近 u64 上限（实际 mint 不会出现）时合计可能溢出，交给下面按 2^64-1 封顶的纯 Python 实现
+    if amt is not None and float(amt.sum(dtype=np.float64)) < 2.0 ** 63:
+        keep = np.flatnonzero(amt)
+        ow = np.frombuffer(acc.owners, dtype=">u8", count=4 * n).reshape(n, 4)[keep]  # 大端 u64 ×4 的字典序 = 字节序
+        order = np.lexsort((ow[:, 3], ow[:, 2], ow[:, 1], ow[:, 0]))
+        ow, amt = ow[order], amt[keep][order]
+        starts = np.flatnonzero(np.r_[True, (ow[1:] != ow[:-1]).any(axis=1)]) if len(ow) else keep[:0]
+        sums = np.add.reduceat(amt, starts) if len(starts) else amt
+        return ow[starts].tobytes(), array("Q", sums.astype(np.uint64).tobytes())
+    idx = sorted((i for i in range(n) if acc.amounts[i]), key=acc.owner_bytes)
+    owners, amounts, prev = bytearray(), array("Q"), None
+    for i in idx:
+        ob = acc.owner_bytes(i)
+        if ob == prev:
+            amounts[-1] = min(amounts[-1] + acc.amounts[i], 2**64 - 1)
+        else:
+            owners += ob; amounts.append(acc.amounts[i]); prev = ob
+    return bytes(owners), amounts
+
+class HolderSnapshot:
+    """
+    某 mint 在 ts 时刻的持有者：owners 为 32*n 字节（按 owner 字节序升序、无重复），amounts 与之同序。
+    只含 amount > 0 的 owner；同一 owner 的多个 Token Account 已合并。
+    """
+    __slots__ = ("mint", "ts", "owners", "amounts", "snap_id")
+
+    def __init__(self, mint: str, ts: int, owners: bytes, amounts: array, snap_id: Optional[int] = None):
+        self.mint, self.ts, self.owners, self.amounts, self.snap_id = mint, ts, owners, amounts, snap_id
+
+    @classmethod
+    def from_accounts(cls, mint: str, accounts: Iterable, ts: Optional[int] = None) -> "HolderSnapshot":
+        # accounts：solana_spl.TokenAccounts（直接读原始字节，不做 base58）或 {"owner", "amount"} 字典列表
+        if not isinstance(accounts, TokenAccounts):
+            from base58 import b58decode
+            ta = TokenAccounts()
+            for it in accounts:
+                amt, ow = int(it.get("amount") or 0), it.get("owner")
+                if amt > 0 and ow:
+                    ta.add(b58decode(ow) + min(amt, 2**64 - 1).to_bytes(8, "little"))
+            accounts = ta
+        owners, amounts = _aggregate(accounts)
+        return cls(mint, int(ts if ts is not None else time.time()), owners, amounts)
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    def owner_bytes(self, i: int) -> bytes:
+        return self.owners[32 * i:32 * i + 32]
+
+    def owner(self, i: int) -> str:
+        return _to_pubkey(self.owner_bytes(i))
+
+    def total(self) -> int:
+        return sum(self.amounts)
+
+    def top(self, n: int) -> List[Tuple[str, int]]:
+        # 按持仓降序的前 n 个 (owner, amount)；只对选中的 n 个做 base58
+        idx = heapq.nlargest(n, range(len(self.amounts)), key=self.amounts.__getitem__)
+        return [(self.owner(i), self.amounts[i]) for i in idx]
+
+class SnapshotDiff:
+    """old → new：entered/exited 为 (owner, amount)，changed 为 (owner, old_amount, new_amount)，均按 owner 字节序"""
+    __slots__ = ("entered", "exited", "changed")
+
+    def __init__(self):
+        self.entered: List[Tuple[str, int]] = []
+        self.exited: List[Tuple[str, int]] = []
+        self.changed: List[Tuple[str, int, int]] = []
+
+    def summary(self) -> str:
+        up = sum(1 for _, a, b in self.changed if b > a)
+        return f"entered={len(self.entered)} exited={len(self.exited)} changed={len(self.changed)} (up={up} down={len(self.changed)-up})"
+
+def diff(old: Optional[HolderSnapshot], new: HolderSnapshot) -> SnapshotDiff:
+    d = SnapshotDiff()
+    if old is None:
+        d.entered = [(new.owner(j), new.amounts[j]) for j in range(len(new))]
+        return d
+    i = j = 0
+    n, m = len(old), len(new)
+    while i < n or j < m:
+        a = old.owner_bytes(i) if i < n else None
+        b = new.owner_bytes(j) if j < m else None
+        if b is None or (a is not None and a < b):
+            d.exited.append((_to_pubkey(a), old.amounts[i])); i += 1
+        elif a is None or b < a:
+            d.entered.append((_to_pubkey(b), new.amounts[j])); j += 1
+        else:
+            if old.amounts[i] != new.amounts[j]:
+                d.changed.append((_to_pubkey(a), old.amounts[i], new.amounts[j]))
+            i += 1; j += 1
+    return d
+
+class HolderStore:
+    def __init__(self, path: str = SNAP_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._con = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        self._con.execute("""
+        CREATE TABLE IF NOT EXISTS holder_snapshots (
+          snap_id  INTEGER PRIMARY KEY AUTOINCREMENT,
+          mint     TEXT NOT NULL,
+          ts       INTEGER NOT NULL,
+          n        INTEGER NOT NULL,
+          owners   BLOB NOT NULL,      -- 32*n 字节，owner 升序
+          amounts  BLOB NOT NULL       -- 8*n 字节，u64 小端
+        )""")
+        self._con.execute("CREATE INDEX IF NOT EXISTS idx_holder_snapshots_mint_ts ON holder_snapshots(mint, ts)")
+
+    def save(self, snap: HolderSnapshot, keep: int = KEEP) -> HolderSnapshot:
+        with self._lock:
+            cur = self._con.execute("INSERT INTO holder_snapshots(mint, ts, n, owners, amounts) VALUES(?,?,?,?,?)",
+                                    (snap.mint, snap.ts, len(snap), snap.owners, _blob(snap.amounts)))
+            snap.snap_id = cur.lastrowid
+            if keep:
+                self._con.execute("""DELETE FROM holder_snapshots WHERE mint=? AND snap_id NOT IN
+                                     (SELECT snap_id FROM holder_snapshots WHERE mint=? ORDER BY ts DESC, snap_id DESC LIMIT ?)""",
+                                  (snap.mint, snap.mint, keep))
+        return snap
+
+    def _one(self, sql: str, args: tuple) -> Optional[HolderSnapshot]:
+        with self._lock:
+            r = self._con.execute(sql, args).fetchone()
+        return HolderSnapshot(r[1], r[2], r[3], _amounts(r[4]), r[0]) if r else None
+
+    def latest(self, mint: str, max_age: Optional[float] = None) -> Optional[HolderSnapshot]:
+        since = int(time.time() - max_age) if max_age is not None else -1
+        return self._one("""SELECT snap_id, mint, ts, owners, amounts FROM holder_snapshots
+                            WHERE mint=? AND ts>=? ORDER BY ts DESC, snap_id DESC LIMIT 1""", (mint, since))
+
+    def previous(self, snap: HolderSnapshot) -> Optional[HolderSnapshot]:
+        return self._one("""SELECT snap_id, mint, ts, owners, amounts FROM holder_snapshots
+                            WHERE mint=? AND snap_id<? ORDER BY snap_id DESC LIMIT 1""", (snap.mint, snap.snap_id or 2**62))
+
+    def get(self, snap_id: int) -> Optional[HolderSnapshot]:
+        return self._one("SELECT snap_id, mint, ts, owners, amounts FROM holder_snapshots WHERE snap_id=?", (snap_id,))
+
+    def list(self, mint: str) -> List[Tuple[int, int, int]]:
+        # [(snap_id, ts, n)]，新→旧
+        with self._lock:
+            return self._con.execute("SELECT snap_id, ts, n FROM holder_snapshots WHERE mint=? ORDER BY ts DESC, snap_id DESC",
+                                     (mint,)).fetchall()
+
+_shared: Optional[HolderStore] = None
+_shared_lock = threading.Lock()
+
+def shared_store() -> HolderStore:
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = HolderStore()
+        return _shared
+
+def holder_snapshot(rpc: SolRpc, mint: str, ttl: float = TTL_S, refresh: bool = False) -> HolderSnapshot:
+    """TTL 内有快照就复用，否则全量扫描一次并存档（refresh=True 强制重扫）"""
+    store = shared_store()
+    if not refresh and ttl > 0:
+        snap = store.latest(mint, max_age=ttl)
+        if snap is not None:
+            return snap
+    snap = HolderSnapshot.from_accounts(mint, list_token_accounts_by_mint(rpc, mint))
+    return store.save(snap)
+
+def top_holders(rpc: SolRpc, mint: str, topn: int = 3000, ttl: float = TTL_S) -> List[str]:
+    # 按持仓降序的前 topn 个 owner（取代“RPC 返回顺序的前 topn 个”）
+    return [o for o, _ in holder_snapshot(rpc, mint, ttl=ttl).top(topn)]
@@ -1,34 +1,88 @@
 # app/insider.py
-from typing import List, Set
+# Insider 守门：每个 mint 只算一次“内部人集合”，同一 mint 的所有地址复用
+#   - 最大的 topn 个 Token Account 的 owner（getTokenLargestAccounts 给的是 ATA/金库地址，需再解析 owner）
+#   - mint 的铸造权 / 冻结权地址
+#   两者合起来是 2 次 RPC：getTokenLargestAccounts + 一次 getMultipleAccounts（mint 账户和这些 ATA 一起取）
+import threading
+from typing import Dict, List, Optional
 from .rpc import SolRpc
+from .jsonrpc import RpcError
+
+def _parsed_info(v) -> dict:
+    data = (v or {}).get("data")
+    return ((data.get("parsed") or {}).get("info") or {}) if isinstance(data, dict) else {}
+
+def _authorities(info: dict) -> List[str]:
+    return [a for a in (info.get("mintAuthority"), info.get("freezeAuthority")) if a]
 
 def get_mint_authorities(rpc: SolRpc, mint: str) -> List[str]:
-    info = rpc.get_account_info(mint)
-    v = info.get("value")
-    if not v: return []
-    # mint account data 是 base64；此处 v1.5 不深度解码，走“最大持仓地址 + 冻结权/铸造权猜测”混合守门
-    # 直接用 largest accounts 先做守门：
-    return []
+    info = rpc.get_account_info(mint) or {}
+    return _authorities(_parsed_info(info.get("value")))
 
 def largest_holders(rpc: SolRpc, mint: str, topn=20) -> List[str]:
+    # 最大持仓 Token Account 的 owner（按持仓降序，去重）
+    return [o for o, why in insider_set(rpc, mint, topn).items() if why == "largest"]
+
+def insider_set(rpc: SolRpc, mint: str, topn: int = 20) -> Dict[str, str]:
+    """
+    {地址: 原因}，原因为 "largest"（大户 Token Account 的 owner）或 "authority"（铸造权/冻结权）。
+    RPC 失败直接抛出（由调用方决定重试/记为待定），不会返回一个“查不到所以为空”的集合。
+    """
+    # SolRpc.call 把 JSON-RPC 错误变成 None：没有 value 就当查询失败抛出，不能当“没有大户”缓存下来
     res = rpc.get_token_largest_accounts(mint)
-    out = []
-    for it in (res.get("value") or []):
-        addr = it.get("address")
-        out.append(addr)
-        if len(out) >= topn: break
+    if not isinstance(res, dict) or not isinstance(res.get("value"), list):
+        raise RpcError(f"getTokenLargestAccounts({mint}): no result")
+    atas = [it["address"] for it in res["value"][:topn] if it.get("address")]
+    got = rpc.get_multiple_accounts([mint] + atas)
+    vals = got.get("value") if isinstance(got, dict) else None
+    if not isinstance(vals, list) or len(vals) != len(atas) + 1:
+        raise RpcError(f"getMultipleAccounts({mint} + {len(atas)} accounts): no result")
+    out: Dict[str, str] = {}
+    for v in vals[1:]:
+        ow = _parsed_info(v).get("owner")
+        if ow and ow not in out:
+            out[ow] = "largest"
+    for a in _authorities(_parsed_info(vals[0] if vals else None)):
+        out.setdefault(a, "authority")
     return out
 
-def is_insider_like(owner: str, mint: str, rpc: SolRpc) -> bool:
+class InsiderSets:
+    """一次运行内按 mint 缓存 insider_set；多线程同时要同一个 mint 时只有一个线程去查"""
+    def __init__(self, rpc: SolRpc, topn: int = 20):
+        self.rpc, self.topn = rpc, topn
+        self._sets: Dict[str, Dict[str, str]] = {}
+        self._errs: Dict[str, Exception] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, mint: str) -> Dict[str, str]:
+        with self._lock:
+            lk = self._locks.setdefault(mint, threading.Lock())
+        with lk:
+            if mint in self._errs:
+                raise self._errs[mint]  # 本次运行里已失败过：同 mint 的其余地址直接记为待重试，不再反复打 RPC
+            if mint not in self._sets:
+                try:
+                    self._sets[mint] = insider_set(self.rpc, mint, self.topn)
+                except Exception as e:
+                    self._errs[mint] = e
+                    raise
+            return self._sets[mint]
+
+    def __len__(self) -> int:
+        return len(self._sets)
+
+def insider_reason(owner: str, mint: str, rpc: SolRpc, sets: Optional[InsiderSets] = None) -> Optional[str]:
+    # 命中返回原因（largest/authority），否则 None
+    s = sets.get(mint) if sets is not None else insider_set(rpc, mint)
+    return s.get(owner)
+
+def is_insider_like(owner: str, mint: str, rpc: SolRpc, sets: Optional[InsiderSets] = None) -> bool:
     """
-    v1.5 近似规则：
-      - 如果 owner 的 ATA 位于 mint 的 largest accounts 前 N（如 20）且此持仓是“上市极早期形成”，可疑
-      - 或 owner 与「largest holders 中的已知营销/金库多签」存在早期资金往来（此处简化：仅第一条）
+    近似规则：owner 是该 mint 最大的 20 个 Token Account 之一的持有人，或是 mint 的铸造权/冻结权地址。
+    传入 sets 时同一 mint 只查一次；查询失败返回 False（保持旧接口语义，hard_verify 用 insider_reason 让错误上抛）。
     """
     try:
-        # largest accounts 返回的是 Token Account(ATA) 地址，需要 owner 是否直接匹配？
-        # 我们退一步：若 owner 本身在 largest 列表中，直接可疑（很多项目方把金库存成持有人）
-        tops = set(largest_holders(rpc, mint, topn=20))
-        return owner in tops
+        return insider_reason(owner, mint, rpc, sets) is not None
     except Exception:
         return False
@@ -0,0 +1,99 @@
+# app/jsonrpc.py
+# JSON-RPC 2.0 数组批量请求：自动分片、按 id 回填、单项错误不拖垮整批
+import os, threading
+import requests
+from typing import Any, Callable, Hashable, List, Optional
+from .ratelimit import is_rate_error
+
+RATE_ROUNDS = 3  # 批量里被限流的单项，最多再补发几轮
+
+MAX_BATCH = int(os.environ.get("RPC_MAX_BATCH", "100") or 100)
+
+# 端点在 HTTP 层拒收数组请求时的常见状态码（而不是回一个非数组的 JSON）
+BATCH_REJECT_CODES = (400, 403, 405, 413)
+
+# 已确认不支持数组批量的端点（key 由客户端给出）：之后直接逐条，不再每片先试探一次
+_no_batch = set()
+_no_batch_lock = threading.Lock()
+
+class RpcError(RuntimeError):
+    """单条 JSON-RPC 错误（批量结果里以实例形式原位返回，而不是抛出）"""
+    def __init__(self, err: Any):
+        self.code = err.get("code") if isinstance(err, dict) else None
+        self.message = err.get("message") if isinstance(err, dict) else str(err)
+        self.rate_limited = is_rate_error(err)
+        super().__init__(f"rpc error: {err}")
+
+def batch_call(post: Callable[[Any], Any], method: str, params_list: List[list],
+               max_batch: Optional[int] = None, single: Optional[Callable[[str, list], Any]] = None,
+               key: Optional[Hashable] = None) -> List[Any]:
+    """
+    post(payload) -> 已解析的 JSON 响应（由客户端负责 session/闸门/raise_for_status）。
+    返回与 params_list 同序的列表：成功项为 result，失败项为 RpcError 实例。
+    若端点不支持数组请求（返回的不是 list，或 HTTP 层以 BATCH_REJECT_CODES 拒收），退化为
+    single(method, params) 逐条调用；给了 key 时按 key 记住该端点不支持批量，之后不再试探。
+    被限流的单项（限流错误码）会再补发，最多 RATE_ROUNDS 轮（节奏由 post 里的限速器控制）。
+    """
+    out = _batch_once(post, method, params_list, max_batch, single, key)
+    for _ in range(RATE_ROUNDS):
+        redo = [i for i, r in enumerate(out) if isinstance(r, RpcError) and r.rate_limited]
+        if not redo: break
+        for i, r in zip(redo, _batch_once(post, method, [params_list[i] for i in redo], max_batch, single, key)):
+            out[i] = r
+    return out
+
+def _rejected(e: requests.HTTPError) -> bool:
+    return e.response is not None and e.response.status_code in BATCH_REJECT_CODES
+
+def _singles(single, method, params_list) -> List[Any]:
+    out: List[Any] = []
+    for p in params_list:
+        try: out.append(single(method, p))
+        except Exception as e: out.append(e if isinstance(e, RpcError) else RpcError(str(e)))
+    return out
+
+def _mark_no_batch(key, why: str):
+    if key is None: return
+    with _no_batch_lock:
+        if key in _no_batch: return
+        _no_batch.add(key)
+    print(f"[rpc] endpoint rejects batch requests ({why}); falling back to single calls")
+
+def _batch_once(post, method, params_list, max_batch, single, key=None):
+    if single is not None and key is not None and key in _no_batch:
+        return _singles(single, method, params_list)
+    n = max(1, max_batch or MAX_BATCH)
+    out: List[Any] = [None] * len(params_list)
+    for lo in range(0, len(params_list), n):
+        chunk = params_list[lo:lo+n]
+        payload = [{"jsonrpc": "2.0", "id": lo+i, "method": method, "params": p} for i, p in enumerate(chunk)]
+        try:
+            resp = post(payload)
+        except requests.HTTPError as e:
+            if single is None or not _rejected(e):
+                raise
+            resp, why = None, f"HTTP {e.response.status_code}"
+        else:
+            why = "non-array response"
+        if not isinstance(resp, list):
+            if single is None:
+                raise RpcError(resp.get("error") if isinstance(resp, dict) else resp)
+            # 本片及其后的分片都逐条发，不再逐片重新试探数组请求
+            _mark_no_batch(key, why)
+            out[lo:] = _singles(single, method, params_list[lo:])
+            return out
+        got = set()
+        for it in resp:
+            idx = it.get("id") if isinstance(it, dict) else None
+            if not isinstance(idx, int) or not (lo <= idx < lo+len(chunk)):
+                continue
+            got.add(idx)
+            out[idx] = RpcError(it["error"]) if "error" in it else it.get("result")
+        for i in range(lo, lo+len(chunk)):
+            if i not in got:
+                out[i] = RpcError("missing response in batch")
+    return out
+
+def ok_or_none(results: List[Any]) -> List[Any]:
+    # 批量结果里的 RpcError 统一换成 None（与单条接口“查不到返回 None”的习惯一致）
+    return [None if isinstance(r, RpcError) else r for r in results]
@@ -1,11 +1,18 @@
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import time, argparse, os
 from datetime import datetime
 from app.rpc import SolRpc
-from app.solana_spl import recent_token_owners
-from app.db import add_candidates
+from app.aio import fan_out, DEFAULT_INFLIGHT
+from app.txcache import fmt_stats
+from app.ratelimit import fmt_limits
+from app.rpcpool import fmt_pools
+from app.holders import holder_snapshot, top_holders, shared_store, diff
+from app.db import add_candidates, start_run, find_run, load_run_items, record_item, finish_run
 from app.t0 import estimate_t0
 from app.txscan import replay_recent_for_owner, replay_owner_windowed
+from app.mintscan import early_buyers_by_mint, EarlyScanError
+
+WINDOW_ITEM = "*window*"  # mint 引擎：整个窗口作为一个 run item
 
 def _ts(): return datetime.now().strftime("%H:%M:%S")
 def log(*args): print(f"[{_ts()}]", *args, flush=True)
@@ -26,29 +33,49 @@ class Meter:
             eta=(self.total-self.done)/rps if rps>0 else 0
             print(f"[{_ts()}] progress {self.done}/{self.total} (rps={rps:.2f}, eta={eta/60:.1f}m, rpc_ok={self.ok}, rpc_fail={self.fail})", flush=True)
 
-def scan_holders(mint: str, topn: int = 800):
+def scan_holders(mint: str, topn: int = 800, new_only: bool = False, refresh: bool = False):
     rpc = SolRpc()
-    log(f"[holders] start mint={mint} topn={topn}")
-    owners = recent_token_owners(rpc, mint, topn=topn)
-    log(f"[holders] owners found={len(owners)}")
-    m = Meter(len(owners), tick=max(1, len(owners)//10 or 1))
+    log(f"[holders] start mint={mint} topn={topn} new_only={new_only}")
+    snap = holder_snapshot(rpc, mint, refresh=refresh or new_only)
+    log(f"[holders] snapshot id={snap.snap_id} ts={snap.ts} holders={len(snap)}")
+    prev = shared_store().previous(snap)
+    d = diff(prev, snap) if prev is not None else None
+    if d is not None:
+        log(f"[holders] vs snapshot id={prev.snap_id} ts={prev.ts}: {d.summary()}")
+    if new_only:
+        # 只要上次快照之后新进场的 owner（按持仓降序）
+        ent = sorted(d.entered, key=lambda x: -x[1]) if d is not None else snap.top(topn)
+        owners = [o for o, _ in ent[:topn]]
+    else:
+        owners = [o for o, _ in snap.top(topn)]
+    log(f"[holders] owners selected={len(owners)}")
     add_candidates("sol", mint, owners, source="mint_scan")
-    for _ in owners:
-        m.hit_rpc(True); m.step()
     log(f"[holders] done, written candidates={len(owners)}")
 
 def scan_early(mint: str, base_topn: int, tx_limit: int = 300, out_topn: int = 100,
-               sleep_ms: int = 50, retry:int=1, window_h: float = 2.0):
-    rpc = SolRpc()
-    log(f"[early] start mint={mint} base_topn={base_topn} window_h={window_h} out_topn={out_topn}")
-    try:
-        t0 = estimate_t0(rpc, mint, sample_holders=12)
-    except Exception as e:
-        t0=None; elog(f"[early] estimate_t0 failed: {e}")
-    base = recent_token_owners(rpc, mint, topn=base_topn)
-    log(f"[early] base owners={len(base)}")
-    m = Meter(len(base), tick=max(1, len(base)//10 or 1))
+               retry:int=1, window_h: float = 2.0, workers: int = 1,
+               engine: str = "mint", pools: Optional[List[str]] = None, resume: Optional[str] = None,
+               max_sigs: int = 50_000):
+    rpc = SolRpc(max_inflight=max(workers, DEFAULT_INFLIGHT))
     hits: List[Tuple[str,int,int]] = []
+    prev = {}
+    if resume:
+        # 续跑：t0/引擎/窗口沿用原运行（不再重新估计 t0，保证与中断前同一窗口）
+        found = find_run(resume, stage="early", mint=mint)
+        if not found:
+            elog(f"[early] no resumable run: {resume}"); return
+        run_id, params = found
+        t0, engine, window_h = params.get("t0"), params.get("engine", engine), params.get("window_h", window_h)
+        prev = {a: (st, res) for a, st, res, _, _ in load_run_items(run_id)}
+        log(f"[early] resume run={run_id} engine={engine} t0={t0} done={sum(1 for st, _ in prev.values() if st == 'OK')}/{len(prev)}")
+    else:
+        run_id = None
+        log(f"[early] start mint={mint} engine={engine} base_topn={base_topn} window_h={window_h} out_topn={out_topn} workers={workers}")
+        try:
+            t0 = estimate_t0(rpc, mint, sample_holders=12)
+        except Exception as e:
+            t0=None; elog(f"[early] estimate_t0 failed: {e}")
+    params = {"t0": t0, "engine": engine, "window_h": window_h, "base_topn": base_topn, "tx_limit": tx_limit}
 
     # 实时落盘：logs/early_hits_<mint6>_<ts>.txt
     os.makedirs("logs", exist_ok=True)
@@ -56,18 +83,66 @@ def scan_early(mint: str, base_topn: int, tx_limit: int = 300, out_topn: int = 1
     with open(fname, "w") as fh:
         fh.write("# addr\tfb\tnet\n")
 
+    if engine == "mint" and t0 is not None:
+        # mint 中心：只翻窗口内的 mint/金库签名流，不需要 holders 基础样本。
+        # 整个窗口是一个 run item；中断后重跑时已解码过的交易全部命中 tx 缓存，不再发 getTransaction
+        if run_id is None:
+            run_id = start_run("early", mint, [WINDOW_ITEM], params=params)
+        st, res = prev.get(WINDOW_ITEM, (None, None))
+        if st == "OK":
+            hits = [tuple(h) for h in res]
+        else:
+            try:
+                hits = early_buyers_by_mint(rpc, mint, t0, window_h=window_h, accounts=pools, max_sigs=max_sigs)
+                record_item(run_id, WINDOW_ITEM, "OK", hits)
+            except EarlyScanError as e:
+                # 签名流被截断/找不到金库：残缺结果会漏掉最早的买家，记为失败（调大 --max-sigs 或给 --pools 后 --resume）
+                elog(f"[early] window scan incomplete: {e}")
+                record_item(run_id, WINDOW_ITEM, "ERR", {"err": str(e)})
+                hits = []
+        with open(fname, "a") as fh:
+            for owner, fb, net in hits:
+                fh.write(f"{owner}\t{fb}\t{net}\n")
+        return _finish_early(rpc, mint, hits, out_topn, fname, run_id)
+    if engine == "mint":
+        log("[early] t0 unknown, fallback to per-owner replay")
+
+    if run_id is None:
+        base = top_holders(rpc, mint, topn=base_topn)
+        run_id = start_run("early", mint, base, params=dict(params, engine="owners"))
+    else:
+        base = list(prev)
+    log(f"[early] run={run_id} base owners={len(base)}")
+
+    # 已完成的 owner 直接复用记录的 (net, fb)，只回放未完成/出错的
+    todo = []
     for owner in base:
-        if sleep_ms>0: time.sleep(sleep_ms/1000.0)
-        try:
-            if t0 is not None:
-                net, fb = replay_owner_windowed(rpc, owner, mint, t0, window_h=window_h, max_sigs_per_ata=600)
-            else:
-                net, fb = replay_recent_for_owner(rpc, owner, mint, max_txs=tx_limit)
-            m.hit_rpc(True)
-        except Exception as e:
-            m.hit_rpc(False); elog(f"[early] owner={owner[:8]}… err={e}")
-            m.step(); continue
+        st, res = prev.get(owner, (None, None))
+        if st != "OK":
+            todo.append(owner); continue
+        net, fb = res
+        if net > 0 and fb >= 0:
+            hits.append((owner, fb, net))
+    if hits:
+        with open(fname, "a") as fh:
+            for owner, fb, net in hits:
+                fh.write(f"{owner}\t{fb}\t{net}\n")
+    m = Meter(len(todo), tick=max(1, len(todo)//10 or 1))
+
+    # 单个 owner 的回放在 worker 线程里跑；统计/落盘在 _done 里（事件循环线程，串行）
+    def _one(owner):
+        if t0 is not None:
+            return replay_owner_windowed(rpc, owner, mint, t0, window_h=window_h, max_sigs_per_ata=600)
+        return replay_recent_for_owner(rpc, owner, mint, max_txs=tx_limit)
 
+    def _done(owner, res, err):
+        if err is not None:
+            m.hit_rpc(False); elog(f"[early] owner={owner[:8]}… err={err}")
+            record_item(run_id, owner, "ERR", {"err": str(err)})
+            m.step(); return
+        m.hit_rpc(True)
+        net, fb = res
+        record_item(run_id, owner, "OK", [net, fb])
         if net > 0 and fb >= 0:
             hits.append((owner, fb, net))
             log(f"[early][HIT] {owner} fb={fb} net={net}")
@@ -78,11 +153,21 @@ def scan_early(mint: str, base_topn: int, tx_limit: int = 300, out_topn: int = 1
                 pass
         m.step()
 
+    fan_out(_one, todo, workers=workers, on_done=_done)
+    return _finish_early(rpc, mint, hits, out_topn, fname, run_id)
+
+def _finish_early(rpc: SolRpc, mint: str, hits: List[Tuple[str,int,int]], out_topn: int, fname: str, run_id: str):
     hits.sort(key=lambda x: x[1])
     out=[o for (o,_,_) in hits[:out_topn]]
     add_candidates("sol", mint, out, source="early_buyers")
-    log(f"[early] done hits={len(hits)} early_top={len(out)} (written)")
+    left = finish_run(run_id)
+    log(f"[early] done hits={len(hits)} early_top={len(out)} (written) run={run_id} unfinished={left}")
+    if left:
+        log(f"[early] resume with: --resume {run_id}")
     log(f"[early] hits file -> {fname}")
+    log(fmt_stats(rpc.tx_cache))
+    log(fmt_limits())
+    log(fmt_pools())
 
 def main():
     import argparse
@@ -92,7 +177,9 @@ def main():
     p = sub.add_parser("holders")
     p.add_argument("--mint", required=True)
     p.add_argument("--topn", type=int, default=800)
-    p.set_defaults(func=lambda a: scan_holders(a.mint, a.topn))
+    p.add_argument("--new", dest="new_only", action="store_true", help="只取上次快照之后新进场的持有者")
+    p.add_argument("--fresh", action="store_true", help="忽略 HOLDER_SNAPSHOT_TTL，重新全量扫描")
+    p.set_defaults(func=lambda a: scan_holders(a.mint, a.topn, a.new_only, a.fresh))
 
     p = sub.add_parser("early")
     p.add_argument("--mint", required=True)
@@ -100,10 +187,18 @@ def main():
     p.add_argument("--out_topn", type=int, default=100)
     p.add_argument("--tx_limit", type=int, default=300)
     p.add_argument("--window_h", type=float, default=2.0)
-    p.add_argument("--sleep_ms", type=int, default=60)
-    p.add_argument("--sleep-ms", dest="sleep_ms", type=int)
+    p.add_argument("--sleep_ms", type=int, default=0, help="已废弃：限速由 app/ratelimit 自适应控制，此参数被忽略")
+    p.add_argument("--sleep-ms", dest="sleep_ms", type=int, help="已废弃：限速由 app/ratelimit 自适应控制，此参数被忽略")
     p.add_argument("--retry", type=int, default=1)
-    p.set_defaults(func=lambda a: scan_early(a.mint, a.base_topn, a.tx_limit, a.out_topn, a.sleep_ms, a.retry, a.window_h))
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--engine", choices=["mint", "owners"], default="mint",
+                   help="mint=翻 mint/金库窗口签名流（默认）；owners=逐个 holder 回放（旧版）")
+    p.add_argument("--pools", help="逗号分隔的池子/金库账户；不填则在最大的 Token Account 里按持有人（程序账户/AMM authority）识别")
+    p.add_argument("--max-sigs", dest="max_sigs", type=int, default=50_000, help="mint 引擎每个签名流最多翻的签名数，超出即判为截断")
+    p.add_argument("--resume", metavar="RUN_ID", help="续跑中断的运行（RUN_ID 或 last）")
+    p.set_defaults(func=lambda a: scan_early(a.mint, a.base_topn, a.tx_limit, a.out_topn, a.retry, a.window_h, a.workers,
+                                             a.engine, [x.strip() for x in a.pools.split(",") if x.strip()] if a.pools else None,
+                                             a.resume, a.max_sigs))
 
     a = ap.parse_args()
     if hasattr(a, "func"): a.func(a)
@@ -0,0 +1,173 @@
+# app/mintscan.py
+# 以 mint 为中心的早期买家扫描：
+#   不再逐个 holder 回放（O(holders × txs)），而是只翻 mint 与池子金库账户在 [t0, t0+window] 内的签名流，
+#   每笔交易只解码一次，提取所有 token 余额上升的 owner。成本 ∝ 窗口内交易数，且能看到已清仓的早期买家。
+#   金库按持有人识别（程序账户 / 已知 AMM authority），不按“当前最大的几个账户”猜；窗口签名流被截断时整体失败，不返回残缺结果。
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from datetime import datetime
+import time
+from .rpc import SolRpc
+from .txscan import iter_signatures, fetch_txs_timed, extract_mint_deltas, SYSTEM_PROGRAM
+from .insider import _parsed_info
+
+def _ts(): return datetime.now().strftime("%H:%M:%S")
+def _log(*args): print(f"[{_ts()}]", *args, flush=True)
+
+SLOT_S = 0.4  # 平均出块间隔（秒），只用于初始估计，最终以 getBlockTime 二分为准
+
+# 金库持有人本身是系统账户（有 SOL 余额的 PDA）的 AMM：按地址认；其它池子（pump bonding curve、
+# PumpSwap/Orca/Meteora/Raydium CLMM）的金库持有人是池子状态账户，按“程序拥有”认（可持续补充）
+AMM_AUTHORITIES = {
+    "5Q544fKrFoe6tsEbD7S8EmxGTJYAKtTVhAW5Q5pge4j1",  # Raydium AMM v4
+    "GpMZbSM2GgvTKHJirzeGfMFoaZ8UR2X7F4v8vHTvxFbL",  # Raydium CPMM
+}
+
+class EarlyScanError(RuntimeError):
+    """窗口扫描没法给出完整结果（签名流被截断 / 找不到池子金库），调用方应记为失败而不是用残缺结果"""
+
+def _block_time_near(rpc: SolRpc, slot: int, probe: int = 8) -> Tuple[Optional[int], Optional[int]]:
+    # 跳过的 slot 没有 blockTime，向后探几个
+    for s in range(slot, slot + probe):
+        try:
+            t = rpc.get_block_time(s)
+        except Exception:
+            t = None
+        if t is not None:
+            return s, t
+    return None, None
+
+def slot_after_time(rpc: SolRpc, t: int) -> Optional[int]:
+    """
+    找 blockTime > t 的第一个 slot：先按当前 slot/时间粗估，再用 getBlockTime 二分（约 20~30 次轻量调用）
+    """
+    tip = rpc.get_slot()
+    if tip is None: return None
+    tip_s, tip_t = _block_time_near(rpc, max(0, tip - 64))
+    if tip_t is None or tip_t <= t: return None
+    guess = max(0, tip_s - int((tip_t - t) / SLOT_S))
+    span = max(10_000, int((tip_s - guess) * 0.1))
+    lo = max(0, guess - span)
+    # 保证 lo 的时间 <= t（否则继续往前扩）
+    while lo > 0:
+        _, lt = _block_time_near(rpc, lo)
+        if lt is not None and lt <= t: break
+        span *= 2; lo = max(0, guess - span)
+    hi = tip_s
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        s, mt = _block_time_near(rpc, mid)
+        if s is None:
+            lo = mid; continue  # 不可用（节点裁剪的旧区块/连续跳过）：当作更早
+        if s >= hi:
+            hi = mid; continue
+        if mt > t: hi = s
+        else: lo = s
+    return hi
+
+def signature_after_time(rpc: SolRpc, t: int) -> Optional[str]:
+    """
+    取一个时间晚于 t 的区块里的签名，作为 getSignaturesForAddress 的 before 游标：
+    从这里往旧翻，第一页就落在窗口末端，不必从最新交易一路翻回去。
+    """
+    try:
+        s = slot_after_time(rpc, t)
+        for slot in range(s, s + 8) if s is not None else ():
+            blk = rpc.get_block_signatures(slot)
+            sigs = (blk or {}).get("signatures") or []
+            if sigs: return sigs[0]
+    except Exception:
+        return None
+    return None
+
+def pool_owners(rpc: SolRpc, owners: Iterable[str]) -> Set[str]:
+    """
+    owners 里哪些是池子/金库的持有人：已知 AMM authority，或该地址是程序账户（可执行，或 owner 不是 System Program，
+    如 bonding curve / 池子状态账户）。普通钱包（System Program 拥有）和链上不存在的地址都不算。
+    """
+    uniq = [o for o in dict.fromkeys(owners) if o]
+    out = {o for o in uniq if o in AMM_AUTHORITIES}
+    rest = [o for o in uniq if o not in out]
+    for lo in range(0, len(rest), 100):
+        part = rest[lo:lo + 100]
+        for o, v in zip(part, rpc.get_accounts_meta(part)):
+            if v and (v.get("executable") or v.get("owner") != SYSTEM_PROGRAM):
+                out.add(o)
+    return out
+
+def pool_accounts(rpc: SolRpc, mint: str, topn: int = 20) -> List[str]:
+    # 金库/池子账户：当前最大的 topn 个 Token Account 里、持有人是池子（见 pool_owners）的那些；大户钱包的 ATA 不算
+    res = rpc.get_token_largest_accounts(mint) or {}
+    atas = [it["address"] for it in (res.get("value") or [])[:topn] if it.get("address")]
+    if not atas:
+        return []
+    vals = (rpc.get_multiple_accounts(atas) or {}).get("value") or []
+    holder = {a: _parsed_info(v).get("owner") for a, v in zip(atas, vals)}
+    pools = pool_owners(rpc, holder.values())
+    return [a for a in atas if holder.get(a) in pools]
+
+def early_buyers_by_mint(rpc: SolRpc, mint: str, t0: int, window_h: float = 2.0,
+                         accounts: Optional[List[str]] = None, vault_topn: int = 20,
+                         max_sigs: int = 50_000, chunk: int = 1000) -> List[Tuple[str,int,int]]:
+    """
+    返回与 logscan.scan_early 相同形状的命中：[(owner, first_buy_idx, net_raw)]，按 first_buy_idx 升序。
+      - first_buy_idx：该 owner 首次买入在窗口交易流（旧→新）里的全局序号，越小越早
+      - net_raw：窗口内净变动（>0 才算命中）
+    accounts 为额外的池子/金库地址；不给则从最大的 vault_topn 个 Token Account 里按持有人识别（pool_accounts），
+    一个都认不出时抛 EarlyScanError（要求 --pools）。
+    这些账户本身的余额变化不计入任何 owner；命中里持有人是池子（pool_owners）的也剔除（窗口期的 bonding curve 等）。
+    任一签名流在 max_sigs 条 / 页数上限内没翻到 t0 时抛 EarlyScanError：被截掉的恰好是最早的买家。
+    """
+    t1 = t0 + int(window_h * 3600)
+    vaults = list(accounts) if accounts is not None else pool_accounts(rpc, mint, vault_topn)
+    if not vaults:
+        raise EarlyScanError(f"no pool vault found among the {vault_topn} largest token accounts of {mint}; pass --pools")
+    if accounts is None:
+        _log(f"[early][mint] skip vaults (pool-owned): {', '.join(vaults)}")
+    streams = [mint] + [a for a in vaults if a != mint]
+    cursor = signature_after_time(rpc, t1)
+    _log(f"[early][mint] streams={len(streams)} window=[{t0},{t1}] cursor={'yes' if cursor else 'no(from newest)'}")
+
+    seen: Dict[str, Tuple[int, int]] = {}  # sig -> (blockTime, slot)
+    for addr in streams:
+        n0 = len(seen)
+        it = iter_signatures(rpc, addr, t_from=t0, t_to=t1, before=cursor, limit=max_sigs, max_pages=max_sigs // 1000 + 1)
+        while True:
+            try:
+                s = next(it)
+            except StopIteration as e:
+                complete = e.value
+                break
+            if s.get("err") is not None or not s.get("signature"):
+                continue  # 失败交易余额不变，不必解码
+            seen.setdefault(s["signature"], (s["blockTime"], s.get("slot") or 0))
+        _log(f"[early][mint] stream {addr[:8]}… +{len(seen)-n0} sigs")
+        if not complete:
+            why = f"more than {max_sigs} signatures in window" if cursor else "no cursor near window end and newest pages did not reach t0"
+            _log(f"[early][mint][ERR] stream {addr[:8]}… truncated before t0 ({why})")
+            raise EarlyScanError(f"signature walk of {addr} truncated before t0={t0}: {why}")
+
+    order = sorted(seen, key=lambda k: seen[k])  # 旧→新
+    skip = set(vaults)
+    net: Dict[str, int] = {}
+    first: Dict[str, int] = {}
+    t_start = time.time()
+    for lo in range(0, len(order), chunk):
+        part = order[lo:lo+chunk]
+        for i, (_, tx) in enumerate(fetch_txs_timed(rpc, part)):
+            if not tx: continue
+            for owner, d in extract_mint_deltas(tx, mint, skip_accounts=skip).items():
+                if d == 0: continue
+                net[owner] = net.get(owner, 0) + d
+                if d > 0 and owner not in first:
+                    first[owner] = lo + i
+        el = max(1e-6, time.time() - t_start)
+        _log(f"[early][mint] decoded {min(lo+chunk, len(order))}/{len(order)} txs owners={len(net)} ({(lo+len(part))/el:.1f} tx/s)")
+
+    hits = [(o, fb, net[o]) for o, fb in first.items() if net.get(o, 0) > 0]
+    pools = pool_owners(rpc, [o for o, _, _ in hits])
+    if pools:
+        names = sorted(pools)
+        _log(f"[early][mint] skip pool-owned holders ({len(names)}): {', '.join(names[:10])}{' …' if len(names) > 10 else ''}")
+        hits = [h for h in hits if h[0] not in pools]
+    hits.sort(key=lambda x: x[1])
+    return hits
@@ -1,33 +1,253 @@
-import os, requests
+# app/price.py
+# 价格服务（BirdEye，best-effort）：按 mint × 时间桶缓存，进程内共享
+#   - 历史价：/defi/history_price 一次取一段区间的全部桶（首次按 PRICE_PREFETCH_S 往前多取一段），
+#     之后同一 mint 的其它地址只在本地按回合的开/平仓时间查桶，不再发请求
+#   - 现价：/defi/multi_price 一次最多 100 个 mint；不支持时退回旧的单 mint 接口。历史价取不到时现价只用于
+#     当前桶，已收盘的回合一律按“没价”（pnl_usd 为空）处理，并打日志
+#   - 已收盘的桶不会再变，只有当前桶和现价按 PRICE_TTL_S 过期；mint 数超过 PRICE_CACHE_MINTS 时按 LRU 淘汰
+#   - 全程一个 requests.Session（连接复用）；请求失败在 TTL 内记住，不会每个地址重试一遍
+import os, time, bisect, threading, requests
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
 from dotenv import load_dotenv
 load_dotenv()
 
+try:
+    import numpy as np
+except ImportError:  # 可选依赖，只有 at_many 用到
+    np = None
+
 BIRD=os.getenv("BIRD_EYE_API","").rstrip("/")
 KEY =os.getenv("BIRD_EYE_KEY","")
 
-def get_token_price_usd(mint: str, base_url: str = None, key: str = None):
-    base = base_url or BIRD
-    api  = key or KEY
-    if not base:
+BUCKET_S = int(os.environ.get("PRICE_BUCKET_S", "3600") or 3600)
+TTL_S = float(os.environ.get("PRICE_TTL_S", "60") or 60)
+MAX_MINTS = int(os.environ.get("PRICE_CACHE_MINTS", "256") or 256)
+PREFETCH_S = int(os.environ.get("PRICE_PREFETCH_S", str(7 * 86400)) or 0)
+HISTORY_MAX = 1000      # 单次历史请求最多的点数，区间更长时分段
+MULTI_MAX = 100         # multi_price 单次 mint 数
+
+# BirdEye history_price 的 type 参数（桶长秒数 → 周期）
+_TYPES = {60: "1m", 180: "3m", 300: "5m", 900: "15m", 1800: "30m", 3600: "1H", 7200: "2H",
+          14400: "4H", 21600: "6H", 28800: "8H", 43200: "12H", 86400: "1D"}
+
+_session = requests.Session()
+
+def _get(base: str, key: str, path: str, params: dict):
+    headers = {"x-chain": "solana"}
+    if key: headers["X-API-KEY"] = key
+    r = _session.get(f"{base}{path}", params=params, headers=headers, timeout=8)
+    r.raise_for_status()
+    return r.json()
+
+def _num(v) -> Optional[float]:
+    # 不同供应商结构不同，容错提取
+    if isinstance(v, dict):
+        for kk in ("price", "value", "usd"):
+            if kk in v: return _num(v[kk])
         return None
-    try:
-        # 轻价源（示例）：/public/price?address=<mint>&chain=solana
-        url=f"{base}/public/price?address={mint}&chain=solana"
-        headers={}
-        if api: headers["X-API-KEY"]=api
-        r=requests.get(url, headers=headers, timeout=8)
-        r.raise_for_status()
-        j=r.json()
-        # 不同供应商结构不同，容错提取
-        for k in ("price","value","data"):
-            if k in j:
-                v=j[k]
-                if isinstance(v, dict):
-                    for kk in ("price","value","usd"):
-                        if kk in v: return float(v[kk])
-                else:
-                    try: return float(v)
-                    except: pass
+    try: return float(v)
+    except (TypeError, ValueError): return None
+
+class PriceSeries:
+    """
+    某 mint 的分桶价格（桶起点升序）。at(ts) 取 ts 所在桶的价；该桶缺失时沿用之前最近的已知价，
+    更早也没有则用之后最近的。lo 为历史已覆盖的最早桶：更早的 ts（那段没取到）返回 None。
+    整段都没有历史价时只有当前桶（live，还没收盘）用现价 spot，更早的回合返回 None（盈亏未知），
+    不拿现价冒充当时的价。
+    """
+    __slots__ = ("mint", "bucket_s", "times", "prices", "spot", "lo", "live")
+
+    def __init__(self, mint: str, bucket_s: int, times: List[int], prices: List[float], spot: Optional[float] = None,
+                 lo: Optional[int] = None, live: Optional[int] = None):
+        self.mint, self.bucket_s, self.times, self.prices, self.spot = mint, bucket_s, times, prices, spot
+        self.lo, self.live = lo, live
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def at(self, ts: int) -> Optional[float]:
+        b = ts - ts % self.bucket_s
+        if not self.times:
+            return self.spot if self.live is not None and b >= self.live else None
+        if self.lo is not None and b < self.lo:
+            return None
+        i = bisect.bisect_right(self.times, b) - 1
+        return self.prices[max(i, 0)]
+
+    def at_many(self, ts):
+        # at 的向量版（numpy 数组进出），与逐个 at 的结果相同（None 记为 nan）；整段都没有价时返回 None
+        b = ts - ts % self.bucket_s
+        if not self.times:
+            if self.spot is None or self.live is None:
+                return None
+            return np.where(b >= self.live, self.spot, np.nan)
+        i = np.searchsorted(np.asarray(self.times, dtype=np.int64), b, side="right") - 1
+        out = np.asarray(self.prices, dtype=np.float64)[np.maximum(i, 0)]
+        return out if self.lo is None else np.where(b >= self.lo, out, np.nan)
+
+class _Mint:
+    __slots__ = ("pts", "lo", "hi", "fetched", "failed", "spot", "spot_at", "series", "lock")
+
+    def __init__(self):
+        self.pts: Dict[int, float] = {}
+        self.lo = self.hi = None          # 已覆盖的桶区间 [lo, hi]
+        self.fetched = 0.0                # hi 所在桶（当时的当前桶）的取数时间
+        self.failed = 0.0                 # 最近一次历史请求失败的时间
+        self.spot: Optional[float] = None
+        self.spot_at = 0.0
+        self.series: Optional[PriceSeries] = None
+        self.lock = threading.Lock()
+
+class PriceCache:
+    def __init__(self, base: str, key: str, bucket_s: int = BUCKET_S, ttl: float = TTL_S, max_mints: int = MAX_MINTS):
+        self.base, self.key = base, key
+        self.bucket_s, self.ttl, self.max_mints = bucket_s, ttl, max_mints
+        self._mints: "OrderedDict[str, _Mint]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def _ent(self, mint: str) -> _Mint:
+        with self._lock:
+            ent = self._mints.get(mint)
+            if ent is None:
+                ent = self._mints[mint] = _Mint()
+                while len(self._mints) > self.max_mints:
+                    self._mints.popitem(last=False)
+            else:
+                self._mints.move_to_end(mint)
+            return ent
+
+    def _history(self, mint: str, lo: int, hi: int) -> Dict[int, float]:
+        # [lo, hi] 内的全部桶（桶起点），按 HISTORY_MAX 分段请求
+        typ = _TYPES.get(self.bucket_s)
+        if not typ:
+            raise ValueError(f"unsupported PRICE_BUCKET_S={self.bucket_s}")
+        out: Dict[int, float] = {}
+        step = HISTORY_MAX * self.bucket_s
+        for a in range(lo, hi + 1, step):
+            b = min(hi + self.bucket_s - 1, a + step - 1)
+            self.requests += 1
+            j = _get(self.base, self.key, "/defi/history_price",
+                     {"address": mint, "address_type": "token", "type": typ, "time_from": a, "time_to": b})
+            for it in ((j.get("data") or {}).get("items") or []):
+                t, v = it.get("unixTime"), _num(it.get("value"))
+                if t is not None and v is not None:
+                    out[int(t) - int(t) % self.bucket_s] = v
+        return out
+
+    def _missing(self, ent: _Mint, lo: int, hi: int, now: float) -> List[Tuple[int, int]]:
+        B = self.bucket_s
+        cur = int(now) - int(now) % B
+        hi = min(hi, cur)
+        if ent.lo is None:
+            # 首次：往前多取 PREFETCH_S，一直取到当前桶，同 mint 的其它地址基本都能命中
+            pre = cur - PREFETCH_S
+            return [(min(lo, pre - pre % B), cur)]
+        out = []
+        if lo < ent.lo:
+            # 往前补也多取一段 PREFETCH_S，按时间倒序遇到的地址不会各自触发一次小请求
+            pre = ent.lo - PREFETCH_S
+            out.append((min(lo, pre - pre % B), ent.lo - B))
+        # hi 桶取数时还没收盘：过了 TTL 从它开始重取（含之后新出现的桶）
+        live = ent.hi >= int(ent.fetched) - int(ent.fetched) % B
+        if hi > ent.hi or (live and hi >= ent.hi and now - ent.fetched > self.ttl):
+            out.append((ent.hi if live else ent.hi + B, cur))
+        return out
+
+    def series(self, mint: str, ts: Iterable[int]) -> PriceSeries:
+        """覆盖 ts 中所有时间的价格序列；缺的区间才请求，其余直接用缓存"""
+        ts = [int(t) for t in ts if t]
+        ent = self._ent(mint)
+        with ent.lock:
+            now = time.time()
+            B = self.bucket_s
+            todo = []
+            if ts and now - ent.failed > self.ttl:
+                todo = self._missing(ent, min(ts) - min(ts) % B, max(ts) - max(ts) % B, now)
+            try:
+                for a, b in todo:
+                    got = self._history(mint, a, b)
+                    ent.pts.update(got)
+                    ent.lo = a if ent.lo is None else min(ent.lo, a)
+                    if ent.hi is None or b >= ent.hi:
+                        ent.hi, ent.fetched = b, now
+                    ent.series = None
+            except Exception as e:
+                ent.failed = now
+                print(f"[price] history failed for {mint[:8]}…: {e}; rounds outside the cached range have no USD PnL", flush=True)
+            if not ent.pts:
+                # 没有历史价：现价只给当前桶用（TTL 内缓存），更早的回合 pnl_usd 为空
+                if todo and now - ent.failed > self.ttl:
+                    print(f"[price] no price history for {mint[:8]}…; only the current bucket uses the spot price", flush=True)
+                self.spot([mint])
+            cur = int(now) - int(now) % B
+            if ent.series is None or ent.series.spot != ent.spot or ent.series.live != cur:
+                keys = sorted(ent.pts)
+                ent.series = PriceSeries(mint, B, keys, [ent.pts[k] for k in keys], ent.spot, ent.lo, cur)
+            return ent.series
+
+    def _spot_one(self, mint: str) -> Optional[float]:
+        try:
+            # 轻价源（示例）：/public/price?address=<mint>&chain=solana
+            self.requests += 1
+            j = _get(self.base, self.key, "/public/price", {"address": mint, "chain": "solana"})
+            for k in ("price", "value", "data"):
+                if k in j:
+                    v = _num(j[k])
+                    if v is not None: return v
+        except Exception:
+            pass
         return None
-    except Exception:
+
+    def _spot_many(self, mints: List[str]) -> Dict[str, Optional[float]]:
+        out: Dict[str, Optional[float]] = {}
+        for i in range(0, len(mints), MULTI_MAX):
+            part = mints[i:i + MULTI_MAX]
+            self.requests += 1
+            data = _get(self.base, self.key, "/defi/multi_price", {"list_address": ",".join(part)}).get("data") or {}
+            for m in part:
+                out[m] = _num(data.get(m)) if data.get(m) is not None else None
+        return out
+
+    def spot(self, mints: List[str]) -> Dict[str, Optional[float]]:
+        """多个 mint 的现价：TTL 内的直接用缓存，其余合并成 multi_price 请求"""
+        now = time.time()
+        ents = {m: self._ent(m) for m in dict.fromkeys(mints)}
+        stale = [m for m, e in ents.items() if e.spot_at == 0 or now - e.spot_at > self.ttl]
+        if stale:
+            try:
+                got = self._spot_many(stale)
+            except Exception:
+                got = {m: self._spot_one(m) for m in stale}
+            for m in stale:
+                ents[m].spot, ents[m].spot_at = got.get(m), now
+        return {m: e.spot for m, e in ents.items()}
+
+_shared: Dict[Tuple[str, str], PriceCache] = {}
+_shared_lock = threading.Lock()
+
+def shared_cache(base_url: str = None, key: str = None) -> Optional[PriceCache]:
+    # 每个 (价源, key) 一个进程内缓存；没配价源返回 None
+    base = (base_url or BIRD).rstrip("/")
+    api = key or KEY
+    if not base:
         return None
+    with _shared_lock:
+        c = _shared.get((base, api))
+        if c is None:
+            c = _shared[(base, api)] = PriceCache(base, api)
+        return c
+
+def price_series(mint: str, ts: Iterable[int], base_url: str = None, key: str = None) -> Optional[PriceSeries]:
+    # 覆盖 ts 的分桶历史价；没配价源返回 None（调用方跳过 USD 换算）
+    c = shared_cache(base_url, key)
+    return c.series(mint, ts) if c else None
+
+def get_prices_usd(mints: List[str], base_url: str = None, key: str = None) -> Dict[str, Optional[float]]:
+    c = shared_cache(base_url, key)
+    return c.spot(mints) if c else {m: None for m in mints}
+
+def get_token_price_usd(mint: str, base_url: str = None, key: str = None):
+    # 现价（TTL 内缓存）；保留旧接口
+    return get_prices_usd([mint], base_url, key).get(mint)
@@ -0,0 +1,192 @@
+# app/ratelimit.py
+# 按端点自适应限速：令牌桶（请求/秒）+ AIMD 并发窗口，替代各处手调的 sleep_ms
+#   - 成功：首次限流前慢启动（速率约每秒翻倍）；之后线性增加（加性增，每秒 +10% 上次限流水位）
+#   - 被限流（HTTP 429/503、Retry-After、JSON-RPC 限流错误码）：速率、并发减半（乘性减），
+#     并按 Retry-After（没有则指数退避 + 抖动）暂停整个端点后重试
+#   - 同一端点 URL 的所有客户端共享一个限速器，吞吐自动收敛到 provider 允许的水平
+import os, re, time, random, threading
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlsplit
+from email.utils import parsedate_to_datetime
+import requests
+
+def _env_f(name: str, default: float) -> float:
+    try: return float(os.environ.get(name, "") or default)
+    except ValueError: return default
+
+RATE_INIT = _env_f("RPC_RATE", 20.0)        # 初始速率（请求/秒）
+RATE_MAX  = _env_f("RPC_RATE_MAX", 500.0)   # 速率上限
+RATE_MIN  = 0.5
+CONC_INIT = _env_f("RPC_CONC", 4.0)         # 初始并发窗口
+CONC_MAX  = _env_f("RPC_CONC_MAX", 64.0)
+RETRIES   = int(_env_f("RPC_RETRIES", 6))
+BACKOFF_S = 0.5                             # 无 Retry-After 时的退避基数（指数 + 抖动）
+COOLDOWN_S = 1.0                            # 一次限流只减一次：同一波在途请求的 429 不重复减半
+
+# 常见 provider 的“限流”JSON-RPC 错误码（-32005 Infura/Alchemy，-32007 QuickNode，-32429/429 Helius 等）
+RATE_CODES = {429, -32005, -32007, -32029, -32429}
+_RATE_MSG = re.compile(r"rate.?limit|too many requests|limit exceeded|exceeded .*capacity|throttl", re.I)
+# 同样的错误码也用于“区间过大/结果过多”（如 -32005 query returned more than 10000 results），这类不是限流
+_NOT_RATE = re.compile(r"block range|range is too|more than \d+ results|query returned|response size", re.I)
+
+class RateLimited(RuntimeError):
+    """重试用尽后仍被限流"""
+
+def is_rate_error(err: Any) -> bool:
+    if not isinstance(err, dict):
+        return bool(err) and bool(_RATE_MSG.search(str(err))) and not _NOT_RATE.search(str(err))
+    msg = str(err.get("message") or "")
+    if _NOT_RATE.search(msg):
+        return False
+    return err.get("code") in RATE_CODES or bool(_RATE_MSG.search(msg))
+
+def _retry_after(resp: requests.Response) -> Optional[float]:
+    v = (resp.headers.get("Retry-After") or "").strip()
+    if not v: return None
+    try:
+        return max(0.0, float(v))
+    except ValueError:
+        try: return max(0.0, parsedate_to_datetime(v).timestamp() - time.time())
+        except Exception: return None
+
+class Limiter:
+    def __init__(self, name: str, rate: float = RATE_INIT, conc: float = CONC_INIT):
+        self.name = name
+        self.rate = max(RATE_MIN, min(RATE_MAX, rate))
+        self.conc = max(1.0, min(CONC_MAX, conc))
+        self.tokens = 1.0
+        self.inflight = 0
+        self.pause_until = 0.0
+        self.last_cut = 0.0
+        self.ssthresh = None  # 上次限流时的速率；None = 还在慢启动
+        self.ok = self.limited = 0
+        self._t = time.monotonic()
+        self._cv = threading.Condition()
+
+    def acquire(self):
+        # 同时满足：不在暂停期、并发窗口有空位、令牌桶有令牌
+        with self._cv:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(max(1.0, self.rate), self.tokens + (now - self._t) * self.rate)
+                self._t = now
+                wait = self.pause_until - now
+                if wait <= 0 and self.inflight < int(self.conc):
+                    if self.tokens >= 1.0:
+                        self.tokens -= 1.0
+                        self.inflight += 1
+                        return
+                    wait = (1.0 - self.tokens) / self.rate
+                self._cv.wait(timeout=wait if wait > 0 else None)
+
+    def release(self, ok: bool = True):
+        with self._cv:
+            self.inflight -= 1
+            if ok:
+                self.ok += 1
+                if self.ssthresh is None:
+                    # 慢启动：每个成功 +1 rps / +1 并发（约每秒翻倍）
+                    self.rate = min(RATE_MAX, self.rate + 1.0)
+                    self.conc = min(CONC_MAX, self.conc + 1.0)
+                else:
+                    # 加性增：每秒约 +10% 的限流水位；每个并发窗口 +1 并发
+                    self.rate = min(RATE_MAX, self.rate + 0.1 * self.ssthresh / max(1.0, self.rate))
+                    self.conc = min(CONC_MAX, self.conc + 1.0 / self.conc)
+            self._cv.notify_all()
+
+    def throttled(self, retry_after: Optional[float] = None):
+        with self._cv:
+            now = time.monotonic()
+            self.limited += 1
+            if now - self.last_cut >= COOLDOWN_S:
+                self.ssthresh = self.rate
+                self.rate = max(RATE_MIN, self.rate * 0.5)
+                self.conc = max(1.0, self.conc * 0.5)
+                self.tokens = min(self.tokens, 0.0)
+                self.last_cut = now
+            if retry_after:
+                self.pause_until = max(self.pause_until, now + retry_after)
+            self._cv.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"endpoint": self.name, "rate": round(self.rate, 1), "conc": int(self.conc),
+                "ok": self.ok, "limited": self.limited}
+
+_limiters: Dict[str, Limiter] = {}
+_lim_lock = threading.Lock()
+
+def _env_on(name: str, default: str = "1") -> bool:
+    return (os.environ.get(name, default) or default).strip().lower() in ("1", "true", "yes", "on")
+
+def shared_limiter(url: str) -> Optional[Limiter]:
+    """
+    同一端点 URL 共用一个限速器（多个客户端/线程一起收敛）；RPC_RATE_LIMIT=0 时关闭（返回 None）。
+    按完整 URL 区分：同一 provider 的不同 key 是各自的配额；日志里只显示 host
+    """
+    if not _env_on("RPC_RATE_LIMIT"):
+        return None
+    with _lim_lock:
+        if url not in _limiters:
+            _limiters[url] = Limiter(urlsplit(url).netloc or url)
+        return _limiters[url]
+
+def all_limiters():
+    with _lim_lock:
+        return list(_limiters.values())
+
+def fmt_limits() -> str:
+    ls = all_limiters()
+    if not ls: return "[rate] limiter disabled or unused"
+    return " ".join(f"[rate] {s['endpoint']} rate={s['rate']}/s conc={s['conc']} ok={s['ok']} limited={s['limited']}"
+                    for s in (l.stats() for l in ls))
+
+def _backoff(attempt: int) -> float:
+    # 指数退避 + 全抖动
+    return random.uniform(0, BACKOFF_S * (2 ** attempt))
+
+def _all_rate_errors(j: Any) -> bool:
+    if isinstance(j, dict):
+        return "error" in j and is_rate_error(j["error"])
+    if isinstance(j, list) and j:
+        return all(isinstance(it, dict) and "error" in it and is_rate_error(it["error"]) for it in j)
+    return False
+
+def _any_rate_error(j: Any) -> bool:
+    return isinstance(j, list) and any(isinstance(it, dict) and "error" in it and is_rate_error(it["error"]) for it in j)
+
+def post_json(send: Callable[[], requests.Response], limiter: Optional[Limiter], retries: int = RETRIES,
+              parse: Optional[Callable[[requests.Response], Any]] = None) -> Any:
+    """
+    send() 发出一次 HTTP 请求；这里负责限速、识别限流并带抖动重试，返回解析后的 JSON。
+    parse(r) 可替代 r.json()（如流式解码大响应）；它在限速槽位内执行，读完响应才算一次请求结束。
+      - HTTP 429/503 或整包都是限流错误：通知限速器（减半 + 暂停），退避后重发
+      - 批量里只有部分项被限流：也通知限速器，但结果照常返回（由 jsonrpc.batch_call 重发这些项）
+      - 其它 HTTP 错误照旧 raise_for_status
+    """
+    for attempt in range(retries + 1):
+        if limiter: limiter.acquire()
+        ok, delay = False, None
+        try:
+            r = send()
+            if r.status_code in (429, 503):
+                ra = _retry_after(r)
+                if limiter: limiter.throttled(ra)
+                if attempt >= retries:
+                    r.raise_for_status()
+                delay = ra if ra is not None else _backoff(attempt)
+            else:
+                r.raise_for_status()
+                j = parse(r) if parse else r.json()
+                if _all_rate_errors(j) and attempt < retries:
+                    if limiter: limiter.throttled()
+                    delay = _backoff(attempt)
+                else:
+                    if _any_rate_error(j) or _all_rate_errors(j):
+                        if limiter: limiter.throttled()
+                    else:
+                        ok = True
+                    return j
+        finally:
+            if limiter: limiter.release(ok)
+        time.sleep(delay)
+    raise RateLimited("rate limited: retries exhausted")
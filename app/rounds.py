@@ -1,93 +1,166 @@
 # 对某“地址 × mint”回放最近交易，生成“回合（Round）”
 # Round = 首次净买入后持仓>0 ——> 清仓(或超时)
 # 产出：entry_ts, exit_ts, hold_s, buy_qty, sell_qty, net_tokens, pnl_tokens
+# 以及：同一批交易里的 SOL/USDC 腿算出的 pnl_sol/pnl_usdc（不需要价格源）
 # 以及：首买发生的相对时间窗（基于 t0）
+# 回合持久化在 owner_rounds：再次计算时已平仓回合直接读表，只重放新交易影响到的尾部
+import os
 from typing import Dict, List, Tuple, Optional
 from .rpc import SolRpc
-from .txscan import guess_atas_for_owner, extract_owner_delta_for_mint
+from .txscan import sync_owner_deltas
+from .db import load_owner_window, load_round_state, load_owner_rounds, save_owner_rounds
 from .t0 import time_bucket
-from .price import get_token_price_usd  # 可选，没价源时返回 None
-
-def _tx_time(rpc: SolRpc, tx: dict) -> Optional[int]:
-    slot = tx.get("slot")
-    if slot is None: return None
-    return rpc.get_block_time(slot)
-
-def replay_owner_rounds(rpc: SolRpc, owner: str, mint: str, t0: Optional[int], max_txs=600, timeout_s=24*3600) -> List[Dict]:
-    atas = guess_atas_for_owner(rpc, owner, mint)
-    if not atas: return []
-
-    # 合并 ATA 的签名，去重，按时间正序回放
-    sigs = []
-    for ata in atas:
-        batch = rpc.get_signatures_for_address(ata, limit=max_txs)
-        sigs.extend([s["signature"] for s in (batch or [])])
-    sigs = list(dict.fromkeys(sigs))[:max_txs]
-
-    # 拉 tx 并按时间排序（旧到新）
-    txs = []
-    for sig in sigs:
-        tx = rpc.get_transaction(sig, maxv=0)
-        if not tx: continue
-        ts = _tx_time(rpc, tx)
-        if ts is None: continue
-        txs.append((ts, tx))
-    txs.sort(key=lambda x: x[0])
+from .price import price_series, PriceSeries  # 可选，没价源时返回 None
 
+def replay_owner_rounds(rpc: SolRpc, owner: str, mint: str, t0: Optional[int], max_txs=600, timeout_s=24*3600,
+                        sync: bool = True) -> List[Dict]:
+    # 增量同步（只拉高水位之后的新签名）后，取最近 max_txs 笔持仓变化的回合；sync=False 时只用本地缓存，不打 RPC
+    if sync:
+        sync_owner_deltas(rpc, owner, mint, max_txs=max_txs)
+    rounds = cached_owner_rounds(owner, mint, max_txs, timeout_s)
+    for r in rounds:
+        r["bucket"] = time_bucket(r["entry_ts"], t0)
+    return rounds
+
+def _new(ts=None) -> Dict:
+    return {"entry_ts": ts, "buy": 0, "sell": 0, "net": 0, "sol": 0, "usdc": 0}
+
+def _leg(acc: Optional[int], v: Optional[int]) -> Optional[int]:
+    # 回合内逐笔累加 SOL/USDC 腿；有一笔未知（None）整个回合就未知
+    return None if acc is None or v is None else acc + v
+
+# SOL 腿绝对值不超过它（lamports）的成交视为没按 SOL 结算（币换币：只付了手续费/优先费/ATA 押金）
+SOL_FEE_MAX = int(os.environ.get("SCORE_SOL_FEE_MAX", "10000000") or 0)
+
+def _sol_leg(sol: Optional[int], usdc: Optional[int]) -> Optional[int]:
+    # 一笔成交按 SOL 计的花费/回款：USDC 计价（usdc 腿非 0）或 SOL 只动了手续费量级的，按 SOL 算不出盈亏 → 未知
+    if sol is None or usdc or abs(sol) <= SOL_FEE_MAX:
+        return None
+    return sol
+
+def _replay(txs: List[Tuple], timeout_s=24*3600) -> Tuple[List[Dict], int, int]:
+    """
+    回放 [(ts, delta)] 或 [(ts, delta, sol_delta, usdc_delta)] 旧→新，返回 (回合, clean, 已平仓回合数)。
+    回合的 sol/usdc 为回合内各笔成交（delta != 0）的 SOL/USDC 变化之和（花费为负、回款为正），不带腿时为 None；
+    有一笔不是按 SOL 结算的（见 _sol_leg）回合的 sol 即为 None（USDC 计价/币换币的回合按 SOL 算不出盈亏）。
+    clean 为最后一次“空仓且无进行中回合”时已消费的笔数：从该处起用全新状态重放后缀，结果与从头回放相同。
+    未平仓的收尾回合（至多一个）排在最后。
+    """
     rounds = []
     pos = 0  # token 最小单位
-    cur = {"entry_ts": None, "buy": 0, "sell": 0, "net": 0}
+    cur = _new()
+    clean = 0
 
-    for ts, tx in txs:
-        d = extract_owner_delta_for_mint(tx, owner, mint)  # token delta: +买入 / -卖出
-        if d == 0: 
+    for i, tx in enumerate(txs):  # token delta: +买入 / -卖出
+        ts, d = tx[0], tx[1]
+        if d == 0:
             # 观察超时？
             if cur["entry_ts"] and (ts - cur["entry_ts"] >= timeout_s) and pos>0:
                 # 强制平仓为超时
                 cur["exit_ts"] = ts; cur["hold_s"] = cur["exit_ts"] - cur["entry_ts"]
                 cur["pnl_tokens"] = -cur["net"]  # 若仍持有，按净额（负债）计，v2.0简化
-                cur["bucket"] = time_bucket(cur["entry_ts"], t0)
-                rounds.append(cur); cur={"entry_ts":None,"buy":0,"sell":0,"net":0}; pos=0
-            continue
-
-        if d > 0:
-            # 买入
-            if pos == 0 and cur["entry_ts"] is None:
-                cur = {"entry_ts": ts, "buy": 0, "sell": 0, "net": 0}
-            cur["buy"] += d; cur["net"] += d; pos += d
+                rounds.append(cur); cur=_new(); pos=0
         else:
-            # 卖出
-            cur["sell"] += (-d); cur["net"] += d; pos += d  # d<0
-            if pos <= 0 and cur["entry_ts"] is not None:
-                # 清仓，回合结束
-                cur["exit_ts"] = ts
-                cur["hold_s"] = cur["exit_ts"] - cur["entry_ts"]
-                cur["pnl_tokens"] = cur["sell"] - cur["buy"]  # 仅已实现
-                cur["bucket"] = time_bucket(cur["entry_ts"], t0)
-                rounds.append(cur)
-                cur={"entry_ts":None,"buy":0,"sell":0,"net":0}; pos=0
+            if d > 0 and pos == 0 and cur["entry_ts"] is None:
+                cur = _new(ts)
+            sol, usdc = (tx[2], tx[3]) if len(tx) > 2 else (None, None)
+            cur["sol"] = _leg(cur["sol"], _sol_leg(sol, usdc)); cur["usdc"] = _leg(cur["usdc"], usdc)
+            if d > 0:
+                # 买入
+                cur["buy"] += d; cur["net"] += d; pos += d
+            else:
+                # 卖出
+                cur["sell"] += (-d); cur["net"] += d; pos += d  # d<0
+                if pos <= 0 and cur["entry_ts"] is not None:
+                    # 清仓，回合结束
+                    cur["exit_ts"] = ts
+                    cur["hold_s"] = cur["exit_ts"] - cur["entry_ts"]
+                    cur["pnl_tokens"] = cur["sell"] - cur["buy"]  # 仅已实现
+                    rounds.append(cur)
+                    cur=_new(); pos=0
+        if pos == 0 and cur["entry_ts"] is None:
+            clean = i + 1
+    n_closed = len(rounds)
 
     # 收尾：若仍持有未清仓且超时
     if cur["entry_ts"] and pos>0:
         cur["exit_ts"] = txs[-1][0]
         cur["hold_s"] = cur["exit_ts"] - cur["entry_ts"]
         cur["pnl_tokens"] = -cur["net"]  # 未实现，按净额计
-        cur["bucket"] = time_bucket(cur["entry_ts"], t0)
         rounds.append(cur)
 
+    return rounds, clean, n_closed
+
+def segment_rounds(txs: List[Tuple], t0: Optional[int], timeout_s=24*3600) -> List[Dict]:
+    # 纯回放：[(ts, delta[, sol_delta, usdc_delta])] 旧→新 → 回合列表（roundsvec 的向量化引擎以此为语义基准）
+    rounds = _replay(txs, timeout_s)[0]
+    for r in rounds:
+        r["bucket"] = time_bucket(r["entry_ts"], t0)
     return rounds
 
-def rounds_with_usd(rpc: SolRpc, owner: str, mint: str, t0: Optional[int], price_base_url: Optional[str], price_key: Optional[str], decimals: int = 9) -> List[Dict]:
-    rs = replay_owner_rounds(rpc, owner, mint, t0)
+def cached_owner_rounds(owner: str, mint: str, max_txs=600, timeout_s=24*3600) -> List[Dict]:
+    """
+    owner×mint 的回合（不含 bucket），持久化在 owner_rounds：
+      - 窗口（最近 max_txs 笔）与上次计算时相比只在“干净点”之后有变化 → 已平仓回合直接读表，只重放干净点之后的尾部
+      - 一笔新交易都没有 → 整表直接读（含未平仓回合），不回放
+      - 窗口起点变了（截断滑动）、干净点之前插入了补拉的旧交易、参数不同 → 整段重放
+    """
+    win = load_owner_window(owner, mint, limit=max_txs)  # [(sig, slot, ts, delta, sol_delta, usdc_delta)]
+    if not win:
+        return []
+    st = load_round_state(owner, mint)
+    start, closed = 0, []
+    if (st and st["max_txs"] == max_txs and st["timeout_s"] == timeout_s and st["first_sig"] == win[0][0]
+            and 0 < st["n_upto"] <= len(win) and win[st["n_upto"] - 1][0] == st["upto_sig"]):
+        if st["n_txs"] == len(win) and st["last_sig"] == win[-1][0]:
+            return load_owner_rounds(owner, mint)
+        start, closed = st["n_upto"], load_owner_rounds(owner, mint, closed_only=True)
+
+    tail, clean, n_closed = _replay([w[2:] for w in win[start:]], timeout_s)
+    for i, r in enumerate(tail):
+        r["closed"] = i < n_closed
+    upto = start + clean
+    save_owner_rounds(owner, mint, len(closed), tail, {
+        "max_txs": max_txs, "timeout_s": timeout_s, "first_sig": win[0][0],
+        "upto_sig": win[upto - 1][0] if upto else None, "upto_slot": win[upto - 1][1] if upto else None,
+        "n_upto": upto, "last_sig": win[-1][0], "n_txs": len(win)})
+    return closed + tail
+
+def round_usd(r: Dict, scale: int, prices: Optional[PriceSeries]) -> Optional[Tuple[float, float, float]]:
+    # (开仓价, 平仓价, pnl_usd)：买入量按开仓时刻的价、卖出量按平仓时刻的价折 USD；没价返回 None
+    if prices is None:
+        return None
+    pe, px = prices.at(r["entry_ts"]), prices.at(r["exit_ts"])
+    if pe is None or px is None:
+        return None
+    return pe, px, (r["sell"]/scale) * px - (r["buy"]/scale) * pe
+
+SOL_SCALE = 10**9   # lamports
+USDC_SCALE = 10**6
+
+def round_legs(r: Dict) -> Tuple[Optional[float], Optional[float]]:
+    # (pnl_sol, pnl_usdc)：回合内成交的 SOL/USDC 净变化（含手续费），不需要价格；腿未知、或不是按 SOL 结算的回合
+    # pnl_sol 为 None（打分时不计入胜率/盈亏，而不是按手续费算成一笔小亏）
+    sol, usdc = r.get("sol"), r.get("usdc")
+    return (None if sol is None else sol / SOL_SCALE), (None if usdc is None else usdc / USDC_SCALE)
+
+def rounds_with_usd(rpc: SolRpc, owner: str, mint: str, t0: Optional[int], price_base_url: Optional[str], price_key: Optional[str], decimals: int = 9,
+                    sync: bool = True, prices: bool = True) -> List[Dict]:
+    # prices=False：不查价格源（只按 SOL/USDC 腿算盈亏时用），没有 px_entry/px_exit/pnl_usd
+    rs = replay_owner_rounds(rpc, owner, mint, t0, sync=sync)
     # token 最小单位 → 标准单位
     scale = 10**decimals
-    px = get_token_price_usd(mint, price_base_url, price_key)  # None 则跳过
+    # 开/平仓时刻所在时间桶的历史价（同 mint 的地址共用缓存，不再每个地址请求一次）；没价源则跳过，
+    # 此时 pnl_sol/pnl_usdc（成交里的真实花费/回款）照样有
+    ps = price_series(mint, [t for r in rs for t in (r["entry_ts"], r["exit_ts"])], price_base_url, price_key) if rs and prices else None
     out=[]
     for r in rs:
         buy = r["buy"]/scale; sell = r["sell"]/scale; pnl_tok = r["pnl_tokens"]/scale
         rec = dict(r)
         rec["buy_token"] = buy; rec["sell_token"]=sell; rec["pnl_token"]=pnl_tok
-        if px is not None:
-            rec["pnl_usd"] = pnl_tok * px
+        rec["pnl_sol"], rec["pnl_usdc"] = round_legs(r)
+        usd = round_usd(r, scale, ps)
+        if usd is not None:
+            rec["px_entry"], rec["px_exit"], rec["pnl_usd"] = usd
         out.append(rec)
     return out
@@ -0,0 +1,337 @@
+# app/roundsvec.py
+# 列式回合引擎：一批地址的持仓变化摊平成列 (地址 id, ts, delta[, sol_delta, usdc_delta])，一次算出每个地址的回合与
+# rounds/wins/win_rate/total_pnl/avg_pnl/median_hold_s/max_drawdown（盈亏口径 sol/usd 同 score.calc_metrics）
+#   - 语义与 rounds.segment_rounds + score.calc_metrics 逐项一致（卖出清仓、零变化行上的超时平仓、收尾未平仓、
+#     空仓先卖导致的“负持仓”阶段），浮点累加顺序也相同，结果逐位相等
+#   - 持仓用前缀和表示：回合起点 j 之后第一个 S[k] <= S[j-1] 的行即清仓行（稀疏表 + 倍增查找），
+#     超时行用 searchsorted、负持仓回零行用最小/最大值稀疏表交替查找；每轮迭代所有地址各前进一个回合
+#   - numpy 为可选依赖：没装时逐地址走纯 Python 基准实现；单地址成交量 ≥ 2^53、ts 非递增等边角情况也走基准实现
+from itertools import accumulate
+from operator import itemgetter, ne
+from typing import Dict, List, Optional, Sequence, Tuple
+from .db import load_mint_deltas
+from .price import price_series, PriceSeries
+from .rounds import segment_rounds, round_usd, round_legs, SOL_SCALE, SOL_FEE_MAX
+from .score import calc_metrics, EMPTY_METRICS, PNL_FIELDS, PNL_SOURCE
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖
+    np = None
+
+CHUNK_ROWS = 1 << 20          # 每块处理的行数（按地址对齐），限制稀疏表内存
+_EXACT = 2 ** 53              # float64 精确表示整数的上限
+_BLOCK_CELLS = 1 << 22        # 指标阶段补齐矩阵的单块格数上限
+
+def _metrics_py(txs: List[Tuple], timeout_s: int, scale: int, prices: Optional[PriceSeries], pnl: str) -> Dict:
+    # 基准实现：与 rounds_with_usd → calc_metrics 完全相同的路径；txs 为 [(ts, delta, sol_delta, usdc_delta)]
+    trips = []
+    for r in segment_rounds(txs, None, timeout_s):
+        usd = round_usd(r, scale, prices) if pnl == "usd" else None
+        trips.append({"hold_s": r["hold_s"], "pnl_usd": usd[2] if usd is not None else None, "pnl_sol": round_legs(r)[0]})
+    return calc_metrics(trips, PNL_FIELDS[pnl])
+
+def _group(ids: Sequence[int], ts: Sequence[int], deltas: Sequence[int], sols: Sequence[Optional[int]],
+           usdcs: Sequence[Optional[int]], n: int, need=None) -> Dict[int, List[Tuple]]:
+    out: Dict[int, List[Tuple]] = {i: [] for i in (range(n) if need is None else need)}
+    for i, t, d, v, u in zip(ids, ts, deltas, sols, usdcs):
+        if i in out: out[i].append((t, d, v, u))
+    return out
+
+def _segment(t, d, starts, timeout_s: int):
+    """
+    单块回合切分。t/d 为 int64，按地址分组、组内按时间排好；starts 为各地址首行（升序）。
+    返回 (地址序号, 起点行, 终点行, 已平仓) 四个数组，行号指向每个地址前插了一行 delta=0 后的数组，
+    以及插行后的 (t, P, Q)：P/Q 为买入量/卖出量前缀和。
+    """
+    n = len(starts)
+    # 每个地址前插一行 delta=0（ts 取首行）：空闲阶段的零变化行不影响状态，插入后任何回合起点 j 都有 j-1 = “起点前持仓”
+    t = np.insert(t, starts, t[starts])
+    d = np.insert(d, starts, 0)
+    N = len(d)
+    begin = starts + np.arange(n)
+    end = np.append(begin[1:], N)
+    own = np.repeat(np.arange(n), end - begin)
+    rowend = end[own]
+    S = np.cumsum(d)                                  # 各地址的持仓 = S - S[地址首行]，比较时只用差值同号，无需扣除
+    P = np.cumsum(np.maximum(d, 0))
+    Q = np.cumsum(np.maximum(-d, 0))
+
+    nz = np.flatnonzero(d)
+    def next_nz(i):
+        # i 之后（同地址内）第一条非零变化行，没有为 -1
+        p = np.searchsorted(nz, i + 1)
+        k = nz[np.minimum(p, len(nz) - 1)] if len(nz) else np.full_like(i, N)
+        return np.where((p < len(nz)) & (k < rowend[i]), k, -1)
+
+    # 零变化行按 (地址, ts) 组合键，供超时查找
+    Z = np.flatnonzero(d == 0)
+    K = int(t.max()) + int(timeout_s) + 1
+    keyZ = own[Z] * K + t[Z]
+
+    # S 的区间最小/最大值稀疏表，层数只需覆盖最长的单地址
+    L = max(1, int((end - begin).max()).bit_length())
+    tmin, tmax = [S], [S]
+    for l in range(1, L):
+        w = 1 << (l - 1)
+        for tb, f in ((tmin, np.minimum), (tmax, np.maximum)):
+            prev = tb[-1]
+            cur = prev.copy()
+            cur[:-w] = f(prev[:-w], prev[w:])
+            tb.append(cur)
+
+    def first_cross(start, v, e, le: bool):
+        # [start, e) 内第一行 S <= v（le）/ S >= v，没有为 N：按 2^l 倒序跳过整块都不满足的区间
+        tb = tmin if le else tmax
+        pos = start
+        for l in range(L - 1, -1, -1):
+            step = 1 << l
+            m = tb[l][np.minimum(pos, N - 1)]
+            pos = np.where((pos + step <= e) & ((m > v) if le else (m < v)), pos + step, pos)
+        sv = S[np.minimum(pos, N - 1)]
+        hit = (pos < e) & ((sv <= v) if le else (sv >= v))
+        return np.where(hit, pos, N)
+
+    def first_le(j):
+        # 回合起点 j 之后第一行持仓 <= 0，即 S[k] <= S[j-1]
+        return first_cross(j + 1, S[j - 1], rowend[j], True)
+
+    def first_eq(j):
+        # 负持仓起点 j 之后第一行 S[k] == S[j-1]：交替找“升到 >= 基准”“降到 <= 基准”，越过而不相等就继续
+        v, e = S[j - 1], rowend[j]
+        k = np.full_like(j, N)
+        pos, le, todo = j + 1, False, np.arange(len(j))
+        while len(todo):
+            hit = first_cross(pos, v[todo], e[todo], le)
+            eq = (hit < N) & (S[np.minimum(hit, N - 1)] == v[todo])
+            k[todo[eq]] = hit[eq]
+            go = (hit < N) & ~eq
+            todo, pos, le = todo[go], hit[go] + 1, not le
+        return k
+
+    def first_timeout(j):
+        # j 之后（同地址内）第一条 ts >= t[j] + timeout 的零变化行，没有为 N；entry_ts 为 0 时原逻辑不做超时
+        if not len(Z):
+            return np.full_like(j, N)
+        p = np.maximum(np.searchsorted(keyZ, own[j] * K + t[j] + timeout_s), np.searchsorted(Z, j + 1))
+        k = Z[np.minimum(p, len(Z) - 1)]
+        return np.where((p < len(Z)) & (k < rowend[j]) & (t[j] != 0), k, N)
+
+    out_own, out_j, out_k, out_closed = [], [], [], []
+    front = next_nz(begin)
+    front = front[front >= 0]
+    while len(front):
+        buy = d[front] > 0
+        nxt = []
+        j = front[buy]
+        if len(j):
+            k = np.minimum(first_le(j), first_timeout(j))
+            closed = k < N
+            # 收尾未平仓：终点取该地址最后一行；entry_ts 为 0 时原逻辑不计
+            keep = closed | (t[j] != 0)
+            out_own.append(own[j][keep]); out_j.append(j[keep])
+            out_k.append(np.where(closed, k, rowend[j] - 1)[keep]); out_closed.append(closed[keep])
+            nxt.append(next_nz(k[closed]))
+        j = front[~buy]
+        if len(j):
+            # 空仓先卖：持仓为负，直到回到起点持仓（S == S[j-1]）才回到空闲；回不去则该地址后面不再成回合
+            k = first_eq(j)
+            nxt.append(next_nz(k[k < N]))
+        front = np.concatenate(nxt) if nxt else front[:0]
+        front = front[front >= 0]
+
+    if not out_own:
+        e = np.zeros(0, dtype=np.int64)
+        return (e, e, e, e.astype(bool)), (t, P, Q)
+    ro, rj, rk, rc = (np.concatenate(x) for x in (out_own, out_j, out_k, out_closed))
+    o = np.argsort(ro, kind="stable")                 # 同地址内保持迭代顺序 = 时间顺序
+    return (ro[o], rj[o], rk[o], rc[o]), (t, P, Q)
+
+def _metrics_np(owner, pnl, hold, n: int) -> List[Dict]:
+    # 回合（已按地址、时间排好）→ 每个地址的指标；与 calc_metrics 的逐项浮点运算相同（pnl 为 nan = 盈亏未知）
+    out = [dict(EMPTY_METRICS) for _ in range(n)]
+    cnt = np.bincount(owner, minlength=n)
+    first = np.concatenate(([0], np.cumsum(cnt)[:-1]))
+    has = np.flatnonzero(cnt)
+    if not len(has):
+        return out
+    known = ~np.isnan(pnl)
+    kcnt = np.bincount(owner, weights=known, minlength=n).astype(np.int64)
+    wins = np.bincount(owner, weights=(pnl > 0), minlength=n).astype(np.int64)
+    pnl = np.where(known, pnl, 0.0)                  # 未知回合按 0.0 参与累加：acc + 0.0 不改变累计/峰值/回撤
+
+    # 中位持仓时长：每个地址内排序后取中间（偶数个取两数均值，与 statistics.median 相同）
+    hs = hold[np.lexsort((hold, owner))]
+    c = cnt[has]; f = first[has]
+    lo = hs[f + (c - 1) // 2]; hi = hs[f + c // 2]
+    med = np.where(c % 2 == 1, lo.astype(np.float64), (lo + hi) / 2)
+
+    # 累计收益 / 回撤：按回合数分块补齐成矩阵，逐行顺序累加（np.cumsum 是严格顺序的，与 Python 循环同序）
+    total = np.zeros(n); dd = np.zeros(n)
+    by_cnt = has[np.argsort(cnt[has], kind="stable")]
+    i = 0
+    while i < len(by_cnt):
+        w = int(cnt[by_cnt[i]])
+        rows = max(1, _BLOCK_CELLS // max(w, 1))
+        blk = by_cnt[i:i + rows]
+        w = int(cnt[blk].max())
+        col = np.arange(w)
+        idx = first[blk][:, None] + col[None, :]
+        valid = col[None, :] < cnt[blk][:, None]
+        mat = np.where(valid, pnl[np.where(valid, idx, 0)], 0.0)
+        acc = np.cumsum(mat, axis=1)
+        peak = np.maximum.accumulate(np.maximum(acc, 0.0), axis=1)
+        dd[blk] = np.minimum((acc - peak).min(axis=1), 0.0)
+        total[blk] = acc[:, -1]                      # 补齐的 0.0 加在末尾不改变结果
+        i += len(blk)
+
+    for a, m in zip(has.tolist(), med.tolist()):
+        nr = int(cnt[a]); k = int(kcnt[a]); w = int(wins[a]); tot = float(total[a])
+        out[a] = {"rounds": nr, "wins": w, "win_rate": w / k if k else 0.0, "total_pnl": tot,
+                  "avg_pnl": tot / k if k else 0.0, "median_hold_s": int(m), "max_drawdown": float(dd[a])}
+    return out
+
+def batch_metrics(ids: Sequence[int], ts: Sequence[int], deltas: Sequence[int], n: int,
+                  timeout_s: int = 24*3600, decimals: int = 9, prices: Optional[PriceSeries] = None,
+                  sols: Optional[Sequence[Optional[int]]] = None, pnl: str = None,
+                  usdcs: Optional[Sequence[Optional[int]]] = None) -> List[Dict]:
+    """
+    ids/ts/deltas：同长的三列，ids 为 0..n-1 的地址序号；同一地址的行需按时间旧→新排列（各地址之间可交错）。
+    sols/usdcs：同长的 SOL/USDC 腿（最小单位，None = 未知），pnl="sol" 时用（规则同 rounds._sol_leg）；pnl 默认 SCORE_PNL。
+    返回长度为 n 的指标列表（与逐地址 rounds_with_usd + calc_metrics 的结果相同；
+    pnl="usd" 且 prices 为 None、或 pnl="sol" 且没有腿时盈亏全为未知：胜率/盈亏为 0）。
+    """
+    scale = 10 ** decimals
+    pnl = pnl or PNL_SOURCE
+    if sols is None:
+        sols = [None] * len(ids)
+    if usdcs is None:
+        usdcs = [None] * len(ids)
+    if np is None or not len(ids) or scale >= _EXACT:
+        grp = _group(ids, ts, deltas, sols, usdcs, n)
+        return [_metrics_py(grp[i], timeout_s, scale, prices, pnl) for i in range(n)]
+
+    oid = np.asarray(ids, dtype=np.int64)
+    order = np.argsort(oid, kind="stable")
+    oid = oid[order]
+    t = np.asarray(ts, dtype=np.int64)[order]
+    draw = np.asarray(deltas)
+    slow = np.zeros(n, dtype=bool)
+    if draw.dtype.kind in "iu":
+        d = draw.astype(np.int64)[order]
+    else:
+        # 出现浮点/超出 int64 的值：这些地址交给基准实现（保持原始 Python 数值）
+        ok = [isinstance(x, int) and -_EXACT < x < _EXACT for x in deltas]
+        d = np.array([x if o else 0 for x, o in zip(deltas, ok)], dtype=np.int64)[order]
+        slow[oid[~np.array(ok, dtype=bool)[order]]] = True
+    same = oid[1:] == oid[:-1]
+    slow[oid[1:][same & (t[1:] < t[:-1])]] = True                                  # ts 非递增
+    slow |= np.bincount(oid, weights=np.abs(d).astype(np.float64), minlength=n) >= _EXACT
+    slow |= np.bincount(oid, weights=(t < 0), minlength=n) > 0
+    if pnl == "sol":
+        # SOL 腿：未知记 0 并单独计数（回合内有未知即整回合未知）；只有成交行（delta != 0）计入回合
+        vf = np.array(sols, dtype=np.float64)[order]                # None → nan；|x| < 2^53 的整数在 float64 里精确
+        vnull = np.isnan(vf)
+        bad = ~vnull & ((np.abs(vf) >= _EXACT) | (vf != np.floor(vf)))
+        slow[oid[bad]] = True
+        # 同 rounds._sol_leg：USDC 腿非 0、或 SOL 只动了手续费量级的成交也算未知
+        uf = np.array(usdcs, dtype=np.float64)[order]
+        vnull |= (~np.isnan(uf) & (uf != 0)) | (~vnull & (np.abs(vf) <= SOL_FEE_MAX))
+        v = np.where(vnull | bad, 0.0, vf).astype(np.int64)
+        slow |= np.bincount(oid, weights=np.abs(v).astype(np.float64), minlength=n) >= _EXACT
+        trade = d != 0
+        v = np.where(trade, v, 0); vnull = vnull & trade
+
+    out: List[Optional[Dict]] = [None] * n
+    fast = ~slow[oid]
+    fo, ft, fd = oid[fast], t[fast], d[fast]
+    if pnl == "sol":
+        fv, fn = v[fast], vnull[fast].astype(np.int64)
+    starts_all = np.flatnonzero(np.concatenate(([True], fo[1:] != fo[:-1]))) if len(fo) else np.zeros(0, dtype=np.int64)
+    # 按地址对齐切块
+    bounds = [0]
+    for s in starts_all[1:].tolist():
+        if s - bounds[-1] >= CHUNK_ROWS:
+            bounds.append(s)
+    bounds.append(len(fo))
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        if a >= b:
+            continue
+        ct, cd, co = ft[a:b], fd[a:b], fo[a:b]
+        st = starts_all[(starts_all >= a) & (starts_all < b)] - a
+        (ro, rj, rk, _), (tt, P, Q) = _segment(ct, cd, st, timeout_s)
+        if pnl == "sol":
+            # 与 round_legs 同：回合 [j, k] 内成交行的 SOL 腿之和（前缀和同 _segment 一样在各地址前插一行 0）
+            V = np.cumsum(np.insert(fv[a:b], st, 0))
+            U = np.cumsum(np.insert(fn[a:b], st, 0))
+            val = np.where(U[rk] - U[rj - 1] > 0, np.nan, (V[rk] - V[rj - 1]) / SOL_SCALE)
+        else:
+            pb = prices.at_many(tt[rj]) if prices is not None else None
+            pe = prices.at_many(tt[rk]) if prices is not None else None
+            if pb is None or pe is None:
+                val = np.full(len(rj), np.nan)
+            else:
+                # 与 round_usd 同式：卖出量 × 平仓价 − 买入量 × 开仓价；某一端没价（nan）即盈亏未知
+                val = (Q[rk] - Q[rj - 1]) / scale * pe - (P[rk] - P[rj - 1]) / scale * pb
+        val[val == 0] = 0.0     # calc_metrics 用 sum(pnls, 0.0) 从 0.0 起加（-0.0 被吸收），cumsum 从首项起：先把 -0.0 规整掉
+        ms = _metrics_np(ro, val, tt[rk] - tt[rj], len(st))
+        for addr, m in zip(co[st].tolist(), ms):
+            out[addr] = m
+
+    rest = [i for i in range(n) if out[i] is None]
+    if rest:
+        grp = _group(ids, ts, deltas, sols, usdcs, n, need=rest)
+        for i in rest:
+            out[i] = _metrics_py(grp[i], timeout_s, scale, prices, pnl)
+    return out
+
+def load_batch(mint: str, max_txs: int = 600) -> Tuple[List[str], Sequence[int], Sequence[int], Sequence[int],
+                                                         Sequence[Optional[int]], Sequence[Optional[int]]]:
+    """
+    从 owner_deltas 一次取出该 mint 所有已缓存地址，每个地址只留最近 max_txs 笔（与 replay_owner_rounds 同一截断），
+    返回 (owners, ids, ts, deltas, sols, usdcs)，ids 为 owners 下标。行已按 (owner, ts) 排好，id 只需在 owner 变化处加一。
+    """
+    rows = load_mint_deltas(mint)
+    if not rows:
+        return [], [], [], [], [], []
+    own, ts, deltas, sols, usdcs = (list(map(itemgetter(k), rows)) for k in range(5))
+    ids = list(accumulate(map(ne, own[1:], own[:-1]), initial=0))
+    owners = [own[0]] + [b for a, b in zip(own[:-1], own[1:]) if a != b]
+    if max_txs:
+        # 每个地址的末尾 max_txs 行：行号 >= 该地址末行 + 1 - max_txs
+        if np is not None:
+            oid = np.asarray(ids, dtype=np.int64)
+            last = np.searchsorted(oid, oid, side="right")
+            keep = np.flatnonzero(np.arange(len(oid)) >= last - max_txs)
+            if len(keep) < len(oid):
+                kl = keep.tolist()
+                ids, ts = oid[keep], np.asarray(ts, dtype=np.int64)[keep]
+                deltas, sols, usdcs = [deltas[i] for i in kl], [sols[i] for i in kl], [usdcs[i] for i in kl]
+        else:
+            cnt = [0] * len(owners)
+            for i in ids: cnt[i] += 1
+            seen = [0] * len(owners); keep = []
+            for k, i in enumerate(ids):
+                seen[i] += 1
+                if cnt[i] - seen[i] < max_txs: keep.append(k)
+            if len(keep) < len(ids):
+                ids, ts, deltas, sols, usdcs = ([col[k] for k in keep] for col in (ids, ts, deltas, sols, usdcs))
+    return owners, ids, ts, deltas, sols, usdcs
+
+def rescore_cached(mint: str, addrs: Optional[List[str]] = None, price_url: Optional[str] = None,
+                   price_key: Optional[str] = None, decimals: int = 9, max_txs: int = 600,
+                   timeout_s: int = 24*3600, pnl: str = None) -> List[Dict]:
+    """
+    只用本地缓存的持仓变化重算打分（pnl="usd" 时除价格外不打 RPC；"sol" 时完全不联网）：每行 {"addr", rounds, wins, ...}。
+    addrs 为空时覆盖该 mint 下所有已缓存地址；给定时按 addrs 顺序返回，没有缓存的地址记为空指标。
+    """
+    pnl = pnl or PNL_SOURCE
+    owners, ids, ts, deltas, sols, usdcs = load_batch(mint, max_txs)
+    prices = None
+    if owners and pnl == "usd":
+        span = (int(np.min(ts)), int(np.max(ts))) if np is not None else (min(ts), max(ts))
+        prices = price_series(mint, span, price_url, price_key)
+    ms = batch_metrics(ids, ts, deltas, len(owners), timeout_s=timeout_s, decimals=decimals, prices=prices,
+                       sols=sols, pnl=pnl, usdcs=usdcs)
+    by = dict(zip(owners, ms))
+    return [{"addr": a, **by.get(a, EMPTY_METRICS)} for a in (owners if addrs is None else addrs)]
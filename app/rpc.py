@@ -1,22 +1,56 @@
-import os, json, requests
+import json
+from typing import List, Optional
+from .aio import AsyncCallMixin, DEFAULT_INFLIGHT, make_session, make_gate
+from .jsonrpc import batch_call, ok_or_none
+from .txcache import shared_tx_cache
+from .rpcpool import shared_pool, urls_from_env
 
 HDR = {"Content-Type": "application/json"}
 
 # SPL Token Program (mainnet)
 TOKEN_PROGRAM_ID = "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA"
 
+# 延迟敏感的单条读：允许对冲到第二个端点（重的 getProgramAccounts/批量请求不对冲）
+HEDGE_METHODS = {"getAccountInfo", "getBalance", "getTransaction", "getSignaturesForAddress",
+                 "getTokenAccountsByOwner", "getTokenSupply", "getTokenLargestAccounts", "getBlockTime", "getSlot"}
+
 class SolRpc:
-    def __init__(self, url=None, timeout=15):
-        self.url = url or os.environ.get("SOLANA_RPC_URL")
-        if not self.url:
+    def __init__(self, url=None, timeout=15, max_inflight=None, session=None, gate=None, tx_cache="shared"):
+        # url 可为逗号/分号分隔的多个端点；不给则读 SOLANA_RPC_URLS + SOLANA_RPC_URL
+        self.urls = urls_from_env(["SOLANA_RPC_URLS", "SOLANA_RPC_URL"]) if not url else \
+                    [u.strip() for u in url.replace(";", ",").split(",") if u.strip()]
+        if not self.urls:
             raise ValueError("SOLANA_RPC_URL not set in env or args")
+        self.url = self.urls[0]
         self.timeout = timeout
+        # 连接池 + 在途上限：多线程共用同一个实例是安全的；max_inflight 按每个端点计，总上限随端点数放大
+        self.max_inflight = max(1, max_inflight or DEFAULT_INFLIGHT) * len(self.urls)
+        self.gate = gate or make_gate(self.max_inflight)
+        self.session = session or make_session(self.max_inflight)
+        # 多端点池（app/rpcpool.py）：健康度选路 + 故障转移 + 对冲；每个端点自带自适应限速
+        self.pool = shared_pool(self.urls)
+        # getTransaction 透明走本地缓存（app/txcache.py）；传 None 关闭
+        self.tx_cache = shared_tx_cache() if tx_cache == "shared" else tx_cache
+
+    def _post(self, payload, hedge: bool = False):
+        body = json.dumps(payload)
+        with self.gate:
+            return self.pool.post(lambda u: self.session.post(u, headers=HDR, data=body, timeout=self.timeout), hedge=hedge)
+
+    def stream_call(self, method: str, params: list, parse):
+        # 大响应（getProgramAccounts 等）：stream=True，由 parse(r) 边读边解码，返回 parse 的结果
+        body = json.dumps({"jsonrpc": "2.0", "id": 1, "method": method, "params": params})
+        with self.gate:
+            return self.pool.post(lambda u: self.session.post(u, headers=HDR, data=body, timeout=self.timeout, stream=True),
+                                  parse=parse)
 
     def call(self, method: str, params: list):
         payload = {"jsonrpc": "2.0", "id": 1, "method": method, "params": params}
-        r = requests.post(self.url, headers=HDR, data=json.dumps(payload), timeout=self.timeout)
-        r.raise_for_status()
-        return r.json().get("result")
+        return self._post(payload, hedge=method in HEDGE_METHODS).get("result")
+
+    def batch_call(self, method: str, params_list: List[list], max_batch: Optional[int] = None) -> list:
+        # JSON-RPC 数组批量：按 max_batch（默认 RPC_MAX_BATCH=100）分片；单项失败以 RpcError 原位返回
+        return batch_call(self._post, method, params_list, max_batch, single=self.call, key=tuple(self.urls))
 
     def get_token_supply(self, mint: str):
         return self.call("getTokenSupply", [mint])
@@ -27,11 +61,23 @@ class SolRpc:
     def get_token_accounts_by_owner(self, owner: str, mint: str):
         return self.call("getTokenAccountsByOwner", [owner, {"mint": mint}, {"encoding": "jsonParsed"}])
 
-    def get_signatures_for_address(self, addr: str, limit=1000):
-        return self.call("getSignaturesForAddress", [addr, {"limit": limit}])
+    def get_signatures_for_address(self, addr: str, limit=1000, before=None, until=None):
+        # 新→旧；before/until 为签名游标（均不含自身）
+        cfg = {"limit": limit}
+        if before: cfg["before"] = before
+        if until: cfg["until"] = until
+        return self.call("getSignaturesForAddress", [addr, cfg])
 
     def get_transaction(self, sig: str, maxv=0):
-        return self.call("getTransaction", [sig, {"encoding": "json", "maxSupportedTransactionVersion": maxv}])
+        c = self.tx_cache
+        if c is not None:
+            tx = c.get(sig)
+            if tx is not None or c.offline:
+                return tx
+        tx = self.call("getTransaction", [sig, {"encoding": "json", "maxSupportedTransactionVersion": maxv}])
+        if c is not None and tx:
+            c.put(sig, tx)
+        return tx
 
     def get_program_accounts(self, program_id: str, filters=None):
         cfg = {"encoding": "jsonParsed"}
@@ -46,6 +92,40 @@ class SolRpc:
     def get_block_time(self, slot: int):
         return self.call("getBlockTime", [slot])
 
+    def get_slot(self):
+        return self.call("getSlot", [{"commitment": "finalized"}])
+
+    def get_block_signatures(self, slot: int):
+        # 只要该块的签名列表（不含交易体/奖励），用来拿“某时刻附近”的签名当游标
+        return self.call("getBlock", [slot, {"transactionDetails": "signatures", "rewards": False,
+                                             "maxSupportedTransactionVersion": 0}])
+
+    def get_token_largest_accounts(self, mint: str):
+        # 前 20 大 Token Account（地址为 ATA/金库，不是 owner）
+        return self.call("getTokenLargestAccounts", [mint])
+
+    # ---- 批量版热点方法：结果与输入同序，失败项为 None ----
+    def get_transactions(self, sigs: List[str], maxv=0) -> list:
+        # 先查本地缓存，只对未命中的签名发批量请求；离线模式下未命中即 None
+        c = self.tx_cache
+        got = c.get_many(sigs) if c is not None else {}
+        miss = [s for s in dict.fromkeys(sigs) if s not in got]
+        if miss and not (c is not None and c.offline):
+            cfg = {"encoding": "json", "maxSupportedTransactionVersion": maxv}
+            fresh = dict(zip(miss, ok_or_none(self.batch_call("getTransaction", [[s, cfg] for s in miss]))))
+            if c is not None:
+                c.put_many(fresh)
+            got.update(fresh)
+        return [got.get(s) for s in sigs]
+
+    def get_block_times(self, slots: List[int]) -> list:
+        return ok_or_none(self.batch_call("getBlockTime", [[s] for s in slots]))
+
+    def get_balances(self, pubkeys: List[str]) -> list:
+        # lamports 列表（getBalance 的 value 字段）
+        res = ok_or_none(self.batch_call("getBalance", [[p, {"commitment": "confirmed"}] for p in pubkeys]))
+        return [r.get("value") if isinstance(r, dict) else None for r in res]
+
     def get_balance(self, pubkey: str):
         # returns lamports
         return self.call("getBalance", [pubkey, {"commitment": "confirmed"}])
@@ -53,3 +133,34 @@ class SolRpc:
     def get_multiple_accounts(self, pubkeys: list):
         # 批量查余额/账户，返回 value 列表（每项含 lamports）
         return self.call("getMultipleAccounts", [pubkeys, {"encoding": "jsonParsed"}])
+
+    def get_accounts_meta(self, pubkeys: List[str]) -> list:
+        # 只要 owner/executable/lamports（0 字节 dataSlice，不传账户数据）；一次最多 100 个，返回与输入同序的 value 列表
+        res = self.call("getMultipleAccounts", [pubkeys, {"encoding": "base64", "dataSlice": {"offset": 0, "length": 0}}])
+        vals = (res or {}).get("value")
+        if not isinstance(vals, list) or len(vals) != len(pubkeys):
+            raise ValueError(f"getMultipleAccounts: bad response for {len(pubkeys)} keys")
+        return vals
+
+class AsyncSolRpc(AsyncCallMixin, SolRpc):
+    """
+    asyncio 版 SolRpc：方法与 SolRpc 完全一致，只是返回协程：
+        tx = await arpc.get_transaction(sig)
+    max_inflight 为同时在途的请求上限（默认 RPC_MAX_INFLIGHT=16）。
+    """
+    def __init__(self, url=None, timeout=15, max_inflight=None):
+        super().__init__(url, timeout, max_inflight=max_inflight)
+        self.sync = SolRpc(",".join(self.urls), timeout, session=self.session, gate=self.gate, tx_cache=self.tx_cache)
+        self._init_async(self.max_inflight)
+
+    async def get_transaction(self, sig: str, maxv=0):
+        return await self._run(self.sync.get_transaction, sig, maxv)
+
+    async def get_transactions(self, sigs: List[str], maxv=0) -> list:
+        return await self._run(self.sync.get_transactions, sigs, maxv)
+
+    async def get_block_times(self, slots: List[int]) -> list:
+        return await self._run(self.sync.get_block_times, slots)
+
+    async def get_balances(self, pubkeys: List[str]) -> list:
+        return await self._run(self.sync.get_balances, pubkeys)
@@ -0,0 +1,180 @@
+# app/rpcpool.py
+# 多端点 RPC 池：把请求分摊到所有配置的 URL，按健康度路由，慢请求对冲
+#   - 健康度：每个端点记录延迟 EWMA、最近延迟分布（p95）、错误率 EWMA、连续失败次数
+#   - 选路：两随机选一（power of two choices）取分数低者；连续失败的端点冷却一段时间
+#   - 故障转移：连接错误/超时/5xx/限流重试用尽 → 记一次失败并换下一个端点重发
+#   - 对冲：延迟敏感的单条读请求，主端点超过其 p95 仍未返回时，向第二个端点再发一份，谁先回用谁
+#   - 每个端点有自己的限速器（app/ratelimit.py），总吞吐随端点数增加
+import os, time, random, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+import requests
+from .ratelimit import shared_limiter, post_json, RateLimited
+
+def _env_on(name: str, default: str = "1") -> bool:
+    return (os.environ.get(name, default) or default).strip().lower() in ("1", "true", "yes", "on")
+
+HEDGE_MIN_SAMPLES = 20   # 延迟样本不足时不对冲（p95 不可信）
+HEDGE_MIN_S = 0.05       # 对冲阈值下限，避免对极快的请求也发双份
+ERR_ALPHA = 0.1
+LAT_ALPHA = 0.2
+MAX_COOLDOWN_S = 60.0
+HEDGE_THREADS = 128
+
+def urls_from_env(keys: List[str]) -> List[str]:
+    # 支持多环境名 + 多端点，逗号/分号分隔；按出现顺序去重
+    out: List[str] = []
+    for k in keys:
+        v = os.environ.get(k, "").strip()
+        for u in v.replace(";", ",").split(","):
+            u = u.strip()
+            if u and u not in out:
+                out.append(u)
+    return out
+
+class Endpoint:
+    def __init__(self, url: str):
+        self.url = url
+        self.name = urlsplit(url).netloc or url  # 日志里只打 host，不泄露 path 里的 key
+        self.limiter = shared_limiter(url)
+        self.lat = None            # 延迟 EWMA（秒）
+        self.recent = deque(maxlen=200)
+        self.err = 0.0             # 错误率 EWMA
+        self.fails = 0             # 连续失败
+        self.cool_until = 0.0
+        self.inflight = 0
+        self.ok = self.bad = self.hedged = 0
+
+    def p95(self) -> Optional[float]:
+        if len(self.recent) < HEDGE_MIN_SAMPLES: return None
+        xs = sorted(self.recent)
+        return xs[min(len(xs)-1, int(len(xs) * 0.95))]
+
+    def score(self) -> float:
+        # 越小越好：延迟 ×（1 + 错误惩罚）×（1 + 在途负载）
+        lat = self.lat if self.lat is not None else 0.2
+        return lat * (1 + 8 * self.err) * (1 + self.inflight / 4.0)
+
+class EndpointPool:
+    def __init__(self, urls: List[str], hedge: Optional[bool] = None):
+        if not urls: raise ValueError("EndpointPool needs at least one url")
+        self.eps = [Endpoint(u) for u in urls]
+        self.hedge = (_env_on("RPC_HEDGE") if hedge is None else hedge) and len(self.eps) > 1
+        self._lock = threading.Lock()
+        # 对冲时主请求也在这个线程池里跑（才能限时等待），线程按需创建，上限要覆盖总在途数
+        self._hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_THREADS, thread_name_prefix="hedge") if self.hedge else None
+
+    def pick(self, exclude: Tuple[Endpoint, ...] = ()) -> Endpoint:
+        now = time.monotonic()
+        with self._lock:
+            cand = [e for e in self.eps if e not in exclude]
+            healthy = [e for e in cand if e.cool_until <= now] or cand or self.eps
+            if len(healthy) == 1:
+                ep = healthy[0]
+            else:
+                a, b = random.sample(healthy, 2)
+                ep = a if a.score() <= b.score() else b
+            ep.inflight += 1
+            return ep
+
+    def _record(self, ep: Endpoint, dt: float, ok: bool):
+        with self._lock:
+            ep.inflight -= 1
+            if ok:
+                ep.ok += 1; ep.fails = 0
+                ep.lat = dt if ep.lat is None else (1 - LAT_ALPHA) * ep.lat + LAT_ALPHA * dt
+                ep.recent.append(dt)
+            else:
+                ep.bad += 1; ep.fails += 1
+                if ep.fails >= 3:
+                    ep.cool_until = time.monotonic() + min(MAX_COOLDOWN_S, 2.0 ** (ep.fails - 2))
+            ep.err = (1 - ERR_ALPHA) * ep.err + ERR_ALPHA * (0.0 if ok else 1.0)
+
+    def _send(self, ep: Endpoint, send: Callable[[str], requests.Response], parse=None) -> Any:
+        t = time.monotonic()
+        try:
+            j = post_json(lambda: send(ep.url), ep.limiter, parse=parse)
+        except requests.HTTPError as e:
+            # 4xx（非 429）是请求本身的问题（如 getLogs 区间过大），不算端点不健康
+            code = e.response.status_code if e.response is not None else 0
+            self._record(ep, time.monotonic() - t, 400 <= code < 500 and code != 429)
+            raise
+        except Exception:
+            self._record(ep, time.monotonic() - t, False)
+            raise
+        self._record(ep, time.monotonic() - t, True)
+        return j
+
+    def post(self, send: Callable[[str], requests.Response], hedge: bool = False, parse=None) -> Any:
+        """
+        send(url) 发出一次 HTTP 请求；按健康度选端点，失败换端点重试（每个端点最多一次）。
+        hedge=True 且池里多于一个端点时，主请求超过该端点 p95 还没回来就对冲到第二个端点。
+        parse(r) 替代 r.json()（流式响应用；每次重发都重新调用，不会拿到上一个端点的半截结果）。
+        """
+        tried: Tuple[Endpoint, ...] = ()
+        last: Optional[BaseException] = None
+        while len(tried) < len(self.eps):
+            ep = self.pick(tried)
+            tried += (ep,)
+            try:
+                if hedge and self.hedge and parse is None and len(tried) < len(self.eps):
+                    j, other = self._hedged(ep, send, tried)
+                    if other is not None: tried += (other,)
+                    return j
+                return self._send(ep, send, parse)
+            except requests.HTTPError as e:
+                code = e.response.status_code if e.response is not None else 0
+                if 400 <= code < 500 and code != 429:
+                    raise
+                last = e
+            except (requests.RequestException, RateLimited, ValueError) as e:
+                last = e
+        raise last if last else RuntimeError("no rpc endpoint available")
+
+    def _hedged(self, ep: Endpoint, send, tried) -> Tuple[Any, Optional[Endpoint]]:
+        th = ep.p95()
+        if th is None:
+            return self._send(ep, send), None
+        fut = self._hedge_pool.submit(self._send, ep, send)
+        done, _ = wait([fut], timeout=max(HEDGE_MIN_S, th))
+        if done:
+            return fut.result(), None
+        other = self.pick(tried)
+        other.hedged += 1
+        fut2 = self._hedge_pool.submit(self._send, other, send)
+        pending = {fut, fut2}
+        err = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    return f.result(), other  # 慢的那份在后台跑完，只用于更新延迟统计
+                err = f.exception()
+        raise err
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{"endpoint": e.name, "ok": e.ok, "bad": e.bad, "hedged": e.hedged,
+                     "lat_ms": round((e.lat or 0) * 1000), "p95_ms": round((e.p95() or 0) * 1000),
+                     "err": round(e.err, 3), "cooling": e.cool_until > time.monotonic()} for e in self.eps]
+
+_pools: Dict[Tuple[str, ...], EndpointPool] = {}
+_pools_lock = threading.Lock()
+
+def shared_pool(urls: List[str]) -> EndpointPool:
+    # 同一组 URL 在进程内共用一个池（健康统计在所有客户端之间共享）
+    key = tuple(urls)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = EndpointPool(list(urls))
+        return _pools[key]
+
+def fmt_pools() -> str:
+    with _pools_lock:
+        pools = list(_pools.values())
+    lines = [f"[pool] {s['endpoint']} ok={s['ok']} bad={s['bad']} hedged={s['hedged']} lat={s['lat_ms']}ms "
+             f"p95={s['p95_ms']}ms err={s['err']}" + (" (cooling)" if s["cooling"] else "")
+             for p in pools for s in p.stats()]
+    return "\n".join(lines) if lines else "[pool] no endpoints used"
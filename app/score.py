@@ -1,10 +1,11 @@
-import csv, time, statistics
+import os, csv, time, statistics
 from typing import Dict, Any, List, Tuple
 from datetime import datetime
-from app.db import conn
+from app.db import conn, load_run_items, record_item, SQL_LIST_ADDRS
 from app.rpc import SolRpc
 from app.t0 import estimate_t0
 from app.rounds import rounds_with_usd
+from app.aio import fan_out
 
 def _ts(): return datetime.now().strftime("%H:%M:%S")
 def _log(*args): print(f"[{_ts()}]", *args, flush=True)
@@ -21,61 +22,124 @@ class Meter:
 
 def fetch_white(limit:int=None) -> List[str]:
     with conn() as c:
-        cur = c.execute(
-            "SELECT addr FROM lists WHERE status='WHITE' ORDER BY updated_at DESC LIMIT ?;" if limit
-            else "SELECT addr FROM lists WHERE status='WHITE' ORDER BY updated_at DESC;", 
-            (limit,) if limit else ()
-        )
+        cur = c.execute(SQL_LIST_ADDRS, ("WHITE", limit or -1))
         return [r[0] for r in cur.fetchall()]
 
 def fetch_watch(limit:int=None) -> List[str]:
     with conn() as c:
-        cur = c.execute(
-            "SELECT addr FROM lists WHERE status='WATCH' ORDER BY updated_at DESC LIMIT ?;" if limit
-            else "SELECT addr FROM lists WHERE status='WATCH' ORDER BY updated_at DESC;", 
-            (limit,) if limit else ()
-        )
+        cur = c.execute(SQL_LIST_ADDRS, ("WATCH", limit or -1))
         return [r[0] for r in cur.fetchall()]
 
-def calc_metrics(trips: List[Dict[str,Any]]) -> Dict[str,Any]:
+# 打分用哪种盈亏：sol = 同一交易里 SOL/WSOL 的真实花费/回款（不需要价格源）；usd = 按 BirdEye 历史价折算
+# USDC 计价/币换币的回合不折成 SOL（没有价格就没法混算）：sol 口径下记为盈亏未知，只在 rounds 导出里给出 pnl_usdc
+PNL_FIELDS = {"sol": "pnl_sol", "usd": "pnl_usd"}
+PNL_SOURCE = (os.environ.get("SCORE_PNL", "sol") or "sol").strip().lower()
+if PNL_SOURCE not in PNL_FIELDS:
+    PNL_SOURCE = "sol"
+
+EMPTY_METRICS = {"rounds":0,"wins":0,"win_rate":0.0,"total_pnl":0.0,"avg_pnl":0.0,"median_hold_s":0,"max_drawdown":0.0}
+
+def calc_metrics(trips: List[Dict[str,Any]], field: str = None) -> Dict[str,Any]:
+    # field：按哪一列盈亏统计（默认 PNL_FIELDS[PNL_SOURCE]）。盈亏未知（None：没价、或不是按 SOL 结算）的回合
+    # 只计入 rounds 与持仓时长，胜率/盈亏/回撤只在已知盈亏的回合上算（不把未知当成 0 拉低胜率）
     n = len(trips)
     if n == 0:
-        return {"rounds":0,"wins":0,"win_rate":0.0,"total_pnl":0.0,"avg_pnl":0.0,"median_hold_s":0,"max_drawdown":0.0}
-    pnls = [float(t.get("pnl_usd") or 0.0) for t in trips]
+        return dict(EMPTY_METRICS)
+    field = field or PNL_FIELDS[PNL_SOURCE]
+    pnls = [float(t[field]) for t in trips if t.get(field) is not None]
+    k = len(pnls)
     wins = sum(1 for x in pnls if x > 0)
-    total = sum(pnls)
-    avg = total / n
+    total = sum(pnls, 0.0)
+    avg = total / k if k else 0.0
     holds = [int(t.get("hold_s") or 0) for t in trips if t.get("hold_s") is not None]
     median_hold = int(statistics.median(holds)) if holds else 0
     dd = 0.0; peak = 0.0; acc = 0.0
     for x in pnls:
         acc += x; peak = max(peak, acc); dd = min(dd, acc - peak)
-    return {"rounds": n, "wins": wins, "win_rate": wins/n, "total_pnl": total, "avg_pnl": avg,
+    return {"rounds": n, "wins": wins, "win_rate": wins/k if k else 0.0, "total_pnl": total, "avg_pnl": avg,
             "median_hold_s": median_hold, "max_drawdown": dd}
 
+SCORE_FIELDS = ["addr","sol_balance","rounds","wins","win_rate","total_pnl","avg_pnl","median_hold_s","max_drawdown"]
+
+class CsvStream:
+    """
+    边算边写的 CSV：按地址原始顺序追加（由 _score_many 负责排序后回调），每行 flush，进程被杀也不丢已算结果
+    """
+    def __init__(self, path: str, fields: List[str] = SCORE_FIELDS):
+        self.path = path
+        self._f = open(path, "w", newline="")
+        self._w = csv.DictWriter(self._f, fieldnames=fields, extrasaction="ignore")
+        self._w.writeheader()
+    def __call__(self, row: Dict[str,Any]):
+        self._w.writerow(row); self._f.flush()
+    def close(self):
+        self._f.close()
+
+def _score_many(addrs: List[str], one, workers: int = 1, run_id: str = None, sink=None,
+                on_done=None) -> List[Dict[str,Any]]:
+    """
+    并发打分执行器：
+      - one(addr) -> (row | None, ok)，在 worker 线程里执行
+      - 完成即推进 Meter、写 checkpoint（run_items）；on_done(addr, row, ok, meter) 供调用方打日志
+      - sink(row) 严格按 addrs 顺序回调：乱序完成的结果先缓存，前面的都好了再放出，输出可复现
+      - run_id 里已是 OK 的地址直接复用结果，不再请求 RPC（断点续跑）
+    返回按 addrs 顺序排列的非空行。
+    """
+    prev = {a: (st, res) for a, st, res, _, _ in load_run_items(run_id)} if run_id else {}
+    results: List[Any] = [None] * len(addrs)
+    ready = [False] * len(addrs)
+    nxt = [0]
+    pending = []
+    for i, a in enumerate(addrs):
+        st, res = prev.get(a, (None, None))
+        if st == "OK":
+            results[i] = res; ready[i] = True
+        else:
+            pending.append((i, a))
+    if run_id and len(pending) < len(addrs):
+        _log(f"[RESUME] run={run_id} reuse={len(addrs)-len(pending)} todo={len(pending)}")
+
+    def _flush():
+        while nxt[0] < len(addrs) and ready[nxt[0]]:
+            if results[nxt[0]] is not None and sink: sink(results[nxt[0]])
+            nxt[0] += 1
+    _flush()
+
+    m = Meter(total=len(pending), tick=max(1, len(pending)//20 or 1))
+
+    def _done(item, res, err):
+        i, a = item
+        row, ok = res if res is not None else (None, False)
+        results[i] = row; ready[i] = True
+        m.step(ok=ok)
+        if run_id: record_item(run_id, a, "OK" if ok else "ERR", row)
+        if on_done: on_done(a, row, ok, m)
+        _flush()
+
+    fan_out(lambda item: one(item[1]), pending, workers=workers, on_done=_done)
+    return [r for r in results if r is not None]
+
 def score_white_for_mint(rpc: SolRpc, mint: str, white_addrs: List[str],
                          price_url: str=None, price_key: str=None, t0: int=None,
-                         decimals: int=9, sleep_ms: int=0) -> List[Dict[str,Any]]:
-    out=[]
-    if t0 is None:
+                         decimals: int=9, workers: int=1,
+                         run_id: str=None, sink=None, sync: bool=True, pnl: str=None) -> List[Dict[str,Any]]:
+    # sync=False：不同步交易，只用 owner_rounds/owner_deltas 缓存重算（bucket 不参与打分，也不再估 T0）
+    # pnl：sol|usd，默认 SCORE_PNL
+    if t0 is None and sync:
         try: t0 = estimate_t0(rpc, mint, sample_holders=8)
         except Exception: t0 = None
-    m = Meter(total=len(white_addrs), tick=max(1, len(white_addrs)//20 or 1))
-    for addr in white_addrs:
-        ok=True
+
+    pnl = pnl or PNL_SOURCE
+
+    def _one(addr):
         try:
-            trips = rounds_with_usd(rpc, addr, mint, t0, price_url, price_key, decimals=decimals)
-            met = calc_metrics(trips)
-            out.append({"addr": addr, **met})
-        except KeyboardInterrupt:
-            break
+            trips = rounds_with_usd(rpc, addr, mint, t0, price_url, price_key, decimals=decimals, sync=sync,
+                                    prices=pnl == "usd")
+            return {"addr": addr, **calc_metrics(trips, PNL_FIELDS[pnl])}, True
         except Exception:
-            ok=False
-            out.append({"addr": addr, "rounds":0,"wins":0,"win_rate":0.0,"total_pnl":0.0,"avg_pnl":0.0,"median_hold_s":0,"max_drawdown":0.0})
-        finally:
-            if sleep_ms>0: time.sleep(sleep_ms/1000.0)
-            m.step(ok=ok)
-    return out
+            return {"addr": addr, **EMPTY_METRICS}, False
+
+    return _score_many(white_addrs, _one, workers=workers, run_id=run_id, sink=sink)
 
 def _batch(iterable, n=100):
     buf=[]
@@ -103,39 +167,35 @@ def _batch_sol_balances(rpc: SolRpc, addrs: List[str]) -> dict:
 
 def score_watch_for_mint(rpc: SolRpc, mint: str, watch_addrs: List[str],
                          price_url: str=None, price_key: str=None, t0: int=None,
-                         decimals: int=9, sleep_ms: int=0, require_activity: bool=False) -> List[Dict[str,Any]]:
-    out=[]
-    if t0 is None:
+                         decimals: int=9, require_activity: bool=False,
+                         workers: int=1, run_id: str=None, sink=None, sync: bool=True, pnl: str=None) -> List[Dict[str,Any]]:
+    if t0 is None and sync:
         try: t0 = estimate_t0(rpc, mint, sample_holders=8)
         except Exception: t0 = None
 
     # 先批量拿余额，RPC 从 N 次 → N/100 次
     sol_map = _batch_sol_balances(rpc, watch_addrs)
 
-    total=len(watch_addrs)
-    m = Meter(total=total, tick=max(1, total//20 or 1))
-    for i, addr in enumerate(watch_addrs, 1):
+    pnl = pnl or PNL_SOURCE
+
+    def _one(addr):
         ok=True
-        sol_bal = float(sol_map.get(addr, 0.0))
-        trips=[]; met={}
         try:
-            trips = rounds_with_usd(rpc, addr, mint, t0, price_url, price_key, decimals=decimals)
-            met = calc_metrics(trips)
-        except KeyboardInterrupt:
-            break
+            trips = rounds_with_usd(rpc, addr, mint, t0, price_url, price_key, decimals=decimals, sync=sync,
+                                    prices=pnl == "usd")
+            met = calc_metrics(trips, PNL_FIELDS[pnl])
         except Exception:
             ok=False
-            met = {"rounds":0,"wins":0,"win_rate":0.0,"total_pnl":0.0,"avg_pnl":0.0,"median_hold_s":0,"max_drawdown":0.0}
+            met = dict(EMPTY_METRICS)
+        if require_activity and met.get("rounds",0) < 1:
+            return None, ok
+        return {"addr": addr, "sol_balance": float(sol_map.get(addr, 0.0)), **met}, ok
 
-        if (not require_activity) or (met.get("rounds",0) >= 1):
-            row={"addr": addr, "sol_balance": sol_bal, **met}
-            out.append(row)
-            if (i % 5)==0 or i==total:
-                _log(f"[WATCH] {i}/{total} addr={addr[:8]}… sol={sol_bal:.3f} rounds={row['rounds']} win={row['win_rate']:.2f} pnl={row['total_pnl']:.2f}")
+    def _done(addr, row, ok, m):
+        if row is not None and ((m.done % 5)==0 or m.done==m.total):
+            _log(f"[WATCH] {m.done}/{m.total} addr={addr[:8]}… sol={row['sol_balance']:.3f} rounds={row['rounds']} win={row['win_rate']:.2f} pnl={row['total_pnl']:.2f}")
 
-        if sleep_ms>0: time.sleep(sleep_ms/1000.0)
-        m.step(ok=ok)
-    return out
+    return _score_many(watch_addrs, _one, workers=workers, run_id=run_id, sink=sink, on_done=_done)
 
 def filter_and_sort(rows: List[Dict[str,Any]], min_rounds:int=3, pos_expect:bool=False, sort_by:str="white") -> List[Dict[str,Any]]:
     rows = [r for r in rows if int(r.get("rounds",0)) >= min_rounds]
@@ -150,10 +210,9 @@ def filter_and_sort(rows: List[Dict[str,Any]], min_rounds:int=3, pos_expect:bool
     return rows
 
 def export_csv(rows: List[Dict[str,Any]], path: str):
-    base = ["addr","sol_balance","rounds","wins","win_rate","total_pnl","avg_pnl","median_hold_s","max_drawdown"]
     with open(path,"w",newline="") as f:
-        w=csv.DictWriter(f, fieldnames=base); w.writeheader()
-        for r in rows: w.writerow({k:r.get(k) for k in base})
+        w=csv.DictWriter(f, fieldnames=SCORE_FIELDS); w.writeheader()
+        for r in rows: w.writerow({k:r.get(k) for k in SCORE_FIELDS})
 
 def export_txt_addrs(rows: List[Dict[str,Any]], path: str, topk:int):
     with open(path,"w") as f:
@@ -1,33 +1,43 @@
-import os, glob, csv
+# app/select.py
+# 高胜率筛选：打分结果从 scored 表按条件查（过滤/排序在 SQL 里走索引完成），也兼容显式给定的旧 CSV
+import os, csv, heapq
 from typing import List, Dict, Any, Optional
+from .db import scored_runs, query_scored
 
-def _latest(pattern: str) -> Optional[str]:
-    files = glob.glob(pattern)
-    if not files: return None
-    files.sort(key=lambda p: os.path.getmtime(p), reverse=True)
-    return files[0]
+def _key(r: Dict[str,Any]):
+    # 与 query_scored 的 ORDER BY 相同，用于合并多个 run 的有序结果
+    return (-r["win_rate"], -r["rounds"], -r["avg_pnl"], -(r["sol_balance"] or 0.0))
 
-def load_scored(sources: List[str], explicit_files: List[str]=None) -> List[Dict[str,Any]]:
-    rows=[]; files=[]
+def load_scored(sources: List[str], explicit_files: List[str]=None, mint: str=None, all_runs: bool=False,
+                dedupe: bool=False, limit: int=None, **filters) -> List[Dict[str,Any]]:
+    """
+    打分结果行（带 _source）：
+      - explicit_files：读这些 CSV（旧流程的导出文件），不做过滤排序
+      - 否则查 scored 表：每个 source 取该 mint（可为前缀/None）最近一次打分（all_runs=True 为全部历史），
+        filters（min_rounds/min_win_rate/min_avg_pnl/max_drawdown/min_sol/max_sol/null_sol，见 db.query_scored）在 SQL 里过滤，
+        结果按 filter_and_sort 的顺序排好；dedupe=True 时同一地址只留一行：后列的 source 优先、同 source 新的优先（与旧版按文件覆盖相同）
+    """
     if explicit_files:
-        files = explicit_files
-    else:
-        if "white" in sources:
-            f=_latest("data/exports/white_scored_*.csv")
-            if f: files.append(f)
-        if "watch" in sources:
-            f=_latest("data/exports/watch_scored_*.csv")
-            if f: files.append(f)
-    for path in files:
-        try:
-            with open(path, newline="") as f:
-                r=csv.DictReader(f)
-                for row in r:
-                    row["_source"]=os.path.basename(path).split("_")[0]  # white / watch
-                    rows.append(row)
-        except Exception:
-            continue
-    return rows
+        rows=[]
+        for path in explicit_files:
+            try:
+                with open(path, newline="") as f:
+                    for row in csv.DictReader(f):
+                        row["_source"]=os.path.basename(path).split("_")[0]  # white / watch
+                        rows.append(row)
+            except Exception:
+                continue
+        return rows
+    runs = scored_runs(mint, sources, all_runs=all_runs)
+    prio = [r[0] for r in sorted(runs, key=lambda r: sources.index(r[1]), reverse=True)]  # 覆盖优先级（排序稳定）
+    streams = []
+    for run_id, src, _ in runs:
+        ahead = prio[:prio.index(run_id)] if dedupe else []
+        rows = query_scored(run_id, exclude_runs=ahead, limit=limit, **filters)
+        for r in rows: r["_source"] = src
+        streams.append(rows)
+    out = list(heapq.merge(*streams, key=_key)) if len(streams) > 1 else (streams[0] if streams else [])
+    return out[:limit] if limit else out
 
 def _f(x, key, default=0.0):
     try: return float(x.get(key, default))
@@ -1,29 +1,172 @@
-import base64, base58
-from typing import List, Dict, Any
+import os, re, json, time, random, binascii, base58
+from array import array
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Callable, Optional
 from .rpc import SolRpc, TOKEN_PROGRAM_ID
+from .jsonrpc import RpcError
+
+# dataSlice 只取 owner(32) + amount(8)；getProgramAccounts 响应流式扫描，不整包 json.loads
+SLICE_LEN = 40
+CHUNK = 1 << 16
+_DATA_RE = re.compile(rb'"data"\s*:\s*\[\s*"([A-Za-z0-9+/=]*)"')
+_CARRY_MAX = 4096   # 一条 "data":["<56 个 base64 字符>" 远小于这个长度
+_HEAD_MAX = 1 << 16
+
+def _env_on(name: str, default: str = "0") -> bool:
+    return (os.environ.get(name, default) or default).strip().lower() in ("1", "true", "yes", "on")
+
+# 大 mint 分片枚举：按 owner 前缀（memcmp offset 32）切片并发扫描
+HOLDER_SHARDS = _env_on("HOLDER_SHARDS")                                   # 1 = 不先试单次全量，直接分片
+SHARD_WORKERS = int(os.environ.get("HOLDER_SHARD_WORKERS", "8") or 8)
+SHARD_RETRIES = 3
+SHARD_DEPTH = 2                                                             # 前缀最多 2 字节（65536 片）
 
 def _to_pubkey(b: bytes) -> str:
     return base58.b58encode(b).decode()
 
-def list_token_accounts_by_mint_fast(rpc: SolRpc, mint: str) -> List[Dict[str, Any]]:
-    filters = [{"dataSize": 165}, {"memcmp": {"offset": 0, "bytes": mint}}]
-    cfg = {"encoding": "base64", "filters": filters, "dataSlice": {"offset": 32, "length": 40}}
-    res = rpc.get_program_accounts_raw(TOKEN_PROGRAM_ID, cfg) or []
-    out=[]
-    for it in res:
-        try:
-            data_b64 = it["account"]["data"][0]
-            raw = base64.b64decode(data_b64)
-            owner = _to_pubkey(raw[:32])
-            amount = int.from_bytes(raw[32:40], "little", signed=False)
-            out.append({"owner": owner, "amount": amount})
-        except Exception:
-            continue
+def _mint_filters(mint: str) -> list:
+    return [{"dataSize": 165}, {"memcmp": {"offset": 0, "bytes": mint}}]
+
+class TokenAccounts:
+    """
+    紧凑的 Token Account 列表：owner 原始 32 字节连续存放在一块预分配的 bytearray 里，amount 为 array('Q')。
+    owner 只在取用时才 base58；按下标/切片/迭代取到的仍是 {"owner", "amount"} 字典，兼容旧调用方。
+    """
+    __slots__ = ("owners", "amounts", "n")
+
+    def __init__(self, cap: int = 4096):
+        self.owners = bytearray(32 * max(1, cap))
+        self.amounts = array("Q")
+        self.n = 0
+
+    def add(self, raw) -> bool:
+        off = 32 * self.n
+        if off + 32 > len(self.owners):
+            self.owners.extend(bytes(len(self.owners)))  # 容量翻倍
+        self.owners[off:off + 32] = raw[:32]
+        self.amounts.append(int.from_bytes(raw[32:40], "little"))
+        self.n += 1
+        return True
+
+    def extend(self, other: "TokenAccounts"):
+        need = 32 * (self.n + other.n)
+        if need > len(self.owners):
+            self.owners.extend(bytes(max(need - len(self.owners), len(self.owners))))
+        self.owners[32 * self.n:need] = other.owners[:32 * other.n]
+        self.amounts.extend(other.amounts)
+        self.n += other.n
+
+    def owner_bytes(self, i: int) -> bytes:
+        return bytes(self.owners[32 * i:32 * i + 32])
+
+    def owner(self, i: int) -> str:
+        return _to_pubkey(self.owner_bytes(i))
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(self.n))]
+        if i < 0: i += self.n
+        if not 0 <= i < self.n: raise IndexError(i)
+        return {"owner": self.owner(i), "amount": self.amounts[i]}
+
+    def __iter__(self):
+        for i in range(self.n):
+            yield {"owner": self.owner(i), "amount": self.amounts[i]}
+
+def scan_accounts_stream(r, sink: Callable[[bytes], bool]) -> Optional[Any]:
+    """
+    增量扫描 getProgramAccounts(base64 + dataSlice) 的响应体：每遇到一条 "data":["<b64>"，解码后交给 sink(raw)；
+    sink 返回 False 即停止读取并关闭连接。一条账户都没扫到时返回解析后的 JSON（空结果或 error），否则返回 None。
+    """
+    head = bytearray()
+    carry = b""
+    seen = 0
+    try:
+        for chunk in r.iter_content(CHUNK):
+            if not chunk: continue
+            if len(head) < _HEAD_MAX:
+                head += chunk[:_HEAD_MAX - len(head)]
+            buf = carry + chunk if carry else chunk
+            end = 0
+            for m in _DATA_RE.finditer(buf):
+                end = m.end()
+                raw = binascii.a2b_base64(m.group(1))
+                if len(raw) < SLICE_LEN: continue
+                seen += 1
+                if not sink(raw): return None
+            # 上一个匹配之后、且靠近块尾的部分可能是半条，留到下一块拼接
+            carry = buf[max(end, len(buf) - _CARRY_MAX):]
+    finally:
+        r.close()
+    if seen:
+        return None
+    return json.loads(bytes(head) or b"null")
+
+def _stream_mint_accounts(rpc: SolRpc, mint: str, new_sink: Callable[[Any], Any], prefix: bytes = b"") -> Any:
+    # prefix 非空时只扫 owner 以这些字节开头的账户（分片用）
+    filters = _mint_filters(mint)
+    if prefix:
+        filters.append({"memcmp": {"offset": 32, "bytes": _to_pubkey(prefix)}})
+    cfg = {"encoding": "base64", "filters": filters, "dataSlice": {"offset": 32, "length": SLICE_LEN}}
+    def parse(r):
+        sink = new_sink(r)
+        j = scan_accounts_stream(r, sink.add)
+        return sink if j is None else j
+    out = rpc.stream_call("getProgramAccounts", [TOKEN_PROGRAM_ID, cfg], parse)
+    if isinstance(out, dict) and "error" in out:
+        raise RpcError(out["error"])
+    if isinstance(out, dict):
+        return new_sink(None)   # 空结果
+    return out
+
+def _accounts_cap(r) -> int:
+    # 按 Content-Length 预估条数一次性分配（每条账户约 150+ 字节 JSON）；分块传输时从 4096 起翻倍
+    try: return int(r.headers.get("Content-Length")) // 150 + 16
+    except (AttributeError, TypeError, ValueError): return 4096
+
+def scan_sharded(rpc: SolRpc, mint: str, new_sink: Callable[[Any], Any], merge: Callable[[Any], Any],
+                 workers: Optional[int] = None):
+    """
+    按 owner 首字节切 256 片并发扫描（每片一个 getProgramAccounts，mint + owner 前缀两个 memcmp）。
+    每片独立退避重试；重试用尽的片再按下一个字节细分为 256 片（最多 SHARD_DEPTH 字节），仍失败则抛出。
+    merge(sink) 在调用线程里逐片合并结果。
+    """
+    todo = [(bytes([b]), 0) for b in range(256)]
+    n = max(1, workers or SHARD_WORKERS)
+    with ThreadPoolExecutor(max_workers=n, thread_name_prefix="gpa-shard") as ex:
+        running = {}
+        while todo or running:
+            while todo and len(running) < n:
+                prefix, tries = todo.pop(0)
+                running[ex.submit(_stream_mint_accounts, rpc, mint, new_sink, prefix)] = (prefix, tries)
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for f in done:
+                prefix, tries = running.pop(f)
+                e = f.exception()
+                if e is None:
+                    merge(f.result())
+                elif tries < SHARD_RETRIES:
+                    time.sleep(random.uniform(0, 0.5 * (2 ** tries)))
+                    todo.append((prefix, tries + 1))
+                elif len(prefix) < SHARD_DEPTH:
+                    # 单片仍然过大/超时：再细分一层放回队首
+                    todo[:0] = [(prefix + bytes([b]), 0) for b in range(256)]
+                else:
+                    raise e
+
+def list_token_accounts_by_mint_fast(rpc: SolRpc, mint: str) -> TokenAccounts:
+    return _stream_mint_accounts(rpc, mint, lambda r: TokenAccounts(_accounts_cap(r)))
+
+def list_token_accounts_by_mint_sharded(rpc: SolRpc, mint: str, workers: Optional[int] = None) -> TokenAccounts:
+    out = TokenAccounts()
+    scan_sharded(rpc, mint, lambda r: TokenAccounts(_accounts_cap(r)), out.extend, workers)
     return out
 
 def list_token_accounts_by_mint_parsed(rpc: SolRpc, mint: str) -> List[Dict[str, Any]]:
-    filters = [{"dataSize": 165}, {"memcmp": {"offset": 0, "bytes": mint}}]
-    res = rpc.get_program_accounts(TOKEN_PROGRAM_ID, filters=filters) or []
+    res = rpc.get_program_accounts(TOKEN_PROGRAM_ID, filters=_mint_filters(mint)) or []
     out=[]
     for it in res:
         acct = it.get("account") or {}
@@ -35,22 +178,14 @@ def list_token_accounts_by_mint_parsed(rpc: SolRpc, mint: str) -> List[Dict[str,
             out.append({"owner": owner, "amount": amount})
     return out
 
-def list_token_accounts_by_mint(rpc: SolRpc, mint: str) -> List[Dict[str, Any]]:
+def list_token_accounts_by_mint(rpc: SolRpc, mint: str, sharded: Optional[bool] = None):
+    # 单次全量 → 失败（超时/响应过大）改分片 → 仍失败才退回 jsonParsed
+    if not (HOLDER_SHARDS if sharded is None else sharded):
+        try:
+            return list_token_accounts_by_mint_fast(rpc, mint)
+        except Exception:
+            pass
     try:
-        return list_token_accounts_by_mint_fast(rpc, mint)
+        return list_token_accounts_by_mint_sharded(rpc, mint)
     except Exception:
         return list_token_accounts_by_mint_parsed(rpc, mint)
-
-def recent_token_owners(rpc: SolRpc, mint: str, topn: int = 3000) -> List[str]:
-    tas = list_token_accounts_by_mint(rpc, mint)
-    owners, seen = [], set()
-    for it in tas:
-        if int(it.get("amount", 0)) <= 0:
-            continue
-        ow = it.get("owner")
-        if not ow or ow in seen:
-            continue
-        seen.add(ow); owners.append(ow)
-        if len(owners) >= topn:
-            break
-    return owners
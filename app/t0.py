@@ -1,65 +1,104 @@
 # 推断某 mint 的“上市起点” T0（秒级 Unix time）
-# 思路：取若干代表性地址的最早相关交易时间的最小值：
-#   - mint 自身签名（若有）
-#   - largest accounts 的第一条 ATA 交易时间
-#   - 随机若干当前持有者的第一条相关交易时间
-from typing import List, Optional
+# 思路：mint 账户的最早一笔签名就是创建/初始化交易：
+#   - 用 before 游标把 mint 的签名流一路翻到最旧（每页 1000 条，直接读 blockTime，不拉交易体）
+#   - 结果按 mint 存进 token_t0 表，之后所有命令直接复用；没翻到底时记下游标，下次接着往旧翻，
+#     期间返回的是与抽样估计取 min 的上界（会打日志）
+#   - 节点历史被裁剪、mint 查不到签名时，退回抽样：最大几个 Token Account + 若干持有者 ATA 的最早签名
+from typing import List, Optional, Tuple
 from .rpc import SolRpc
-from .solana_spl import list_token_accounts_by_mint
+from .holders import top_holders
+from .db import load_token_t0, save_token_t0
 import random
 
-def _sig_time(rpc: SolRpc, signature: str) -> Optional[int]:
-    tx = rpc.get_transaction(signature, maxv=0)
-    if not tx: return None
-    slot = tx.get("slot")
-    if slot is None: return None
-    t = rpc.get_block_time(slot)
+SIG_PAGE = 1000
+
+def _entry_time(rpc: SolRpc, e: dict) -> Optional[int]:
+    # blockTime 偶尔为空（很老的块）：按 slot 补一次 getBlockTime
+    t = e.get("blockTime")
+    if t is None and e.get("slot") is not None:
+        try: t = rpc.get_block_time(e["slot"])
+        except Exception: t = None
     return t
 
-def estimate_t0(rpc: SolRpc, mint: str, sample_holders: int = 15) -> Optional[int]:
-    # (A) mint 地址本身
-    t_candidates = []
+def oldest_signature(rpc: SolRpc, addr: str, before: Optional[str] = None,
+                     max_pages: int = 200) -> Tuple[Optional[dict], bool]:
+    """
+    从 before（默认最新）往旧翻 addr 的签名，返回 (最旧的一条, 是否已翻到底)。
+    翻满 max_pages 仍未到底时返回当前最旧的一条与 False，调用方可以把它当下一次的 before。
+    """
+    oldest = None
+    for _ in range(max_pages):
+        page = rpc.get_signatures_for_address(addr, limit=SIG_PAGE, before=before) or []
+        if page:
+            oldest = page[-1]
+            before = oldest.get("signature")
+        if len(page) < SIG_PAGE or not before:
+            return oldest, True
+    return oldest, False
+
+def _sampled_t0(rpc: SolRpc, mint: str, sample_holders: int) -> Optional[int]:
+    # 退路：若干 Token Account 各自最早一页签名里的最小 blockTime
+    atas: List[str] = []
     try:
-        sigs = rpc.get_signatures_for_address(mint, limit=20) or []
-        for s in sigs:
-            t = _sig_time(rpc, s["signature"])
-            if t: t_candidates.append(t)
+        la = (rpc.get_token_largest_accounts(mint) or {}).get("value") or []
+        atas += [it["address"] for it in la[:10] if it.get("address")]
     except Exception:
         pass
-
-    # (B) largest accounts（通常包含初期注入/团队仓）
     try:
-        la = rpc.get_token_largest_accounts(mint).get("value") or []
-        for it in la[:10]:
-            ata = it.get("address")
-            if not ata: continue
-            sigs = rpc.get_signatures_for_address(ata, limit=10) or []
-            for s in sigs:
-                t = _sig_time(rpc, s["signature"])
-                if t: t_candidates.append(t)
+        owners = top_holders(rpc, mint, topn=500)
+        for o in random.sample(owners, min(sample_holders, len(owners))):
+            res = rpc.get_token_accounts_by_owner(o, mint) or {}
+            atas += [it["pubkey"] for it in (res.get("value") or []) if it.get("pubkey")]
     except Exception:
         pass
+    ts = []
+    for ata in dict.fromkeys(atas):
+        try:
+            e, _ = oldest_signature(rpc, ata, max_pages=3)
+        except Exception:
+            continue
+        t = _entry_time(rpc, e) if e else None
+        if t: ts.append(t)
+    return min(ts) if ts else None
 
-    # (C) 当前持有者抽样
+def estimate_t0(rpc: SolRpc, mint: str, sample_holders: int = 15, max_pages: int = 200,
+                refresh: bool = False) -> Optional[int]:
+    """
+    mint 的 T0：先查 token_t0 缓存（已翻到底的直接返回），否则从上次的游标继续往旧翻签名。
+    翻到底时最旧那条签名的时间就是 T0；没翻到底只是“不晚于”的上界，第一次出现时与抽样估计取 min 一起存下，
+    之后每次接着翻、继续取 min，直到翻到底才以翻出的结果为准。refresh=True 忽略缓存重新计算。
+    """
+    cached = None if refresh else load_token_t0(mint)
+    if cached and cached[3]:
+        return cached[0]
+    before = cached[1] if cached else None
     try:
-        tas = list_token_accounts_by_mint(rpc, mint, limit=500)
-        owners = [a["owner"] for a in tas]
-        owners = random.sample(owners, min(sample_holders, len(owners)))
-        for o in owners:
-            # 拿 owner 的 ATA tx
-            res = rpc.get_token_accounts_by_owner(o, mint)
-            for it in (res.get("value") or []):
-                ata = it.get("pubkey")
-                sigs = rpc.get_signatures_for_address(ata, limit=10) or []
-                for s in sigs:
-                    t = _sig_time(rpc, s["signature"])
-                    if t: t_candidates.append(t)
+        e, complete = oldest_signature(rpc, mint, before=before, max_pages=max_pages)
     except Exception:
-        pass
-
-    if not t_candidates: return None
-    t0 = min(t_candidates)
-    return t0
+        e, complete = None, False
+    if e is None and complete and cached:
+        # 续翻的第一页就是空的：上次的游标已是最旧一条，它的时间即 T0（按 slot 补一次，补不到就沿用缓存）
+        t = None
+        if cached[2] is not None:
+            try: t = rpc.get_block_time(cached[2])
+            except Exception: t = None
+        t = t if t is not None else cached[0]
+        save_token_t0(mint, t, cached[1], cached[2], True)
+        return t
+    t = _entry_time(rpc, e) if e else None
+    if t is not None:
+        if not complete:
+            # 没翻到底：只是上界。已有缓存（里面已并入过抽样）就继续取 min，否则并入一次抽样估计
+            est = cached[0] if cached else _sampled_t0(rpc, mint, sample_holders)
+            t = min(x for x in (t, est) if x is not None)
+            print(f"[T0] {mint[:8]}… signature walk not finished after {max_pages} pages; "
+                  f"partial T0={t} (continues next time)", flush=True)
+        save_token_t0(mint, t, e.get("signature"), e.get("slot"), complete)
+        return t
+    if cached:
+        return cached[0]
+    # mint 上一条签名都拿不到（节点裁剪历史等）：抽样估计，不缓存
+    return _sampled_t0(rpc, mint, sample_holders)
 
 def time_bucket(ts: int, t0: int) -> str:
     if t0 is None or ts is None: return "unknown"
@@ -0,0 +1,122 @@
+# app/txcache.py
+# 已 finalized 的交易内容永不改变 → 按 signature 做内容寻址的本地持久缓存
+#   - 存储：data/txcache.sqlite（独立文件，不与 db.sqlite 抢锁），zlib 压缩 JSON
+#   - 淘汰：总字节超过上限时按最近访问时间（LRU）删到 90%
+#   - 离线：TX_CACHE_OFFLINE=1 只读缓存，未命中直接返回 None，不发网络请求
+import os, json, time, zlib, sqlite3, threading
+from typing import Any, Dict, List, Optional
+
+CACHE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "txcache.sqlite"))
+
+def _env_on(name: str, default: str = "0") -> bool:
+    return (os.environ.get(name, default) or default).strip().lower() in ("1", "true", "yes", "on")
+
+class TxCache:
+    def __init__(self, path: str = CACHE_PATH, max_mb: Optional[float] = None, offline: Optional[bool] = None):
+        self.path = path
+        self.max_bytes = int((max_mb if max_mb is not None else float(os.environ.get("TX_CACHE_MB", "1024") or 1024)) * 1024 * 1024)
+        self.offline = _env_on("TX_CACHE_OFFLINE") if offline is None else offline
+        self.hits = self.misses = self.puts = self.evicted = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._con = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        self._con.execute("""
+        CREATE TABLE IF NOT EXISTS tx (
+          sig   TEXT PRIMARY KEY,
+          body  BLOB NOT NULL,
+          size  INTEGER NOT NULL,
+          atime INTEGER NOT NULL
+        )""")
+        self._con.execute("CREATE INDEX IF NOT EXISTS idx_tx_atime ON tx(atime)")
+        self._bytes = int(self._con.execute("SELECT COALESCE(SUM(size),0) FROM tx").fetchone()[0])
+
+    def get_many(self, sigs: List[str]) -> Dict[str, dict]:
+        if not sigs: return {}
+        out: Dict[str, dict] = {}
+        now = int(time.time())
+        with self._lock:
+            for lo in range(0, len(sigs), 500):
+                part = sigs[lo:lo+500]
+                q = "SELECT sig, body FROM tx WHERE sig IN (%s)" % ",".join("?"*len(part))
+                for sig, body in self._con.execute(q, part):
+                    out[sig] = json.loads(zlib.decompress(body))
+            if out and not self.offline:
+                self._con.executemany("UPDATE tx SET atime=? WHERE sig=?", [(now, s) for s in out])
+            self.hits += len(out)
+            self.misses += len(set(sigs)) - len(out)
+        return out
+
+    def get(self, sig: str) -> Optional[dict]:
+        return self.get_many([sig]).get(sig)
+
+    def put_many(self, items: Dict[str, Any]):
+        # 只收非空结果（None = 未找到/未 finalized，不能缓存）
+        rows = []
+        now = int(time.time())
+        for sig, tx in items.items():
+            if not sig or not tx: continue
+            body = zlib.compress(json.dumps(tx, separators=(",", ":")).encode(), 6)
+            rows.append((sig, body, len(body), now))
+        if not rows or self.offline: return
+        with self._lock:
+            # 已存在的 sig 被 IGNORE 跳过：只累计真正写入的行，否则 _bytes 虚高导致提前淘汰
+            added = n = 0
+            self._con.execute("BEGIN")
+            for r in rows:
+                if self._con.execute("INSERT OR IGNORE INTO tx(sig, body, size, atime) VALUES(?,?,?,?)", r).rowcount > 0:
+                    added += r[2]; n += 1
+            self._con.execute("COMMIT")
+            self.puts += n
+            self._bytes += added
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def put(self, sig: str, tx: Any):
+        self.put_many({sig: tx})
+
+    def _evict(self):
+        # 调用方持锁；按 atime 从旧到新删，直到 90% 水位
+        target = int(self.max_bytes * 0.9)
+        while self._bytes > target:
+            rows = self._con.execute("SELECT sig, size FROM tx ORDER BY atime ASC LIMIT 1000").fetchall()
+            if not rows: self._bytes = 0; break
+            drop = []
+            for sig, size in rows:
+                drop.append((sig,)); self._bytes -= size
+                if self._bytes <= target: break
+            self._con.execute("BEGIN")
+            self._con.executemany("DELETE FROM tx WHERE sig=?", drop)
+            self._con.execute("COMMIT")
+            self.evicted += len(drop)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n = self._con.execute("SELECT COUNT(*) FROM tx").fetchone()[0]
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": (self.hits/total if total else 0.0),
+                "puts": self.puts, "evicted": self.evicted, "entries": n,
+                "mb": round(self._bytes/1024/1024, 2), "offline": self.offline}
+
+_shared: Optional[TxCache] = None
+_shared_lock = threading.Lock()
+
+def shared_tx_cache() -> Optional[TxCache]:
+    """
+    进程内共享实例；TX_CACHE=0 时关闭缓存（返回 None）。
+    """
+    global _shared
+    if not _env_on("TX_CACHE", "1"):
+        return None
+    with _shared_lock:
+        if _shared is None:
+            _shared = TxCache()
+        return _shared
+
+def fmt_stats(c: Optional[TxCache]) -> str:
+    if c is None: return "[cache] tx cache disabled"
+    s = c.stats()
+    return (f"[cache] tx hits={s['hits']} misses={s['misses']} hit_rate={s['hit_rate']:.1%} "
+            f"puts={s['puts']} evicted={s['evicted']} entries={s['entries']} size={s['mb']}MB"
+            + (" (offline)" if s["offline"] else ""))
@@ -1,9 +1,16 @@
 # app/txscan.py
-from typing import List, Tuple, Optional
+import os, time
+from bisect import bisect_left, bisect_right
+from typing import Generator, List, Tuple, Optional
 from .rpc import SolRpc
-from .db  import add_candidates
+from .db  import add_candidates, load_ata_marks, load_ata_scanned_at, save_owner_sync, load_owner_deltas, load_missing_legs, save_owner_legs
 
 SYSTEM_PROGRAM = "11111111111111111111111111111111"
+WSOL_MINT = "So11111111111111111111111111111111111111112"
+USDC_MINT = "EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1v"
+SIG_PAGE = 1000  # getSignaturesForAddress 单页上限
+# 已有高水位的 owner×mint 每隔这么多秒重新 getTokenAccountsByOwner 一次（补上后来新开的 Token Account）；0 = 不重查
+ATA_RESCAN_S = int(os.environ.get("ATA_RESCAN_S", "21600") or 0)
 
 def extract_owner_delta_for_mint(tx: dict, owner: str, mint: str) -> int:
     """
@@ -20,6 +27,108 @@ def extract_owner_delta_for_mint(tx: dict, owner: str, mint: str) -> int:
     a1 = post_map.get((owner, mint), 0)
     return a1 - a0
 
+def extract_owner_legs(tx: dict, owner: str, mint: str) -> Tuple[int, Optional[int], Optional[int]]:
+    """
+    同一笔交易里 owner 的三条腿：(token_delta, sol_delta, usdc_delta)，都是最小单位、post - pre
+      - sol_delta：owner 主账户 lamports 变化（已含手续费/租金）+ owner 名下 WSOL 账户的变化
+      - usdc_delta：owner 名下 USDC 账户的变化
+    交易缺 pre/postBalances（或缺 token 余额）时对应的腿为 None（未知，不能当 0）。
+    """
+    meta = tx.get("meta") or {}
+    pre_b, post_b = meta.get("preBalances"), meta.get("postBalances")
+    has_tok = meta.get("preTokenBalances") is not None and meta.get("postTokenBalances") is not None
+    token = extract_owner_delta_for_mint(tx, owner, mint)
+    sol = usdc = None
+    if has_tok:
+        usdc = extract_owner_delta_for_mint(tx, owner, USDC_MINT) if mint != USDC_MINT else 0
+        if pre_b is not None and post_b is not None:
+            keys = _account_keys(tx)
+            i = keys.index(owner) if owner in keys else -1
+            lam = (int(post_b[i]) - int(pre_b[i])) if 0 <= i < min(len(pre_b), len(post_b)) else 0
+            sol = lam + (extract_owner_delta_for_mint(tx, owner, WSOL_MINT) if mint != WSOL_MINT else 0)
+    return token, sol, usdc
+
+def _account_keys(tx: dict) -> List[str]:
+    # 静态 accountKeys + v0 交易的 ALT 加载地址（顺序与 accountIndex 对应）
+    msg = (tx.get("transaction") or {}).get("message") or {}
+    keys = [k if isinstance(k, str) else (k or {}).get("pubkey") for k in (msg.get("accountKeys") or [])]
+    la = (tx.get("meta") or {}).get("loadedAddresses") or {}
+    return keys + list(la.get("writable") or []) + list(la.get("readonly") or [])
+
+def extract_mint_deltas(tx: dict, mint: str, skip_accounts: Optional[set] = None) -> dict:
+    """
+    一笔交易里该 mint 的所有 owner 持仓变化 {owner: delta_raw}（extract_owner_delta_for_mint 的全量版）。
+    skip_accounts：要忽略的 Token Account（池子金库等），按 accountIndex 对应的地址匹配。
+    """
+    meta = tx.get("meta") or {}
+    keys = _account_keys(tx) if skip_accounts else []
+    out: dict = {}
+    for sign, arr in ((-1, meta.get("preTokenBalances") or []), (1, meta.get("postTokenBalances") or [])):
+        for b in arr:
+            if b.get("mint") != mint or not b.get("owner"):
+                continue
+            if skip_accounts:
+                i = b.get("accountIndex")
+                if isinstance(i, int) and i < len(keys) and keys[i] in skip_accounts:
+                    continue
+            amt = int((b.get("uiTokenAmount") or {}).get("amount") or "0")
+            out[b["owner"]] = out.get(b["owner"], 0) + sign * amt
+    return out
+
+def fetch_txs_timed(rpc: SolRpc, sigs: List[str]) -> List[Tuple[Optional[int], Optional[dict]]]:
+    """
+    批量拉交易并补齐时间：getTransaction 走 JSON-RPC 数组批量；
+    返回体自带 blockTime，缺失的再按 slot 批量 getBlockTime。
+    返回与 sigs 同序的 [(ts, tx)]，拉不到的为 (None, None)。
+    """
+    txs = rpc.get_transactions(sigs, maxv=0) if sigs else []
+    times = [tx.get("blockTime") if tx else None for tx in txs]
+    miss = [i for i, tx in enumerate(txs) if tx and times[i] is None and tx.get("slot") is not None]
+    if miss:
+        for i, t in zip(miss, rpc.get_block_times([txs[i]["slot"] for i in miss])):
+            times[i] = t
+    return list(zip(times, txs))
+
+def iter_signatures(rpc: SolRpc, addr: str, t_from: Optional[int] = None, t_to: Optional[int] = None,
+                    limit: Optional[int] = None, until: Optional[str] = None, before: Optional[str] = None,
+                    page: int = SIG_PAGE, max_pages: int = 50) -> Generator[dict, None, bool]:
+    """
+    用 before 游标从新到旧翻页，产出 blockTime ∈ [t_from, t_to] 的签名条目（新→旧）：
+      - 整页都比 t_to 新：只拿末尾签名当下一页游标，整页跳过（满页 1000 条跨得最快）
+      - 边界页：页内 blockTime 单调不增，二分切出窗口内那一段，不逐条判断
+      - 页内最旧已早于 t_from（越过 t0）立即停止，不再翻页
+    until 透传给 RPC（遇到该签名即止，用于增量同步）；before 为起始游标（默认从最新开始）；
+    limit 为最多产出条数。
+    未给任何时间边界时原样产出（含 blockTime 为空的条目）。
+    生成器的返回值（StopIteration.value）：True = 自然走完（越过 t_from / 遇到 until / 没有更旧的签名），
+    False = 被 limit 或 max_pages 截断、更旧处可能还有没产出的签名。
+    """
+    windowed = t_from is not None or t_to is not None
+    if limit and not windowed:
+        page = min(page, limit)
+    n = 0
+    for _ in range(max_pages):
+        arr = rpc.get_signatures_for_address(addr, limit=page, before=before, until=until) or []
+        if not arr:
+            return True
+        before = arr[-1].get("signature")
+        seq = [s for s in arr if s.get("blockTime") is not None] if windowed else arr
+        lo, hi = 0, len(seq)
+        if windowed:
+            neg = [-s["blockTime"] for s in seq]  # 递增，便于 bisect
+            if t_to is not None: lo = bisect_left(neg, -t_to)
+            if t_from is not None: hi = bisect_right(neg, -t_from)
+        for s in seq[lo:hi]:
+            yield s
+            n += 1
+            if limit and n >= limit:
+                return False
+        if t_from is not None and seq and seq[-1]["blockTime"] < t_from:
+            return True
+        if len(arr) < page or not before:
+            return True
+    return False
+
 def guess_atas_for_owner(rpc: SolRpc, owner: str, mint: str) -> List[str]:
     """
     用 getTokenAccountsByOwner(owner, mint) 猜测该 owner 的 ATA 列表（通常一个）
@@ -31,6 +140,84 @@ def guess_atas_for_owner(rpc: SolRpc, owner: str, mint: str) -> List[str]:
         if pubkey: out.append(pubkey)
     return out
 
+def _atas_to_sync(rpc: SolRpc, owner: str, mint: str, marks: dict) -> Tuple[List[str], Optional[List[str]]]:
+    # (要同步的 ATA, 这次重新发现到的 ATA 或 None)：首次必查；已有记录的超过 ATA_RESCAN_S 再查，查失败就只用已有的
+    if not marks:
+        found = guess_atas_for_owner(rpc, owner, mint)
+    elif ATA_RESCAN_S > 0 and time.time() - (load_ata_scanned_at(owner, mint) or 0) >= ATA_RESCAN_S:
+        try:
+            found = guess_atas_for_owner(rpc, owner, mint)
+        except Exception as e:
+            print(f"[sync][WARN] ATA rescan failed owner={owner[:8]}… mint={mint[:8]}…: {e}")
+            found = None
+    else:
+        found = None
+    return list(dict.fromkeys(list(marks) + (found or []))), found
+
+def sync_owner_deltas(rpc: SolRpc, owner: str, mint: str, max_txs: int = 600) -> List[Tuple[int,int]]:
+    """
+    增量同步 owner×mint 的逐笔持仓变化（连同同一交易里的 SOL/USDC 腿），返回最近 max_txs 笔 [(ts, delta)]（旧→新）：
+      - 已有高水位的 ATA：getSignaturesForAddress(until=last_sig) 只拉新签名；
+        无新活动的钱包 = 每个 ATA 一次 RPC，只在超过 ATA_RESCAN_S 时才再调用 getTokenAccountsByOwner
+      - 首次：guess_atas_for_owner + 最近 max_txs 条签名；查到的 ATA 都登记（没有签名的也登记，之后照样同步）
+    某个 ATA 有交易没拉到时不推进它的高水位，下次重试（已落库的笔数按签名去重）。
+    某个已有高水位的 ATA 新签名超过 max_txs 条（翻到上限还没走到 until）：只收最近 max_txs 条，比其中最旧一笔还旧的
+    本地记录删掉（否则中间缺的一段永远补不回来），日志里记一条缺口；首次同步超过上限只记一条“只取最近 max_txs 笔”。
+    """
+    marks = load_ata_marks(owner, mint)
+    atas, found = _atas_to_sync(rpc, owner, mint, marks)
+    if not atas:
+        return []
+    rows: List[Tuple] = []  # (sig, slot, ts, delta, sol_delta, usdc_delta)
+    new_marks = {a: (None, None) for a in (found or []) if a not in marks}
+    cut = None
+    for ata in atas:
+        last = (marks.get(ata) or (None, None))[0]
+        # 多要一条：拿满 max_txs+1 条说明 until 之前还有没拉到的签名
+        arr = [s for s in iter_signatures(rpc, ata, limit=max_txs + 1, until=last) if s.get("signature")]
+        truncated = len(arr) > max_txs
+        arr = arr[:max_txs]
+        if not arr:
+            continue
+        sigs = [s["signature"] for s in arr]
+        complete = True
+        n0 = len(rows)
+        for sig, (ts, tx) in zip(sigs, fetch_txs_timed(rpc, sigs)):
+            if not tx or ts is None:
+                complete = False; continue
+            rows.append((sig, tx.get("slot"), ts, *extract_owner_legs(tx, owner, mint)))
+        if complete:
+            new_marks[ata] = (arr[0]["signature"], arr[0].get("slot"))
+            if truncated and len(rows) > n0:
+                ts, slot = rows[-1][2], rows[-1][1]  # 该 ATA 拉到的最旧一笔
+                if last is None:
+                    # 首次同步：本地本来就没有更早的记录，只是历史只取最近 max_txs 笔
+                    print(f"[sync] owner={owner[:8]}… ata={ata[:8]}…: first sync capped at {max_txs} signatures (from ts={ts})")
+                else:
+                    if cut is None or (ts, slot or 0) > (cut[0], cut[1] or 0):
+                        cut = (ts, slot)
+                    print(f"[sync] gap owner={owner[:8]}… ata={ata[:8]}…: >{max_txs} new signatures, "
+                          f"local history before ts={ts} dropped")
+    if rows or new_marks or found is not None:
+        save_owner_sync(owner, mint, new_marks, rows, scanned_at=int(time.time()) if found is not None else None, cut=cut)
+    backfill_owner_legs(rpc, owner, mint, max_txs)
+    return load_owner_deltas(owner, mint, limit=max_txs)
+
+def backfill_owner_legs(rpc: SolRpc, owner: str, mint: str, max_txs: int = 600) -> int:
+    """
+    旧版本落库的行没有 SOL/USDC 腿（NULL）：只从本地交易缓存（tx_cache）里找回原交易补算，不发网络请求；
+    缓存里没有的保持 NULL（该回合的 SOL 盈亏记为未知）。每个签名只查一次（legs_tried），
+    只有真补上了腿才让回合整段重放。返回补上的行数。
+    """
+    cache = getattr(rpc, "tx_cache", None)
+    sigs = load_missing_legs(owner, mint, limit=max_txs) if cache is not None else []
+    if not sigs:
+        return 0
+    got = cache.get_many(sigs)
+    legs = [(sig, *extract_owner_legs(got[sig], owner, mint)[1:]) for sig in sigs if got.get(sig)]
+    legs = [x for x in legs if x[1] is not None or x[2] is not None]
+    return save_owner_legs(owner, mint, legs, tried=sigs)
+
 def replay_recent_for_owner(rpc: SolRpc, owner: str, mint: str, max_txs=400) -> Tuple[int,int]:
     """
     旧版“全量最近交易回放”：对该 owner 的 ATA 取签名后逐条 getTransaction 计算净变动
@@ -49,8 +236,7 @@ def replay_recent_for_owner(rpc: SolRpc, owner: str, mint: str, max_txs=400) ->
 
     net = 0
     first_buy_idx = -1
-    for idx, sig in enumerate(sigs):
-        tx = rpc.get_transaction(sig, maxv=0)
+    for idx, tx in enumerate(rpc.get_transactions(sigs, maxv=0)):
         if not tx: 
             continue
         d = extract_owner_delta_for_mint(tx, owner, mint)
@@ -62,8 +248,8 @@ def replay_recent_for_owner(rpc: SolRpc, owner: str, mint: str, max_txs=400) ->
 def replay_owner_windowed(rpc: SolRpc, owner: str, mint: str, t0: Optional[int], window_h: float = 2.0, max_sigs_per_ata: int = 600) -> Tuple[int,int]:
     """
     时间窗优化版回放：
-      先用 getSignaturesForAddress 返回的 blockTime 过滤在 [t0, t0+window] 的签名，
-      再仅对这些签名 getTransaction，显著减少 RPC。
+      先用 iter_signatures 按游标翻页，只取 blockTime 落在 [t0, t0+window] 的签名，
+      再仅对这些签名批量 getTransaction（JSON-RPC 数组），显著减少 RPC 往返。
     返回: (net_delta_raw_in_window, first_buy_idx_in_window or -1)
     """
     if t0 is None:
@@ -75,26 +261,19 @@ def replay_owner_windowed(rpc: SolRpc, owner: str, mint: str, t0: Optional[int],
 
     t1 = t0 + int(window_h * 3600)
 
-    # 收集所有 ATA 的签名 + blockTime
+    # 收集所有 ATA 在窗口内的签名 + blockTime（游标翻页：跳过窗后整页，越过 t0 即停）
     sig_items: List[Tuple[int, str]] = []  # (blockTime, signature)
     for ata in atas:
-        arr = rpc.get_signatures_for_address(ata, limit=max_sigs_per_ata) or []
-        for s in arr:
-            bt = s.get("blockTime")
-            sig = s.get("signature")
-            if bt is None or not sig:
-                continue
-            if bt < t0 or bt > t1:
-                continue  # 窗外直接丢弃——关键优化
-            sig_items.append((bt, sig))
+        for s in iter_signatures(rpc, ata, t_from=t0, t_to=t1, limit=max_sigs_per_ata):
+            if s.get("signature"):
+                sig_items.append((s["blockTime"], s["signature"]))
 
     # 按时间升序回放
     sig_items.sort(key=lambda x: x[0])
 
     net = 0
     first_buy_idx = -1
-    for idx, (_, sig) in enumerate(sig_items):
-        tx = rpc.get_transaction(sig, maxv=0)
+    for idx, tx in enumerate(rpc.get_transactions([sig for _, sig in sig_items], maxv=0)):
         if not tx:
             continue
         d = extract_owner_delta_for_mint(tx, owner, mint)
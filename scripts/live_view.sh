@@ -10,7 +10,7 @@ SELECT datetime(first_seen,'localtime') AS seen,
        COALESCE(status,'CANDIDATE') AS status,
        COALESCE(reason,'') AS reason
 FROM view_addresses
-ORDER BY status DESC, seen DESC
+ORDER BY first_seen DESC
 LIMIT 200;\""
 SH
 chmod +x scripts/live_view.sh
@@ -109,15 +109,12 @@ BAL_SLEEP_MS=int(os.environ.get("FINAL_BAL_SLEEP_MS","10"))
 # 1) 汇集候选地址
 cands=[]
 if CHAIN=="sol":
-    csvs=sorted(glob.glob(f"data/exports/*scored_{t6}_*.csv"))
-    for fp in csvs[-4:]:
-        try:
-            with open(fp,newline="") as f:
-                r=csv.DictReader(f)
-                for row in r:
-                    a=(row.get("addr") or row.get("address") or row.get("owner") or "").strip()
-                    if a: cands.append(a)
-        except: pass
+    # 最近一次 watch/white 打分结果（打分结果库 scored 表）
+    try:
+        from app.select import load_scored
+        cands += [r["addr"] for r in load_scored(["watch", "white"], mint=TOKEN)]
+    except Exception as e:
+        print(f"[final] scored store unavailable: {e}")
     hit_logs=sorted(glob.glob(f"logs/early_hits_{t6}_*.txt"))
     if hit_logs:
         with open(hit_logs[-1]) as f:
@@ -0,0 +1,40 @@
+# tests/test_db_plans.py
+# 热查询的执行计划：不允许不走索引的全表 SCAN，也不允许为 ORDER BY 建临时 B 树
+# SQL 来自 app/db.py 里调用处共用的常量/拼装函数，这里查的就是线上真正执行的语句
+import pytest
+from app import db
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "db.sqlite"))
+    yield
+    db.flush_writes()
+
+def test_schema_migrated(fresh_db):
+    with db.conn() as c:
+        assert c.execute("PRAGMA user_version;").fetchone()[0] == db.SCHEMA_VERSION
+
+@pytest.mark.parametrize("name", [q[0] for q in db.hot_queries()])
+def test_hot_query_uses_index(fresh_db, name):
+    plans = {n: (plan, ok) for n, plan, ok in db.explain_hot()}
+    plan, ok = plans[name]
+    for line in plan:
+        assert not (line.startswith("SCAN") and "INDEX" not in line), f"{name}: full scan: {line}"
+        assert "TEMP B-TREE FOR ORDER BY" not in line, f"{name}: sort: {line}"
+    assert ok
+
+def test_hot_query_call_sites_run(fresh_db):
+    # 调用处用的就是同一份 SQL：空库上跑一遍，确认语句本身可执行
+    assert db.fetch_candidates(10) == []
+    assert db.load_mint_deltas("x") == []
+    db.save_scored("run-1", "mintA", "white", [
+        {"addr": "a", "sol_balance": None, "rounds": 3, "wins": 2, "win_rate": 2 / 3, "total_pnl": 1.0,
+         "avg_pnl": 0.3, "median_hold_s": 60, "max_drawdown": -0.1},
+        {"addr": "b", "sol_balance": 5.0, "rounds": 4, "wins": 1, "win_rate": 0.25, "total_pnl": -1.0,
+         "avg_pnl": -0.25, "median_hold_s": 30, "max_drawdown": -0.5},
+    ], topk=1)
+    assert db.scored_runs("mint", ["white"]) == [("run-1", "white", 1)]
+    assert db.scored_top("run-1", 1) == ["a"]
+    assert [r["addr"] for r in db.query_scored("run-1", min_win_rate=0.5)] == ["a"]
+    assert [r["addr"] for r in db.query_scored("run-1", min_sol=1.0, null_sol=0.0)] == ["b"]
+    assert db.query_scored("run-1", exclude_runs=("run-1",)) == []
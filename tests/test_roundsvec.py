@@ -0,0 +1,88 @@
+# tests/test_roundsvec.py
+# 列式回合引擎与逐地址基准（segment_rounds → round_legs/round_usd → calc_metrics）逐项一致：
+# 随机持仓变化流（含零变化行上的超时平仓、收尾未平仓、空仓先卖、未知/币换币的 SOL 腿），sol/usd 两种口径，
+# numpy 向量化路径与纯 Python 路径都要逐位相等（含类型）
+import random
+import pytest
+from app import roundsvec
+from app.price import PriceSeries
+from app.rounds import segment_rounds, round_legs, round_usd, SOL_FEE_MAX
+from app.score import calc_metrics, PNL_FIELDS
+
+DECIMALS = 2
+SCALE = 10 ** DECIMALS
+
+def _reference(txs, timeout_s, prices, pnl):
+    trips = []
+    for r in segment_rounds(txs, None, timeout_s):
+        usd = round_usd(r, SCALE, prices)
+        trips.append({"hold_s": r["hold_s"], "pnl_sol": round_legs(r)[0], "pnl_usd": usd[2] if usd is not None else None})
+    return calc_metrics(trips, PNL_FIELDS[pnl])
+
+def _leg(rng):
+    r = rng.random()
+    if r < 0.1: return None, None                                        # 腿未知
+    if r < 0.15: return rng.choice([-SOL_FEE_MAX, SOL_FEE_MAX, -SOL_FEE_MAX - 1, SOL_FEE_MAX + 1]), 0  # 阈值边界
+    if r < 0.2: return rng.randint(-SOL_FEE_MAX, SOL_FEE_MAX), 0           # 只动了手续费：币换币
+    if r < 0.3: return rng.randint(-10**7, 10**7), rng.choice([-5 * 10**6, 3 * 10**6])  # USDC 计价
+    return rng.randint(-5 * 10**9, 5 * 10**9), rng.choice([0, None])
+
+def _streams(rng, n):
+    per = {}
+    for o in range(n):
+        t = rng.choice([0, 1000, 1_700_000_000])
+        for _ in range(rng.randint(0, rng.choice([3, 12, 50]))):
+            t += rng.choice([0, 1, 60, 3600, 40000, 90000])                # 大间隔 + 零变化行 → 超时平仓
+            r = rng.random()
+            d = 0 if r < 0.25 else (rng.choice([1, 5, 10, 7]) if r < 0.6 else -rng.choice([1, 5, 10, 3]))
+            per.setdefault(o, []).append((t, d) + _leg(rng))
+    # 各地址的行交错排列（地址内保持旧→新）
+    pools = {k: list(v) for k, v in per.items()}
+    rows = []
+    while pools:
+        k = rng.choice(list(pools))
+        rows.append((k,) + pools[k].pop(0))
+        if not pools[k]: del pools[k]
+    return per, rows
+
+PRICES = [
+    None,
+    PriceSeries("M", 60, [0, 120], [1.5, 0.25]),
+    PriceSeries("M", 60, [1200, 1500], [1.5, 0.25], lo=1140),          # lo 之前没价 → 回合盈亏未知
+    PriceSeries("M", 60, [], [], spot=2.0, live=1_700_000_000 + 200_000),
+]
+
+@pytest.fixture(params=["numpy", "python"])
+def engine(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(roundsvec, "np", None)
+    return request.param
+
+@pytest.mark.parametrize("pnl", ["sol", "usd"])
+def test_batch_metrics_matches_replay(engine, pnl):
+    rng = random.Random(f"{pnl}-{engine}")
+    for trial in range(150):
+        n = rng.randint(1, 30)
+        per, rows = _streams(rng, n)
+        timeout_s = rng.choice([3600, 86400])
+        prices = rng.choice(PRICES) if pnl == "usd" else None
+        ids, ts, deltas, sols, usdcs = (list(c) for c in zip(*rows)) if rows else ([], [], [], [], [])
+        got = roundsvec.batch_metrics(ids, ts, deltas, n, timeout_s=timeout_s, decimals=DECIMALS,
+                                      prices=prices, sols=sols, usdcs=usdcs, pnl=pnl)
+        for o in range(n):
+            exp = _reference(per.get(o, []), timeout_s, prices, pnl)
+            # repr 比较：类型与 -0.0/0.0 也要一致
+            assert {k: repr(v) for k, v in got[o].items()} == {k: repr(v) for k, v in exp.items()}, (trial, o, per.get(o))
+
+def test_timeout_and_open_rounds(engine):
+    # 买入后 2h 的零变化行触发超时平仓；之后再买不卖，收尾为未平仓回合
+    txs = [(1000, 10, -2 * 10**9, 0), (4600, 0, None, None), (5000, 5, -10**9, 0), (6000, 0, None, None)]
+    ids = [0] * len(txs)
+    ts, deltas, sols, usdcs = (list(c) for c in zip(*txs))
+    got = roundsvec.batch_metrics(ids, ts, deltas, 1, timeout_s=3600, decimals=DECIMALS, sols=sols, usdcs=usdcs, pnl="sol")
+    assert got[0] == _reference(txs, 3600, None, "sol")
+    # 超时回合持有 3600s、未平仓回合 1000s；两回合 SOL 腿都已知：-2 与 -1 SOL
+    assert got[0]["rounds"] == 2 and got[0]["median_hold_s"] == 2300
+    assert got[0]["wins"] == 0 and got[0]["total_pnl"] == -3.0